@@ -1,31 +1,52 @@
 from fastapi import FastAPI, File, UploadFile, HTTPException, WebSocket, WebSocketDisconnect, Form
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 import os
 import traceback
-import base64
 from contextlib import asynccontextmanager
 import uuid
 
 from vision_manager import VisionManager
+from worker_pool import WorkerPool
+from message_handler import parse_websocket_message, handle_websocket_message
+from metrics import metrics, MeteredWebSocket, render_prometheus
 from dotenv import load_dotenv
 
 load_dotenv()
 
 vision_manager = None
 
+# With VISION_WORKERS > 0, sessions run in that many worker processes instead of this one
+worker_pool = None
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Handle startup and shutdown events"""
-    global vision_manager
+    global vision_manager, worker_pool
     
     # Startup
     print("Starting up FastAPI application...")
-    vision_manager = VisionManager()
+    num_workers = int(os.getenv('VISION_WORKERS', '0'))
+    if num_workers > 0:
+        # VISION_PREFORK=1 loads the models once here and forks the workers with them
+        worker_pool = WorkerPool(
+            num_workers,
+            prefork=os.getenv('VISION_PREFORK', '0') == '1',
+            share_memory=os.getenv('VISION_SHARE_MEMORY', '0') == '1'
+        )
+        await worker_pool.start()
+        await worker_pool.wait_until_ready()
+    else:
+        vision_manager = VisionManager()
     yield
     
     # Shutdown
     print("Shutting down FastAPI application...")
+    if worker_pool is not None:
+        await worker_pool.shutdown()
+    else:
+        vision_manager.shutdown()
 
 # Create FastAPI app
 app = FastAPI(
@@ -82,6 +103,19 @@ async def get_version():
         }
     }
 
+@app.get("/api/metrics")
+async def get_metrics():
+    """Prometheus metrics for sessions, step throughput and latency"""
+    return PlainTextResponse(render_prometheus(vision_manager, worker_pool), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/workers")
+async def get_workers():
+    """Health and load of the vision worker processes"""
+    return {
+        "success": True,
+        "data": worker_pool.status() if worker_pool is not None else []
+    }
+
 # @app.post("/api/set_source_image/")
 # async def set_source_image(
 #     session_id: str = Form(...),
@@ -110,14 +144,20 @@ async def websocket_endpoint(websocket: WebSocket):
     """WebSocket endpoint for real-time communication"""
     print("Got websocket connection")
     await websocket.accept()
+
+    # Count bytes sent to this client for /api/metrics
+    websocket = MeteredWebSocket(websocket)
     
     # Generate ranodm session ID
     session_id = str(uuid.uuid4())
     print(f'Client connected: {session_id}')
     
     try:
-        # Add connection to vision manager
-        vision_manager.add_connection(session_id, websocket)
+        # Add connection to vision manager, or pin it to a worker process
+        if worker_pool is not None:
+            await worker_pool.open_session(session_id, websocket)
+        else:
+            vision_manager.add_connection(session_id, websocket)
         
         # Send connection confirmation
         await websocket.send_json({
@@ -128,8 +168,22 @@ async def websocket_endpoint(websocket: WebSocket):
         # Handle incoming messages
         while True:
             try:
-                data = await websocket.receive_json()
-                await handle_websocket_message(session_id, data, websocket)
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    raise WebSocketDisconnect(message.get("code", 1000))
+
+                if message.get("bytes") is not None:
+                    metrics.increment('websocket_bytes_in', len(message["bytes"]))
+                else:
+                    metrics.increment('websocket_bytes_in', len(message["text"].encode('utf-8')))
+
+                # Worker processes decode and handle the message themselves
+                if worker_pool is not None:
+                    await worker_pool.relay(session_id, message)
+                    continue
+
+                data = parse_websocket_message(message.get("text"), message.get("bytes"))
+                await handle_websocket_message(vision_manager, session_id, data, websocket)
             except WebSocketDisconnect as e:
                 raise WebSocketDisconnect
             except Exception as e:
@@ -146,73 +200,10 @@ async def websocket_endpoint(websocket: WebSocket):
         print(f'Traceback:\n{traceback.format_exc()}')
     finally:
         # Clean up
-        await vision_manager.remove_connection(session_id)
-
-async def handle_websocket_message(session_id: str, data: dict, websocket: WebSocket):
-    """Handle different types of WebSocket messages"""
-    message_type = data.get("type", "")
-    print(f'Received message type: {message_type}')
-    
-    try:
-        if message_type == "start_session":
-            print(f'Starting recognition for session {session_id}')
-            await vision_manager.start_session(session_id)
-            
-        elif message_type == "stop_session":
-            print(f'Stopping recognition for session {session_id}')
-            await vision_manager.stop_session(session_id)
-            
-        elif message_type == "audio_chunk":
-            # Handle incoming audio chunks
-            audio_data = data.get("audio", "")
-            if isinstance(audio_data, str):
-                audio_data = base64.b64decode(audio_data)
-            await vision_manager.process_audio_chunk(session_id, audio_data)
-            
-        elif message_type == "step":
-            await vision_manager.step(session_id, data)
-
-        elif message_type == "set_source_image":
-            source_image = data.get("image", None)
-            if not source_image:
-                raise ValueError("Source image is required")
-            
-            # Decode base64 image
-            source_image_bytes = base64.b64decode(source_image)
-            
-            print(f'Setting source image for session {session_id}')
-            await vision_manager.set_source_image(session_id, source_image_bytes)
-
-        elif message_type == "send_screen_info":
-            print(f'Sending screen info for session {session_id}')
-            screen_info = await vision_manager.get_screen_info(session_id)
-            await websocket.send_json({
-                "type": "screen_info_response",
-                "data": screen_info
-            })
-
-        elif message_type == "track_element":
-            element_index = data.get("element_index")
-            if element_index is None:
-                raise ValueError("Element index is required for tracking")
-            
-            print(f'Tracking element at index {element_index} for session {session_id}')
-            await vision_manager.track_element(session_id, element_index)
-            
-        elif message_type == "clear_tracked_element":
-            print(f'Clearing element tracking for session {session_id}')
-            await vision_manager.clear_tracked_element(session_id)
-
+        if worker_pool is not None:
+            await worker_pool.close_session(session_id)
         else:
-            print(f'Unhandled message type {message_type} for session {session_id}')
-            
-    except Exception as e:
-        print(f'Error handling message type {message_type}: {e}')
-        print(f'Traceback:\n{traceback.format_exc()}')
-        await websocket.send_json({
-            "type": "error",
-            "message": str(e)
-        })
+            await vision_manager.remove_connection(session_id)
 
 # Mount static files
 app.mount("/", StaticFiles(directory="dist", html = True), name="dist")
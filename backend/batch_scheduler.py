@@ -0,0 +1,105 @@
+import os
+import threading
+
+import numpy as np
+import torch
+
+from concurrent.futures import Future
+
+class _Request:
+    __slots__ = ('image', 'key', 'future')
+
+    def __init__(self, image, key):
+        self.image = image
+        self.key = key
+        self.future = Future()
+
+class XFeatBatchScheduler:
+    """
+    Micro-batches XFeat feature extraction across sessions when extraction is saturated.
+
+    Callers are step workers and extraction runs on their own threads. While fewer than
+    max_concurrent extractions are running, a caller runs its image at once, so a lone session
+    never waits and sessions still spread over the cores. Beyond that, callers queue; when an
+    extraction finishes, the oldest queued caller takes every queued image with the same shape
+    and top_k and runs them as one batched detectAndCompute, handing each caller its output.
+    """
+
+    def __init__(self, xfeat, max_batch_size=16, max_concurrent=None):
+        """
+        Args:
+            xfeat (XFeat): Extractor the batches run on.
+            max_batch_size (int): Most images in one batched forward.
+            max_concurrent (int): Extractions that run side by side before callers queue, by
+                                  default as many as the cores fit at the step workers' torch threads.
+        """
+        self.xfeat = xfeat
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_concurrent = max_concurrent
+
+        self.condition = threading.Condition()
+        # Queued requests, oldest first
+        self.pending = []
+        self.running = 0
+
+        self.batches_run = 0
+        self.images_processed = 0
+
+    def detect_and_compute(self, image, top_k):
+        """
+        Extract XFeat features for a single (H, W, C) image, batched with queued callers.
+
+        Returns:
+            dict: 'keypoints', 'scores' and 'descriptors' for the image.
+        """
+        request = _Request(image, (image.shape, top_k))
+
+        with self.condition:
+            self.pending.append(request)
+            # A request taken into another caller's batch leaves pending, its caller waits for the result
+            while not request.future.done() and \
+                    (self.running >= self.concurrency or not self.pending or self.pending[0] is not request):
+                self.condition.wait()
+
+            if request.future.done():
+                return request.future.result()
+
+            # Only images with the same shape and top_k can be stacked into one tensor
+            batch = [queued for queued in self.pending if queued.key == request.key][:self.max_batch_size]
+            for queued in batch:
+                self.pending.remove(queued)
+            self.running += 1
+
+        try:
+            self.__run_batch(batch, top_k)
+        finally:
+            with self.condition:
+                self.running -= 1
+                self.batches_run += 1
+                self.images_processed += len(batch)
+                self.condition.notify_all()
+
+        return request.future.result()
+
+    @property
+    def concurrency(self):
+        # Read per call, the step engine sets the torch threads after this is created
+        if self.max_concurrent is not None:
+            return self.max_concurrent
+        return max(1, (os.cpu_count() or 1) // torch.get_num_threads())
+
+    def __run_batch(self, requests, top_k):
+        try:
+            if len(requests) == 1:
+                outputs = self.xfeat.detectAndCompute(requests[0].image, top_k=top_k)
+            else:
+                images = np.stack([request.image for request in requests])
+                batch = torch.from_numpy(images).permute(0, 3, 1, 2)
+                outputs = self.xfeat.detectAndCompute(batch, top_k=top_k)
+        except Exception as e:
+            for request in requests:
+                request.future.set_exception(e)
+            return
+
+        for request, output in zip(requests, outputs):
+            request.future.set_result(output)
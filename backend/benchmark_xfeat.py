@@ -0,0 +1,172 @@
+import argparse
+import os
+import threading
+import time
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from modules.xfeat import XFeat
+
+from batch_scheduler import XFeatBatchScheduler
+
+# Throughput benchmarks of the XFeat extraction paths the step pipeline uses.
+#
+#   python benchmark_xfeat.py batching --sessions 4
+#   python benchmark_xfeat.py detect
+#
+# Without --weights the network is randomly initialised, which costs the same per frame.
+
+def load_xfeat(weights):
+    return XFeat(weights=weights, top_k=4096)
+
+def random_frames(count, width, height):
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 256, (height, width, 3), dtype=np.uint8) for _ in range(count)]
+
+def run_sessions(extract, frames, sessions, duration):
+    """
+    Extract frames on one thread per session for duration seconds, like concurrent step workers.
+
+    Returns:
+        tuple: (frames per second over all sessions, mean latency in milliseconds)
+    """
+    latencies = [[] for _ in range(sessions)]
+    stop = time.perf_counter() + duration
+
+    def session(index):
+        frame_index = index
+        while time.perf_counter() < stop:
+            start = time.perf_counter()
+            extract(frames[frame_index % len(frames)])
+            latencies[index].append(time.perf_counter() - start)
+            frame_index += 1
+
+    threads = [threading.Thread(target=session, args=(index,)) for index in range(sessions)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    samples = [latency for session_latencies in latencies for latency in session_latencies]
+    return len(samples) / elapsed, 1000 * float(np.mean(samples))
+
+def benchmark_batching(args):
+    xfeat = load_xfeat(args.weights)
+    frames = random_frames(8, args.width, args.height)
+
+    # Same thread split as the step engine with one step worker per session
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // args.sessions))
+
+    # Warm up both paths
+    xfeat.detectAndCompute(frames[0], top_k=args.top_k)
+    xfeat.detectAndCompute(torch.from_numpy(np.stack(frames[:2])).permute(0, 3, 1, 2), top_k=args.top_k)
+
+    print(f"{args.sessions} sessions, {args.width}x{args.height}, top_k {args.top_k}, "
+          f"{os.cpu_count()} cores, {torch.get_num_threads()} torch threads per worker")
+
+    fps, latency = run_sessions(lambda frame: xfeat.detectAndCompute(frame, top_k=args.top_k)[0],
+                                frames, args.sessions, args.duration)
+    print(f"  unbatched:            {fps:7.1f} frames/s, {latency:7.1f} ms mean latency")
+
+    for max_concurrent in args.max_concurrent:
+        scheduler = XFeatBatchScheduler(xfeat, max_batch_size=args.max_batch_size, max_concurrent=max_concurrent)
+        fps, latency = run_sessions(lambda frame: scheduler.detect_and_compute(frame, args.top_k),
+                                    frames, args.sessions, args.duration)
+        batch_size = scheduler.images_processed / max(1, scheduler.batches_run)
+        print(f"  scheduler (max_concurrent {max_concurrent or 'auto'}): {fps:7.1f} frames/s, "
+              f"{latency:7.1f} ms mean latency, {batch_size:.2f} images per batch")
+
+def time_ms(function, duration):
+    """
+    Mean milliseconds per call of function, called repeatedly for duration seconds after a warmup call.
+    """
+    function()
+    calls = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        function()
+        calls += 1
+    return 1000 * (time.perf_counter() - start) / max(1, calls)
+
+def nms_mask_max_pool(heatmap, threshold, kernel_size=5):
+    # Local maxima with max_pool2d, as before XFeat.nms_mask
+    local_max = F.max_pool2d(heatmap, kernel_size=kernel_size, stride=1, padding=kernel_size // 2)
+    return (heatmap == local_max) & (heatmap > threshold)
+
+def select_keypoints_per_pixel(xfeat, heatmap, reliability, top_k, threshold):
+    # Reliability score interpolated at every pixel and masked to the NMS maxima, as before XFeat.select_keypoints
+    B, _, H, W = heatmap.shape
+    mask = xfeat.nms_mask(heatmap, threshold=threshold).view(B, -1)
+    grid = xfeat.create_xy(H, W, heatmap.device).float()[None].expand(B, -1, -1)
+    scores = (xfeat._nearest(heatmap, grid, H, W) * xfeat._bilinear(reliability, grid, H, W)).squeeze(-1)
+    scores = torch.where(mask, scores, torch.full_like(scores, -1))
+    scores[:, 0] = -1
+    scores, idxs = torch.topk(scores, min(top_k, scores.shape[-1]), dim=-1)
+    return grid[0][idxs], scores
+
+@torch.inference_mode()
+def benchmark_detect(args):
+    xfeat = load_xfeat(args.weights)
+    torch.set_num_threads(args.threads)
+
+    # Keypoint logits with a realistic number of NMS candidates, a randomly initialised
+    # network yields almost none above the detection threshold
+    _H, _W = (args.height // 32) * 32, (args.width // 32) * 32
+    generator = torch.Generator().manual_seed(0)
+    logits = torch.randn(1, 65, _H // 8, _W // 8, generator=generator) * args.logit_scale
+    reliability = torch.rand(1, 1, _H // 8, _W // 8, generator=generator)
+    heatmap = xfeat.get_kpts_heatmap(logits)
+    threshold = xfeat.detection_threshold
+    candidates = int(xfeat.nms_mask(heatmap, threshold=threshold).sum())
+
+    print(f"{args.width}x{args.height} ({_W}x{_H} heatmap, {_W * _H} pixels), {candidates} NMS candidates, "
+          f"top_k {args.top_k}, {args.threads} torch threads")
+
+    results = [
+        ('NMS mask, max_pool2d', lambda: nms_mask_max_pool(heatmap, threshold)),
+        ('NMS mask, shifted maxima', lambda: xfeat.nms_mask(heatmap, threshold=threshold)),
+        ('selection, per-pixel scores', lambda: select_keypoints_per_pixel(xfeat, heatmap, reliability, args.top_k, threshold)),
+        ('selection, candidate scores', lambda: xfeat.select_keypoints(heatmap, reliability, args.top_k, threshold)),
+    ]
+    for name, function in results:
+        print(f"  {name + ':':30s} {time_ms(function, args.duration):7.2f} ms")
+
+    frame = random_frames(1, args.width, args.height)[0]
+    latency = time_ms(lambda: xfeat.detectAndCompute(frame, top_k=args.top_k), args.duration)
+    print(f"  {'detectAndCompute:':30s} {latency:7.2f} ms")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark XFeat extraction paths")
+    parser.add_argument('--weights', type=str, default=None,
+                        help="XFeat weights, random initialisation if not given")
+    parser.add_argument('--width', type=int, default=600)
+    parser.add_argument('--height', type=int, default=450)
+    parser.add_argument('--top-k', type=int, default=2048)
+    parser.add_argument('--duration', type=float, default=10.0,
+                        help="Seconds per measured configuration")
+
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    batching = commands.add_parser('batching', help="Concurrent sessions with and without XFeatBatchScheduler")
+    batching.add_argument('--sessions', type=int, default=4)
+    batching.add_argument('--max-batch-size', type=int, default=16)
+    batching.add_argument('--max-concurrent', type=int, nargs='*', default=[None, 1],
+                          help="Scheduler concurrency limits to compare, default: the automatic one and 1")
+    batching.set_defaults(run=benchmark_batching)
+
+    detect = commands.add_parser('detect', help="Keypoint selection after the backbone, one frame on one step worker")
+    detect.add_argument('--threads', type=int, default=1,
+                        help="Torch threads, the step engine gives each worker a share of the cores")
+    detect.add_argument('--logit-scale', type=float, default=3.0,
+                        help="Spread of the synthetic keypoint logits, sets the number of NMS candidates")
+    detect.set_defaults(run=benchmark_detect)
+
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_args()
+    args.run(args)
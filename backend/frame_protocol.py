@@ -0,0 +1,76 @@
+import json
+import struct
+
+# Binary WebSocket frames avoid base64 + JSON for the per-frame images.
+#
+# Every binary message starts with a fixed header:
+#   message type (uint8) | session sequence number (uint32) | payload length (uint32)
+# all in network byte order, followed by the payload.
+#
+# STEP (client -> server): payload is the encoded camera frame (JPEG/PNG bytes).
+# STEP_RESPONSE (server -> client): payload is a list of length-prefixed parts
+#   (uint32 length + bytes each): UTF-8 JSON of the step_response data, the
+#   encoded input debug image and the encoded source debug image. Image parts
+#   may be empty.
+
+HEADER = struct.Struct('!BII')
+PART_LENGTH = struct.Struct('!I')
+
+MESSAGE_TYPE_STEP = 0x01
+MESSAGE_TYPE_STEP_RESPONSE = 0x02
+
+MAX_SEQUENCE = 0xFFFFFFFF
+
+
+def encode_frame(message_type, seq, payload):
+    """
+    Build a binary frame from a message type, sequence number and payload bytes.
+    """
+    return HEADER.pack(message_type, seq & MAX_SEQUENCE, len(payload)) + payload
+
+
+def decode_frame(message):
+    """
+    Split a binary frame into (message_type, seq, payload).
+    Raises ValueError if the frame is truncated or its length field does not match.
+    """
+    if len(message) < HEADER.size:
+        raise ValueError(f"Binary frame too short: {len(message)} bytes")
+
+    message_type, seq, payload_length = HEADER.unpack_from(message)
+    payload = message[HEADER.size:]
+
+    if len(payload) != payload_length:
+        raise ValueError(f"Binary frame payload length mismatch: header says {payload_length}, got {len(payload)}")
+
+    return message_type, seq, payload
+
+
+def decode_client_message(message):
+    """
+    Convert a binary frame received on /ws into the same dict shape as a JSON message.
+    """
+    message_type, seq, payload = decode_frame(message)
+
+    if message_type == MESSAGE_TYPE_STEP:
+        if not payload:
+            raise ValueError("Step frame has an empty image payload")
+
+        return {
+            "type": "step",
+            "seq": seq,
+            "image_bytes": payload,
+            "binary": True
+        }
+
+    raise ValueError(f"Unknown binary message type: {message_type}")
+
+
+def encode_step_response(seq, data, input_image=b'', source_image=b''):
+    """
+    Build a STEP_RESPONSE frame from the step_response data dict and the encoded debug images.
+    """
+    parts = [json.dumps(data).encode('utf-8'), bytes(input_image), bytes(source_image)]
+    payload = b''.join(PART_LENGTH.pack(len(part)) + part for part in parts)
+
+    return encode_frame(MESSAGE_TYPE_STEP_RESPONSE, seq, payload)
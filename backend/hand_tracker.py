@@ -0,0 +1,130 @@
+import time
+
+import mediapipe as mp
+import numpy as np
+from mediapipe.tasks import python
+from mediapipe.tasks.python import vision
+
+class HandTracker:
+    """
+    Per-session MediaPipe hand landmarker.
+
+    By default the landmarker runs in VIDEO mode with monotonically increasing frame
+    timestamps, so MediaPipe tracks the hand between frames and only re-runs palm detection
+    when tracking is lost.
+
+    With roi_tracking enabled, detection runs on a crop around the previous hand position
+    instead and falls back to the full frame when the hand is not found in the crop. The crop
+    moves between frames, which VIDEO mode tracking cannot follow, so that mode uses IMAGE mode.
+    """
+
+    def __init__(
+        self,
+        model_asset_path='hand_landmarker.task',
+        model_asset_buffer=None,
+        roi_tracking=False,
+        roi_margin=0.5,
+        min_roi_size=160,
+        min_hand_detection_confidence=0.01,
+        min_hand_presence_confidence=0.01,
+        min_tracking_confidence=0.5
+    ):
+        self.roi_tracking = roi_tracking
+        self.roi_margin = roi_margin
+        self.min_roi_size = min_roi_size
+
+        # A model buffer read once by the caller avoids re-reading the file for every session
+        if model_asset_buffer is not None:
+            base_options = python.BaseOptions(model_asset_buffer=model_asset_buffer)
+        else:
+            base_options = python.BaseOptions(model_asset_path=model_asset_path)
+        options = vision.HandLandmarkerOptions(base_options=base_options,
+                                               min_hand_detection_confidence=min_hand_detection_confidence,
+                                               min_hand_presence_confidence=min_hand_presence_confidence,
+                                               min_tracking_confidence=min_tracking_confidence,
+                                               running_mode=vision.RunningMode.IMAGE if roi_tracking else vision.RunningMode.VIDEO,
+                                               num_hands=1)
+        self.landmarker = vision.HandLandmarker.create_from_options(options)
+
+        self.last_timestamp_ms = -1
+
+        # (x0, y0, x1, y1) pixel box around the last detected hand
+        self.previous_roi = None
+
+    def detect(self, input_image):
+        """
+        Detect hand landmarks in an RGB frame.
+
+        Args:
+            input_image (np.ndarray): RGB image of shape (H, W, 3).
+
+        Returns:
+            HandLandmarkerResult: Landmarks normalised to the full frame.
+        """
+        if self.roi_tracking:
+            return self.__detect_in_roi(input_image)
+
+        image = mp.Image(image_format=mp.ImageFormat.SRGB, data=input_image)
+        return self.landmarker.detect_for_video(image, self.__next_timestamp_ms())
+
+    def reset(self):
+        """
+        Forget the last hand position, the next frame with roi_tracking runs on the full frame.
+        """
+        self.previous_roi = None
+
+    def close(self):
+        self.landmarker.close()
+
+    def __next_timestamp_ms(self):
+        # VIDEO mode rejects timestamps that do not increase
+        timestamp_ms = int(time.monotonic() * 1000)
+        if timestamp_ms <= self.last_timestamp_ms:
+            timestamp_ms = self.last_timestamp_ms + 1
+
+        self.last_timestamp_ms = timestamp_ms
+        return timestamp_ms
+
+    def __detect_in_roi(self, input_image):
+        height, width = input_image.shape[:2]
+
+        if self.previous_roi is not None:
+            x0, y0, x1, y1 = self.previous_roi
+            crop = np.ascontiguousarray(input_image[y0:y1, x0:x1])
+            result = self.landmarker.detect(mp.Image(image_format=mp.ImageFormat.SRGB, data=crop))
+
+            if result.hand_landmarks:
+                self.__map_landmarks_to_frame(result, x0, y0, x1 - x0, y1 - y0, width, height)
+                self.previous_roi = self.__roi_from_landmarks(result, width, height)
+                return result
+
+        # No previous hand or it left the crop, search the full frame
+        result = self.landmarker.detect(mp.Image(image_format=mp.ImageFormat.SRGB, data=input_image))
+        self.previous_roi = self.__roi_from_landmarks(result, width, height) if result.hand_landmarks else None
+        return result
+
+    def __map_landmarks_to_frame(self, result, x0, y0, crop_width, crop_height, width, height):
+        for landmarks in result.hand_landmarks:
+            for landmark in landmarks:
+                landmark.x = (landmark.x * crop_width + x0) / width
+                landmark.y = (landmark.y * crop_height + y0) / height
+
+    def __roi_from_landmarks(self, result, width, height):
+        landmarks = result.hand_landmarks[0]
+        xs = np.array([landmark.x for landmark in landmarks]) * width
+        ys = np.array([landmark.y for landmark in landmarks]) * height
+
+        # Square box around the hand, grown by the margin so the next frame's hand still fits
+        center_x, center_y = (xs.min() + xs.max()) / 2, (ys.min() + ys.max()) / 2
+        size = max(xs.max() - xs.min(), ys.max() - ys.min()) * (1 + 2 * self.roi_margin)
+        size = max(size, self.min_roi_size)
+
+        x0 = int(max(0, center_x - size / 2))
+        y0 = int(max(0, center_y - size / 2))
+        x1 = int(min(width, center_x + size / 2))
+        y1 = int(min(height, center_y + size / 2))
+
+        if x1 - x0 < 32 or y1 - y0 < 32:
+            return None
+
+        return x0, y0, x1, y1
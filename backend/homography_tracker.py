@@ -0,0 +1,141 @@
+import cv2
+import numpy as np
+
+class HomographyTracker:
+    """
+    Tracks the inlier points of the last XFeat + LighterGlue match into new frames with
+    pyramidal Lucas-Kanade optical flow and re-fits the source -> input homography from them.
+    Tracks that do not come back to their start when flowed backwards are dropped. A full
+    re-match is requested when too few points survive, when the re-fitted homography no longer
+    explains most surviving tracks (median reprojection error over all of them, not only the
+    RANSAC inliers) or when too many frames have passed since the last keyframe match.
+    """
+
+    def __init__(
+        self,
+        min_tracked_points=25,
+        max_reprojection_error=3.0,
+        max_median_error=1.5,
+        max_forward_backward_error=1.0,
+        max_frames_between_matches=15,
+        max_keyframe_points=400
+    ):
+        self.min_tracked_points = min_tracked_points
+        self.max_reprojection_error = max_reprojection_error
+        self.max_median_error = max_median_error
+        self.max_forward_backward_error = max_forward_backward_error
+        self.max_frames_between_matches = max_frames_between_matches
+        self.max_keyframe_points = max_keyframe_points
+
+        self.lk_params = dict(
+            winSize=(21, 21),
+            maxLevel=3,
+            criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 30, 0.01)
+        )
+
+        self.reset()
+
+    def reset(self):
+        """
+        Drop the current keyframe so the next frame runs a full match.
+        """
+        self.previous_gray = None
+        self.source_points = None
+        self.input_points = None
+        self.frames_since_match = 0
+
+    def has_keyframe(self):
+        return self.previous_gray is not None
+
+    def set_keyframe(self, input_gray, source_points, input_points):
+        """
+        Start tracking from the inlier matches of a full match on input_gray.
+
+        Args:
+            input_gray (np.ndarray): Grayscale input frame the matches were found in.
+            source_points (np.ndarray): (N, 2) inlier points in source image coordinates.
+            input_points (np.ndarray): (N, 2) matching points in input image coordinates.
+        """
+        if len(input_points) < self.min_tracked_points:
+            self.reset()
+            return
+
+        # Spread a bounded number of points over the match set to keep tracking cheap
+        if len(input_points) > self.max_keyframe_points:
+            keep = np.linspace(0, len(input_points) - 1, self.max_keyframe_points).astype(np.int32)
+            source_points = source_points[keep]
+            input_points = input_points[keep]
+
+        self.previous_gray = input_gray
+        self.source_points = np.asarray(source_points, dtype=np.float32).reshape(-1, 1, 2)
+        self.input_points = np.asarray(input_points, dtype=np.float32).reshape(-1, 1, 2)
+        self.frames_since_match = 0
+
+    def track(self, input_gray):
+        """
+        Track the keyframe points into input_gray and re-fit the homography.
+
+        Returns:
+            tuple: (homography_matrix, confidence_score), or None if a full re-match is needed.
+        """
+        if not self.has_keyframe():
+            return None
+
+        if self.frames_since_match >= self.max_frames_between_matches:
+            return None
+
+        if input_gray.shape != self.previous_gray.shape:
+            return None
+
+        next_points, status, _ = cv2.calcOpticalFlowPyrLK(
+            self.previous_gray, input_gray, self.input_points, None, **self.lk_params
+        )
+
+        if next_points is None:
+            return None
+
+        # Flow back to the keyframe, tracks that slipped do not return to where they started
+        back_points, back_status, _ = cv2.calcOpticalFlowPyrLK(
+            input_gray, self.previous_gray, next_points, None, **self.lk_params
+        )
+
+        if back_points is None:
+            return None
+
+        forward_backward_error = np.linalg.norm(back_points - self.input_points, axis=-1).reshape(-1)
+        status = status.reshape(-1).astype(bool) & back_status.reshape(-1).astype(bool) & \
+            (forward_backward_error <= self.max_forward_backward_error)
+        source_points = self.source_points[status]
+        tracked_points = next_points[status]
+
+        if len(tracked_points) < self.min_tracked_points:
+            return None
+
+        homography, mask = cv2.findHomography(source_points, tracked_points, cv2.RANSAC, self.max_reprojection_error)
+
+        if homography is None or mask is None:
+            return None
+
+        inlier_mask = mask.reshape(-1).astype(bool)
+        inlier_count = int(np.sum(inlier_mask))
+
+        if inlier_count < self.min_tracked_points:
+            return None
+
+        # Median reprojection error of every surviving track, the inliers alone are within the
+        # RANSAC threshold by construction. Points on a flat screen fit far tighter than that
+        projected = cv2.perspectiveTransform(source_points, homography)
+        median_error = float(np.median(np.linalg.norm(projected - tracked_points, axis=-1)))
+
+        if median_error > self.max_median_error:
+            return None
+
+        # Keep only the inliers so outliers do not accumulate drift
+        self.previous_gray = input_gray
+        self.source_points = source_points[inlier_mask]
+        self.input_points = tracked_points[inlier_mask]
+        self.frames_since_match += 1
+
+        confidence = inlier_count / len(status)
+
+        return homography, confidence
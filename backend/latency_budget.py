@@ -0,0 +1,124 @@
+class LatencyBudgetController:
+    """
+    Per-session controller for the matching resolution and keypoint count.
+
+    After each step that ran a full XFeat + LighterGlue match, the step latency and inlier
+    ratio are folded into moving averages. Over budget, the controller first lowers top_k and
+    then the working resolution; with headroom, it restores resolution first and then top_k,
+    sooner when matches are weak. A cooldown between changes lets the averages settle, so
+    sessions on a busy host step down gradually instead of oscillating.
+    """
+
+    def __init__(
+        self,
+        target_ms=80.0,
+        min_dimension=320,
+        max_dimension=600,
+        dimension_step=64,
+        min_top_k=512,
+        max_top_k=2048,
+        top_k_factor=0.75,
+        min_inlier_ratio=0.3,
+        headroom=0.2,
+        smoothing=0.3,
+        cooldown_steps=5
+    ):
+        """
+        Args:
+            target_ms (float): Target step latency in milliseconds.
+            min_dimension, max_dimension (int): Bounds of the longest side of the matched input image.
+            dimension_step (int): Resolution change per adjustment, in pixels.
+            min_top_k, max_top_k (int): Bounds of the number of input keypoints.
+            top_k_factor (float): top_k is multiplied or divided by this per adjustment.
+            min_inlier_ratio (float): Below this average inlier ratio, quality is restored before the latency has fully recovered.
+            headroom (float): Fraction of the target that must be left before quality is raised again.
+            smoothing (float): Weight of the newest sample in the moving averages.
+            cooldown_steps (int): Measured steps between two adjustments.
+        """
+        self.target_ms = target_ms
+        self.min_dimension = min_dimension
+        self.max_dimension = max_dimension
+        self.dimension_step = dimension_step
+        self.min_top_k = min_top_k
+        self.max_top_k = max_top_k
+        self.top_k_factor = top_k_factor
+        self.min_inlier_ratio = min_inlier_ratio
+        self.headroom = headroom
+        self.smoothing = smoothing
+        self.cooldown_steps = cooldown_steps
+
+        self.reset()
+
+    def reset(self):
+        # Start at full quality, the first measurements bring it down if needed
+        self.dimension = self.max_dimension
+        self.top_k = self.max_top_k
+        self.latency_ms = None
+        self.inlier_ratio = None
+        self.steps_since_change = 0
+
+    @property
+    def settings(self):
+        return {'max_dimension': self.dimension, 'top_k': self.top_k}
+
+    @property
+    def dimensions(self):
+        """
+        Every working resolution the controller can step through, largest first.
+        """
+        return list(range(self.max_dimension, self.min_dimension, -self.dimension_step)) + [self.min_dimension]
+
+    def update(self, step_ms, inlier_ratio):
+        """
+        Record a step that ran a full match and adjust the settings for the next one.
+
+        Args:
+            step_ms (float): Total latency of the step in milliseconds.
+            inlier_ratio (float): RANSAC inlier ratio of the match, 0 if it failed.
+        """
+        self.latency_ms = self.__smooth(self.latency_ms, step_ms)
+        self.inlier_ratio = self.__smooth(self.inlier_ratio, inlier_ratio)
+
+        self.steps_since_change += 1
+        if self.steps_since_change < self.cooldown_steps:
+            return
+
+        if self.latency_ms > self.target_ms:
+            changed = self.__degrade()
+        elif self.latency_ms < self.target_ms * (1 - self.headroom) or \
+                (self.inlier_ratio < self.min_inlier_ratio and self.latency_ms < self.target_ms * (1 - self.headroom / 2)):
+            changed = self.__improve()
+        else:
+            changed = False
+
+        if changed:
+            self.steps_since_change = 0
+
+    def __smooth(self, average, sample):
+        if average is None:
+            return float(sample)
+        return (1 - self.smoothing) * average + self.smoothing * float(sample)
+
+    def __degrade(self):
+        # Fewer keypoints first, LighterGlue cost grows with both keypoint sets
+        if self.top_k > self.min_top_k:
+            self.top_k = max(self.min_top_k, int(self.top_k * self.top_k_factor))
+            return True
+
+        if self.dimension > self.min_dimension:
+            self.dimension = max(self.min_dimension, self.dimension - self.dimension_step)
+            return True
+
+        return False
+
+    def __improve(self):
+        # Resolution first, small screen text needs it more than extra keypoints
+        if self.dimension < self.max_dimension:
+            self.dimension = min(self.max_dimension, self.dimension + self.dimension_step)
+            return True
+
+        if self.top_k < self.max_top_k:
+            self.top_k = min(self.max_top_k, int(round(self.top_k / self.top_k_factor)))
+            return True
+
+        return False
@@ -1,7 +1,19 @@
-import torch
 import cv2
 import os
 import numpy as np
+import time
+
+from modules.xfeat import XFeat
+from modules.lighterglue import LighterGlue
+from modules.export import import_onnxruntime
+
+from model_weights import DOWNLOADS, is_pinned, load_upstream_weights, verify_weights
+
+from batch_scheduler import XFeatBatchScheduler
+
+from latency_budget import LatencyBudgetController
+
+from stage_timer import StageTimer
 
 def warp_corners_and_draw_matches(ref_points, dst_points, img1, img2):
     # Calculate the Homography matrix
@@ -36,121 +48,328 @@ def warp_corners_and_draw_matches(ref_points, dst_points, img1, img2):
     return (img_matches, H)
 
 class MatchingService:
-    def __init__(self):
-        self.xfeat = torch.hub.load('verlab/accelerated_features', 'XFeat', pretrained = True, top_k = 4096)
+    # Model file of each XFeat backbone variant, next to the fp32 weights
+    BACKEND_FILES = {'onnx': 'xfeat.onnx', 'torchscript': 'xfeat.ts'}
+
+    def __init__(self, xfeat=None):
+        """
+        Args:
+            xfeat (XFeat): Already loaded matcher models, e.g. shared by a pre-fork parent
+                           process; loaded with load_models() if not given.
+        """
+        self.xfeat = xfeat if xfeat is not None else self.load_models()
+
+        # Batch feature extraction across sessions once extraction saturates the cores, off by
+        # default: see benchmark_xfeat.py, at the 600 px working resolution it does not raise throughput
+        if os.getenv('XFEAT_BATCHING', '0') == '1':
+            max_concurrent = os.getenv('XFEAT_MAX_CONCURRENT')
+            self.batch_scheduler = XFeatBatchScheduler(
+                self.xfeat,
+                max_batch_size=int(os.getenv('XFEAT_MAX_BATCH_SIZE', '16')),
+                max_concurrent=int(max_concurrent) if max_concurrent else None
+            )
+        else:
+            self.batch_scheduler = None
+
+    @classmethod
+    def load_models(cls):
+        """
+        Load XFeat and LighterGlue, configured by the XFEAT_QUANTIZED and XFEAT_BACKEND environment
+        variables. The upstream weights come from the verified local directory once their download
+        is pinned in SHA256SUMS, until then from upstream through the torch.hub cache.
+        """
+        start_time = time.time()
+
+        quantized = os.getenv('XFEAT_QUANTIZED', '0') == '1'
+        backend = os.getenv('XFEAT_BACKEND', 'torch')
+
+        # Fail at startup rather than on the first frame if the backend's runtime is missing
+        if backend == 'onnx':
+            import_onnxruntime()
+
+        # Checksum-verified local files, fails before serving if any are missing
+        pinned = is_pinned()
+        weight_files = list(DOWNLOADS) if pinned else []
+        if quantized:
+            weight_files.append('xfeat-int8.pt')
+        if backend in cls.BACKEND_FILES:
+            weight_files.append(cls.BACKEND_FILES[backend])
+        weights = verify_weights(weight_files)
+
+        if not pinned:
+            print("Matcher weights are not pinned in SHA256SUMS, loading them from upstream")
+
+        xfeat = XFeat(
+            weights=weights['xfeat.pt'] if pinned else load_upstream_weights('xfeat.pt'),
+            top_k=4096,
+            quantized=quantized,
+            quantized_weights=weights.get('xfeat-int8.pt'),
+            backend=backend,
+            backend_path=weights.get(cls.BACKEND_FILES.get(backend))
+        )
+
+        # Created up front rather than on the first match, so steps on several worker
+        # threads never race to build it; it only downloads while the weights are not pinned
+        xfeat.lighterglue = LighterGlue(weights.get('xfeat-lighterglue.pt'), allow_download=not pinned)
+
+        print(f"Matcher models loaded in {time.time() - start_time:.2f} seconds "
+              f"(backend {backend}, quantized {quantized})")
+
+        return xfeat
+
+    def warmup(self, sizes=None, dimensions=None):
+        """
+        Run feature extraction once per frame size and working resolution, then LighterGlue once,
+        before serving, so the first sessions do not pay for lazy initialisation of each shape.
+        sizes is a list of (width, height) frame sizes, by default from XFEAT_WARMUP_SIZES.
+        dimensions are the max_dimension values frames are resized to, by default every step
+        of the latency budget controller. ROI crops have arbitrary sizes and are not covered.
+        """
+        if dimensions is None:
+            dimensions = LatencyBudgetController().dimensions
+
+        if sizes is None:
+            sizes = [tuple(int(v) for v in size.split('x'))
+                     for size in os.getenv('XFEAT_WARMUP_SIZES', '640x480,480x640,1280x720,720x1280').split(',') if size]
 
-    def get_homography_xfeat(self, input_image, source_image):
+        start_time = time.time()
+        rng = np.random.default_rng(0)
+        features = []
+        for width, height in sizes:
+            image = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+            for dimension in dimensions:
+                features.append(self.extract_features(image, max_dimension=dimension))
+
+        features = [output for output in features if output is not None]
+        if len(features) >= 2:
+            self.__match_lighterglue(features[0], features[1])
+
+        print(f"XFeat warmup for {len(sizes)} frame sizes at {len(dimensions)} resolutions took {time.time() - start_time:.2f} seconds")
+
+    def __detect_and_compute(self, image, top_k, batch):
+        if batch and self.batch_scheduler is not None:
+            return self.batch_scheduler.detect_and_compute(image, top_k)
+
+        return self.xfeat.detectAndCompute(image, top_k=top_k)[0]
+
+    def __match_lighterglue(self, output0, output1):
+        return self.xfeat.match_lighterglue(output0, output1)
+
+    def extract_features(self, image, max_dimension=600, top_k=2048, batch=True):
+        """
+        Resize an image for matching and extract its XFeat keypoints and descriptors.
+        With batch, the extraction may be batched with other sessions' frames of the same size.
+        Returns a dict with 'keypoints', 'scores', 'descriptors', 'image_size' and
+        'resize_factor', or None if no usable features were found.
+        """
+        if self.xfeat is None:
+            print("Error: XFeat model not loaded")
+            return None
+
+        if image is None or image.size == 0:
+            print("Error: Image is None or empty")
+            return None
+
+        if len(image.shape) != 3:
+            print(f"Error: Images must be 3-channel. Shape: {image.shape}")
+            return None
+
+        # Only resize if either dimension is larger than max_dimension pixels
+        h, w = image.shape[:2]
+        max_dim = max(h, w)
+        resize_factor = min(1.0, max_dimension / max_dim) if max_dim > max_dimension else 1.0
+
+        try:
+            if resize_factor < 1.0:
+                image_resized = cv2.resize(image, None, fx=resize_factor, fy=resize_factor)
+            else:
+                image_resized = image
+        except Exception as e:
+            print(f"Error resizing image: {e}")
+            return None
+
+        # Check minimum image dimensions
+        min_dim = 32  # Minimum dimension for feature detection
+        if image_resized.size == 0 or image_resized.shape[0] < min_dim or image_resized.shape[1] < min_dim:
+            print(f"Error: Image too small after resizing: {image_resized.shape}")
+            return None
+
+        try:
+            output = self.__detect_and_compute(image_resized, top_k, batch)
+        except Exception as e:
+            print(f"Error in feature detection: {e}")
+            return None
+
+        if not output or 'keypoints' not in output or 'descriptors' not in output:
+            print("Error: Feature detection failed - no valid features found")
+            return None
+
+        # Set the image size to the original dimensions
+        output.update({
+            'image_size': (image.shape[1], image.shape[0]),
+            'resize_factor': resize_factor
+        })
+
+        return output
+
+    def get_homography_xfeat(self, input_image, source_image, source_features=None, timer=None,
+                             max_dimension=600, top_k=2048, max_iters=500, roi_homography=None, roi_margin=0.15):
         """
         Get homography with confidence metric based on inlier ratio.
-        Returns (homography_matrix, confidence_score)
+        If source_features (from extract_features) is given, the source image is not re-extracted.
+        If timer (a StageTimer) is given, the extract, match and homography stages are timed into it.
+        max_dimension and top_k set the input image's working resolution and keypoint count,
+        max_iters the RANSAC iteration limit.
+        If roi_homography (source to input) is given, only the input region around the projected
+        source, grown by roi_margin, is extracted; if that match fails the full frame is used.
+        Returns (homography_matrix, confidence_score, inliers) where inliers is a tuple of
+        (source_points, input_points) float32 arrays of the RANSAC inlier matches, or None.
         """
         # Check if XFeat model is available
         if self.xfeat is None:
             print("Error: XFeat model not loaded")
-            return None, 0.0
+            return None, 0.0, None
             
         # Validate input images
         if input_image is None or source_image is None:
             print("Error: One or both input images are None")
-            return None, 0.0
+            return None, 0.0, None
             
         if input_image.size == 0 or source_image.size == 0:
             print("Error: One or both input images are empty")
-            return None, 0.0
+            return None, 0.0, None
             
         # Check image dimensions
         if len(input_image.shape) != 3 or len(source_image.shape) != 3:
             print(f"Error: Images must be 3-channel. Input shape: {input_image.shape}, Source shape: {source_image.shape}")
-            return None, 0.0
-        
-        # Only resize if either dimension is larger than max_dimension pixels
-        max_dimension = 600
-        
-        # Check input image dimensions
-        input_h, input_w = input_image.shape[:2]
-        input_max_dim = max(input_h, input_w)
-        input_resize_factor = min(1.0, max_dimension / input_max_dim) if input_max_dim > max_dimension else 1.0
-        
-        # Check source image dimensions  
-        source_h, source_w = source_image.shape[:2]
-        source_max_dim = max(source_h, source_w)
-        source_resize_factor = min(1.0, max_dimension / source_max_dim) if source_max_dim > max_dimension else 1.0
+            return None, 0.0, None
+
+        if timer is None:
+            timer = StageTimer()
         
-        # Resize images only if needed
-        try:
-            if input_resize_factor < 1.0:
-                input_image_resized = cv2.resize(input_image, None, fx=input_resize_factor, fy=input_resize_factor)
-            else:
-                input_image_resized = input_image
-                
-            if source_resize_factor < 1.0:
-                source_image_resized = cv2.resize(source_image, None, fx=source_resize_factor, fy=source_resize_factor)
-            else:
-                source_image_resized = source_image
-        except Exception as e:
-            print(f"Error resizing images: {e}")
-            return None, 0.0
+        # Reuse the cached source features when the caller has them
+        if source_features is None:
+            with timer.stage('source_extract'):
+                # The source is always extracted at full quality, like the cached source features
+                source_features = self.extract_features(source_image)
+            if source_features is None:
+                return None, 0.0, None
 
-        # Validate images before processing
-        if source_image_resized.size == 0 or input_image_resized.size == 0:
-            print("Error: One or both images are empty after resizing")
-            return None, 0.0
-            
-        # Check minimum image dimensions
-        min_dim = 32  # Minimum dimension for feature detection
-        if (source_image_resized.shape[0] < min_dim or source_image_resized.shape[1] < min_dim or
-            input_image_resized.shape[0] < min_dim or input_image_resized.shape[1] < min_dim):
-            print(f"Error: Images too small after resizing. Source: {source_image_resized.shape}, Input: {input_image_resized.shape}")
-            return None, 0.0
+        # Match only the part of the frame the source was last seen in, if known
+        roi = None
+        if roi_homography is not None:
+            roi = self.__input_roi(input_image.shape, source_image.shape, roi_homography, roi_margin)
 
-        # Detect and compute on resized images with fewer features
-        top_k = 2048  # Reduce from 4096 to 2048 features
-        try:
-            output0 = self.xfeat.detectAndCompute(source_image_resized, top_k=top_k)[0]
-            output1 = self.xfeat.detectAndCompute(input_image_resized, top_k=top_k)[0]
-        except Exception as e:
-            print(f"Error in feature detection: {e}")
-            return None, 0.0
+        if roi is not None:
+            H, inlier_ratio, inliers = self.__match_input(input_image, source_image, source_features, timer,
+                                                          max_dimension, top_k, max_iters, roi)
+            if H is not None:
+                return H, inlier_ratio, inliers
+            print("ROI match failed, falling back to the full frame")
+
+        return self.__match_input(input_image, source_image, source_features, timer,
+                                  max_dimension, top_k, max_iters, None)
+
+    def align(self, reference_image, image):
+        """
+        Homography from reference_image to image, or None if they don't match.
+        Used by the OCR cache to check near-duplicate source images.
+        """
+        H, _, _ = self.get_homography_xfeat(image, reference_image)
+        return H
+
+    def __input_roi(self, input_shape, source_shape, homography, margin):
+        """
+        Box (x0, y0, x1, y1) around the source image's corners projected into the input frame,
+        grown by margin on each side. None if the projection is degenerate, too small, or
+        covers nearly the whole frame anyway.
+        """
+        input_height, input_width = input_shape[:2]
+        source_height, source_width = source_shape[:2]
+
+        corners = np.array([[0, 0, 1], [source_width - 1, 0, 1],
+                            [source_width - 1, source_height - 1, 1], [0, source_height - 1, 1]], dtype=np.float64)
+        projected = corners @ np.asarray(homography, dtype=np.float64).T
+
+        # Corners behind the camera or at infinity give meaningless boxes
+        if not np.all(np.isfinite(projected)) or np.any(projected[:, 2] <= 1e-9):
+            return None
+        projected = projected[:, :2] / projected[:, 2:]
+
+        x_min, y_min = projected.min(axis=0)
+        x_max, y_max = projected.max(axis=0)
+        margin_x = (x_max - x_min) * margin
+        margin_y = (y_max - y_min) * margin
+
+        x0 = int(max(0, np.floor(x_min - margin_x)))
+        y0 = int(max(0, np.floor(y_min - margin_y)))
+        x1 = int(min(input_width, np.ceil(x_max + margin_x)))
+        y1 = int(min(input_height, np.ceil(y_max + margin_y)))
+
+        if x1 - x0 < 64 or y1 - y0 < 64:
+            return None
+
+        if (x1 - x0) * (y1 - y0) > 0.9 * input_width * input_height:
+            return None
+
+        return x0, y0, x1, y1
+
+    def __match_input(self, input_image, source_image, source_features, timer, max_dimension, top_k, max_iters, roi):
+        """
+        Extract the input features, only inside the roi box if given, match them against the
+        source features and fit the homography. Returns the same as get_homography_xfeat.
+        """
+        with timer.stage('input_extract'):
+            if roi is not None:
+                x0, y0, x1, y1 = roi
+                # Crops come in arbitrary sizes and would hardly ever share a batch, only adding queueing
+                output1 = self.extract_features(np.ascontiguousarray(input_image[y0:y1, x0:x1]), max_dimension=max_dimension, top_k=top_k, batch=False)
+            else:
+                output1 = self.extract_features(input_image, max_dimension=max_dimension, top_k=top_k)
+        if output1 is None:
+            return None, 0.0, None
+
+        output0 = source_features
 
-        # Validate feature outputs
-        if (not output0 or not output1 or 
-            'keypoints' not in output0 or 'keypoints' not in output1 or
-            'descriptors' not in output0 or 'descriptors' not in output1):
-            print("Error: Feature detection failed - no valid features found")
-            return None, 0.0
-            
         # Check if we have enough keypoints
         if (output0['keypoints'].shape[0] < 4 or output1['keypoints'].shape[0] < 4):
             print(f"Error: Insufficient keypoints. Source: {output0['keypoints'].shape[0]}, Input: {output1['keypoints'].shape[0]}")
-            return None, 0.0
+            return None, 0.0, None
+
+        source_resize_factor = output0['resize_factor']
+        input_resize_factor = output1['resize_factor']
 
-        # Set the image size to the original dimensions
-        output0.update({'image_size': (source_image.shape[1], source_image.shape[0])})
-        output1.update({'image_size': (input_image.shape[1], input_image.shape[0])})
-        
         # Match features with error handling
         try:
-            mkpts_0, mkpts_1, other = self.xfeat.match_lighterglue(output0, output1)
+            with timer.stage('lighterglue'):
+                mkpts_0, mkpts_1, other = self.__match_lighterglue(output0, output1)
         except Exception as e:
             print(f"Error in feature matching: {e}")
-            return None, 0.0
+            return None, 0.0, None
         
         if len(mkpts_0) < 4:  # Need at least 4 points for homography
-            return None, 0.0
+            return None, 0.0, None
         
         # Scale keypoints back to original image size
         mkpts_0 = mkpts_0 / source_resize_factor
         mkpts_1 = mkpts_1 / input_resize_factor
+        if roi is not None:
+            # Offset the crop's keypoints back into the full input frame
+            mkpts_1 = mkpts_1 + np.array(roi[:2], dtype=mkpts_1.dtype)
 
         # Calculate homography using USAC_FAST algorithm with fewer iterations
-        H, mask = cv2.findHomography(mkpts_0, mkpts_1, cv2.USAC_FAST, 3.0, maxIters=500, confidence=0.995)
+        with timer.stage('find_homography'):
+            H, mask = cv2.findHomography(mkpts_0, mkpts_1, cv2.USAC_FAST, 3.0, maxIters=max_iters, confidence=0.995)
         
         if H is None or mask is None:
-            return None, 0.0
+            return None, 0.0, None
         
         # Calculate inlier ratio as confidence
         mask = mask.flatten()
         inlier_ratio = np.sum(mask) / len(mask)
+
+        inlier_mask = mask.astype(bool)
+        inliers = (mkpts_0[inlier_mask].astype(np.float32), mkpts_1[inlier_mask].astype(np.float32))
         
         print(f'Inlier ratio (confidence): {inlier_ratio:.3f}')
         
@@ -162,4 +381,4 @@ class MatchingService:
             concatenated_image_path = os.path.join(os.getcwd(), 'concatenated_image_with_matches.jpg')
             cv2.imwrite(concatenated_image_path, canvas)
 
-        return H, inlier_ratio
\ No newline at end of file
+        return H, inlier_ratio, inliers
@@ -0,0 +1,86 @@
+import base64
+import json
+import traceback
+
+import frame_protocol
+
+def parse_websocket_message(text=None, data=None):
+    """
+    Decode a client WebSocket message: binary frames carry step images without base64/JSON,
+    text frames are JSON.
+    """
+    if data is not None:
+        return frame_protocol.decode_client_message(data)
+
+    return json.loads(text)
+
+async def handle_websocket_message(vision_manager, session_id: str, data: dict, websocket):
+    """
+    Handle different types of WebSocket messages.
+
+    Shared by the single-process app and the worker processes, where websocket is a
+    RelayWebSocket back to the front process.
+    """
+    message_type = data.get("type", "")
+    print(f'Received message type: {message_type}')
+
+    try:
+        if message_type == "start_session":
+            print(f'Starting recognition for session {session_id}')
+            await vision_manager.start_session(session_id, data.get("render_mode"), data.get("include_timings"))
+
+        elif message_type == "stop_session":
+            print(f'Stopping recognition for session {session_id}')
+            await vision_manager.stop_session(session_id)
+
+        elif message_type == "audio_chunk":
+            # Handle incoming audio chunks
+            audio_data = data.get("audio", "")
+            if isinstance(audio_data, str):
+                audio_data = base64.b64decode(audio_data)
+            await vision_manager.process_audio_chunk(session_id, audio_data)
+
+        elif message_type == "step":
+            await vision_manager.step(session_id, data)
+
+        elif message_type == "set_source_image":
+            source_image = data.get("image", None)
+            if not source_image:
+                raise ValueError("Source image is required")
+
+            # Decode base64 image
+            source_image_bytes = base64.b64decode(source_image)
+
+            print(f'Setting source image for session {session_id}')
+            await vision_manager.set_source_image(session_id, source_image_bytes)
+
+        elif message_type == "send_screen_info":
+            print(f'Sending screen info for session {session_id}')
+            screen_info = await vision_manager.get_screen_info(session_id)
+            await websocket.send_json({
+                "type": "screen_info_response",
+                "data": screen_info
+            })
+
+        elif message_type == "track_element":
+            element_index = data.get("element_index")
+            if element_index is None:
+                raise ValueError("Element index is required for tracking")
+
+            print(f'Tracking element at index {element_index} for session {session_id}')
+            await vision_manager.track_element(session_id, element_index)
+
+        elif message_type == "clear_tracked_element":
+            print(f'Clearing element tracking for session {session_id}')
+            await vision_manager.clear_tracked_element(session_id)
+
+        else:
+            print(f'Unhandled message type {message_type} for session {session_id}')
+
+    except Exception as e:
+        print(f'Error handling message type {message_type}: {e}')
+        print(f'Traceback:\n{traceback.format_exc()}')
+        await websocket.send_json({
+            "type": "error",
+            "message": str(e)
+        })
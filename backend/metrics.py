@@ -0,0 +1,158 @@
+import json
+import threading
+
+from stage_timer import process_latency
+
+class ServiceMetrics:
+    """
+    Process-wide counters exposed on /api/metrics.
+    """
+
+    COUNTERS = {
+        'steps_processed': 'Steps that finished and sent a step_response',
+        'steps_dropped': 'Step frames superseded by a newer frame before a step worker picked them up',
+        'websocket_bytes_in': 'Bytes received from clients over /ws',
+        'websocket_bytes_out': 'Bytes sent to clients over /ws',
+        'speech_tokens': 'Total tokens reported by the realtime speech service',
+        'ocr_requests': 'Source images sent to OCR, including cache hits',
+        'ocr_cache_hits': 'Source images whose OCR result came from the cache',
+        'ocr_near_duplicate_hits': 'Source images whose OCR result came from a verified near-duplicate in the cache',
+    }
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {name: 0 for name in self.COUNTERS}
+
+    def increment(self, name, value=1):
+        with self.lock:
+            self.values[name] += value
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.values)
+
+metrics = ServiceMetrics()
+
+class MeteredWebSocket:
+    """
+    Wraps a FastAPI WebSocket and counts the bytes sent to the client.
+    Everything other than the send methods is passed through.
+    """
+
+    def __init__(self, websocket):
+        self.websocket = websocket
+
+    async def send_json(self, data, mode="text"):
+        # Serialise like Starlette does, so the byte count matches what goes on the wire
+        text = json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+        if mode == "binary":
+            await self.send_bytes(text.encode('utf-8'))
+        else:
+            await self.send_text(text)
+
+    async def send_text(self, data):
+        metrics.increment('websocket_bytes_out', len(data.encode('utf-8')))
+        await self.websocket.send_text(data)
+
+    async def send_bytes(self, data):
+        metrics.increment('websocket_bytes_out', len(data))
+        await self.websocket.send_bytes(data)
+
+    def __getattr__(self, name):
+        return getattr(self.websocket, name)
+
+def collect_load(vision_manager):
+    """
+    Load of a VisionManager's process: sessions, step executor queue, XFeat batching,
+    service counters and the per-stage step latency summary. Worker processes send this
+    to the front process as their health report.
+    """
+    load = {
+        "sessions": len(vision_manager.visionInstanceList),
+        "queue_depth": vision_manager.step_engine.queue_depth,
+        "pending_jobs": vision_manager.step_engine.pending_jobs,
+        "counters": metrics.snapshot(),
+        "latency": process_latency.summary()
+    }
+
+    batch_scheduler = vision_manager.matching_service.batch_scheduler
+    if batch_scheduler is not None:
+        load["xfeat_batches"] = batch_scheduler.batches_run
+        load["xfeat_batched_images"] = batch_scheduler.images_processed
+
+    return load
+
+def render_prometheus(vision_manager=None, worker_pool=None):
+    """
+    Render the service metrics in the Prometheus text exposition format.
+    In multi-worker mode the front process has no VisionManager: counters are summed over
+    the workers' last health reports and the load metrics carry a worker label.
+    """
+    lines = []
+
+    def format_sample(name, labels, value):
+        label_text = ",".join(f'{key}="{label}"' for key, label in labels.items())
+        return f"watvision_{name}{{{label_text}}} {value}" if label_text else f"watvision_{name} {value}"
+
+    def add_metric(name, metric_type, help_text, samples):
+        if not samples:
+            return
+        lines.append(f"# HELP watvision_{name} {help_text}")
+        lines.append(f"# TYPE watvision_{name} {metric_type}")
+        for labels, value in samples:
+            lines.append(format_sample(name, labels, value))
+
+    # (labels, load) of every process doing vision work
+    loads = []
+    if vision_manager is not None:
+        loads.append(({}, collect_load(vision_manager)))
+
+    counters = metrics.snapshot()
+    if worker_pool is not None:
+        worker_status = worker_pool.status()
+        for status in worker_status:
+            if status["load"]:
+                loads.append(({"worker": str(status["index"])}, status["load"]))
+
+        # Bytes are counted by the front process, steps and speech by the workers
+        for labels, load in loads:
+            for name, value in load["counters"].items():
+                counters[name] = counters.get(name, 0) + value
+
+    for name, help_text in ServiceMetrics.COUNTERS.items():
+        add_metric(f"{name}_total", "counter", help_text, [({}, counters[name])])
+
+    if worker_pool is not None:
+        add_metric("worker_up", "gauge", "Whether the vision worker is alive and reporting health",
+                   [({"worker": str(status["index"])}, int(status["healthy"])) for status in worker_status])
+        add_metric("worker_restarts_total", "counter", "Vision worker processes restarted after exiting",
+                   [({}, worker_pool.worker_restarts)])
+
+    add_metric("active_sessions", "gauge", "Sessions connected to this process",
+               [(labels, load["sessions"]) for labels, load in loads])
+    add_metric("executor_queue_depth", "gauge", "Step jobs waiting for a free step worker",
+               [(labels, load["queue_depth"]) for labels, load in loads])
+    add_metric("executor_pending_jobs", "gauge", "Step jobs queued or running on the step workers",
+               [(labels, load["pending_jobs"]) for labels, load in loads])
+    add_metric("xfeat_batches_total", "counter", "Batched XFeat forward passes",
+               [(labels, load["xfeat_batches"]) for labels, load in loads if "xfeat_batches" in load])
+    add_metric("xfeat_batched_images_total", "counter", "Images extracted through the XFeat batch scheduler",
+               [(labels, load["xfeat_batched_images"]) for labels, load in loads if "xfeat_batched_images" in load])
+
+    # Rolling-window step latency per stage, as a Prometheus summary
+    quantile_samples = []
+    count_samples = []
+    for labels, load in loads:
+        for stage, stage_summary in load["latency"].items():
+            for quantile in ('50', '90', '99'):
+                quantile_samples.append(({**labels, "stage": stage, "quantile": f"0.{quantile}"}, stage_summary[f"p{quantile}"]))
+            count_samples.append(({**labels, "stage": stage}, stage_summary['count']))
+
+    lines.append("# HELP watvision_step_stage_latency_ms Step stage latency in milliseconds over a rolling window")
+    lines.append("# TYPE watvision_step_stage_latency_ms summary")
+    for labels, value in quantile_samples:
+        lines.append(format_sample("step_stage_latency_ms", labels, value))
+    for labels, value in count_samples:
+        lines.append(format_sample("step_stage_latency_ms_count", labels, value))
+
+    return "\n".join(lines) + "\n"
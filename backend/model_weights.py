@@ -0,0 +1,227 @@
+import argparse
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import urllib.request
+
+# Model files live next to the in-tree modules package, see modules/xfeat.py
+WEIGHTS_DIR = os.getenv('WEIGHTS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'weights'))
+
+# Committed next to the (untracked) weights: the pinned upstream commit and the checksum of every model file
+MANIFEST_NAME = 'SHA256SUMS'
+REVISION_PREFIX = '# revision: '
+
+# Files fetch_weights downloads from the upstream repository at the pinned commit, everything else
+# in the weights directory (int8, ONNX and TorchScript exports) is built locally with
+# modules.eval.quantize_xfeat / modules.export
+DOWNLOAD_URL = 'https://github.com/verlab/accelerated_features/raw/{revision}/weights/{name}'
+DOWNLOADS = ['xfeat.pt', 'xfeat-lighterglue.pt']
+
+# Where torch.hub.load took the weights from before, used until the downloads are pinned
+UPSTREAM_URL = 'https://github.com/verlab/accelerated_features/raw/main/weights/{name}'
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def read_manifest(weights_dir=WEIGHTS_DIR):
+    """
+    Returns:
+        dict: File name to expected SHA-256 hex digest, from the sha256sum-format manifest.
+    """
+    manifest_path = os.path.join(weights_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return {}
+
+    manifest = {}
+    with open(manifest_path, 'r') as file:
+        for line in file:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            digest, name = line.split(maxsplit=1)
+            manifest[name.lstrip('*')] = digest.lower()
+    return manifest
+
+def read_revision(weights_dir=WEIGHTS_DIR):
+    """
+    Returns:
+        str: Upstream commit the downloads are pinned to, from the manifest, or None if not pinned.
+    """
+    manifest_path = os.path.join(weights_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return None
+
+    with open(manifest_path, 'r') as file:
+        for line in file:
+            if line.startswith(REVISION_PREFIX):
+                return line[len(REVISION_PREFIX):].strip()
+    return None
+
+def is_pinned(weights_dir=WEIGHTS_DIR):
+    """
+    Whether the manifest pins the upstream commit and the checksum of every download.
+    """
+    manifest = read_manifest(weights_dir)
+    return read_revision(weights_dir) is not None and all(name in manifest for name in DOWNLOADS)
+
+def load_upstream_weights(name):
+    """
+    State dict of a download from the upstream main branch, through the torch.hub cache like
+    torch.hub.load. Not checksum-verified, only used while the downloads are not pinned.
+    """
+    import torch
+    return torch.hub.load_state_dict_from_url(UPSTREAM_URL.format(name=name), map_location='cpu')
+
+def write_manifest(manifest, revision, weights_dir=WEIGHTS_DIR):
+    with open(os.path.join(weights_dir, MANIFEST_NAME), 'w') as file:
+        file.write("# Checksums of the matcher model weights, verified before they are loaded. See model_weights.py\n")
+        if revision:
+            file.write(f"{REVISION_PREFIX}{revision}\n")
+        for name in sorted(manifest):
+            file.write(f"{manifest[name]}  {name}\n")
+
+def check_revision(revision):
+    # Branch names and tags can move, only a full commit id pins the downloaded files
+    if not re.fullmatch(r'[0-9a-f]{40}', revision or ''):
+        raise ValueError(f"Weights revision must be a full 40 character commit id, got '{revision}'")
+    return revision
+
+def verify_weights(names, weights_dir=WEIGHTS_DIR):
+    """
+    Check that each model file exists and matches its manifest checksum.
+
+    Args:
+        names (list): File names in the weights directory.
+
+    Returns:
+        dict: File name to absolute path.
+
+    Raises:
+        RuntimeError: If a file is missing, has no manifest entry, or does not match it.
+    """
+    manifest = read_manifest(weights_dir)
+    paths = {}
+
+    for name in names:
+        path = os.path.join(weights_dir, name)
+        if not os.path.exists(path):
+            raise RuntimeError(f"Model weights {path} not found, run 'python model_weights.py' to fetch them")
+
+        if name not in manifest:
+            raise RuntimeError(f"Model weights {name} have no checksum in {os.path.join(weights_dir, MANIFEST_NAME)}, "
+                               f"pin downloads with 'python model_weights.py --pin <commit>', record locally built files "
+                               f"with 'python model_weights.py --update-manifest'")
+
+        digest = sha256_file(path)
+        if digest != manifest[name]:
+            raise RuntimeError(f"Checksum mismatch for {path}: expected {manifest[name]}, got {digest}")
+
+        paths[name] = path
+
+    return paths
+
+def download(url, weights_dir):
+    """
+    Download url into a temporary file in weights_dir.
+
+    Returns:
+        tuple: (temporary file path, SHA-256 hex digest).
+    """
+    print(f"Downloading {url}")
+    # Download next to the target and rename once verified, so no partial or unverified file is left under the real name
+    with tempfile.NamedTemporaryFile(dir=weights_dir, suffix='.tmp', delete=False) as temp_file:
+        with urllib.request.urlopen(url) as response:
+            shutil.copyfileobj(response, temp_file)
+    return temp_file.name, sha256_file(temp_file.name)
+
+def fetch_weights(weights_dir=WEIGHTS_DIR):
+    """
+    Download the missing model files from the pinned upstream commit and verify them against
+    the committed manifest. Fails before downloading anything if a file has no pinned checksum.
+    """
+    os.makedirs(weights_dir, exist_ok=True)
+    manifest_path = os.path.join(weights_dir, MANIFEST_NAME)
+
+    revision = read_revision(weights_dir)
+    manifest = read_manifest(weights_dir)
+    unpinned = [name for name in DOWNLOADS if name not in manifest]
+    if revision is None or unpinned:
+        raise RuntimeError(f"Model weights are not pinned in {manifest_path} "
+                           f"(revision {revision or 'missing'}, no checksum for {unpinned or 'none'}), "
+                           f"run 'python model_weights.py --pin <commit>' and commit the manifest")
+    check_revision(revision)
+
+    for name in DOWNLOADS:
+        path = os.path.join(weights_dir, name)
+        if os.path.exists(path):
+            continue
+
+        temp_path, digest = download(DOWNLOAD_URL.format(revision=revision, name=name), weights_dir)
+        if digest != manifest[name]:
+            os.remove(temp_path)
+            raise RuntimeError(f"Checksum mismatch for {name} at revision {revision}: expected {manifest[name]}, got {digest}")
+        os.replace(temp_path, path)
+
+    verify_weights(DOWNLOADS, weights_dir)
+    print(f"Model weights in {weights_dir} verified")
+
+def pin_weights(revision, weights_dir=WEIGHTS_DIR):
+    """
+    Download the model files at an upstream commit and record the commit and their checksums in
+    the manifest, replacing existing downloads. The manifest is then reviewed and committed.
+    """
+    check_revision(revision)
+    os.makedirs(weights_dir, exist_ok=True)
+
+    manifest = read_manifest(weights_dir)
+    for name in DOWNLOADS:
+        temp_path, manifest[name] = download(DOWNLOAD_URL.format(revision=revision, name=name), weights_dir)
+        os.replace(temp_path, os.path.join(weights_dir, name))
+
+    write_manifest(manifest, revision, weights_dir)
+    print(f"Pinned {len(DOWNLOADS)} files at revision {revision} in {os.path.join(weights_dir, MANIFEST_NAME)}, "
+          f"review and commit it")
+
+def record_local_weights(weights_dir=WEIGHTS_DIR):
+    """
+    Record the checksums of the locally built model files, e.g. after building the int8 or
+    exported models. Downloaded files are only ever recorded by pin_weights.
+    """
+    names = [name for name in sorted(os.listdir(weights_dir))
+             if name != MANIFEST_NAME and name not in DOWNLOADS and not name.endswith('.tmp')
+             and os.path.isfile(os.path.join(weights_dir, name))]
+
+    manifest = read_manifest(weights_dir)
+    for name in names:
+        manifest[name] = sha256_file(os.path.join(weights_dir, name))
+    write_manifest(manifest, read_revision(weights_dir), weights_dir)
+    print(f"Recorded checksums of {len(names)} local files in {os.path.join(weights_dir, MANIFEST_NAME)}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fetch and verify the matcher model weights")
+    parser.add_argument('--weights-dir', type=str, default=WEIGHTS_DIR,
+                        help="Directory the weights are stored in")
+    parser.add_argument('--pin', type=str, metavar='COMMIT',
+                        help=f"Download the weights at an upstream commit and record it and their checksums in {MANIFEST_NAME}")
+    parser.add_argument('--update-manifest', action='store_true',
+                        help=f"Record the checksums of the locally built files (int8, ONNX, TorchScript) in {MANIFEST_NAME}")
+    args = parser.parse_args()
+
+    if args.pin:
+        pin_weights(args.pin, args.weights_dir)
+    elif args.update_manifest:
+        record_local_weights(args.weights_dir)
+    elif is_pinned(args.weights_dir):
+        fetch_weights(args.weights_dir)
+    else:
+        # Fill the torch.hub cache instead, so the service still starts offline
+        print(f"Model weights are not pinned in {os.path.join(args.weights_dir, MANIFEST_NAME)}, "
+              f"caching the upstream weights unverified")
+        for name in DOWNLOADS:
+            load_upstream_weights(name)
@@ -240,8 +240,8 @@ def parse_args():
     parser = argparse.ArgumentParser(description="Run pose benchmark with matcher")
     parser.add_argument('--dataset-dir', type=str, required=True,
                         help="Path to MegaDepth dataset root")
-    parser.add_argument('--matcher', type=str, choices=['xfeat', 'xfeat-star', 'alike'], default='xfeat',
-                        help="Matcher to use (xfeat or alike)")
+    parser.add_argument('--matcher', type=str, choices=['xfeat', 'xfeat-int8', 'xfeat-star', 'alike'], default='xfeat',
+                        help="Matcher to use (xfeat, xfeat-int8 or alike)")
     parser.add_argument('--ransac-thr', type=float, default=2.5,
                         help="RANSAC threshold value in pixels (default: 2.5)")
     return parser.parse_args()
@@ -262,6 +262,12 @@ if __name__ == '__main__':
         xfeat = XFeat()
         run_pose_benchmark(matcher_fn = xfeat.match_xfeat, loader = loader, ransac_thr = args.ransac_thr)
 
+    elif args.matcher == 'xfeat-int8':
+        print("Running benchmark for XFeat (INT8)..")
+        from modules.xfeat import XFeat
+        xfeat = XFeat(quantized = True)
+        run_pose_benchmark(matcher_fn = xfeat.match_xfeat, loader = loader, ransac_thr = args.ransac_thr)
+
     elif args.matcher == 'xfeat-star':
         from modules.xfeat import XFeat
         print("Running benchmark for XFeat*..")
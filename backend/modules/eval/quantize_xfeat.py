@@ -0,0 +1,69 @@
+"""
+    Calibrate and export the INT8 XFeat backbone used by XFeat(quantized = True).
+
+    Activation ranges are calibrated on a folder of screen images, resized the same way the
+    matching service resizes its inputs. Compare against fp32 afterwards with:
+        python3 -m modules.eval.megadepth1500 --dataset-dir <path> --matcher xfeat-int8
+"""
+
+import argparse, glob, os
+import torch
+import cv2
+
+import tqdm
+
+from modules.xfeat import XFeat
+from modules.quantization import quantize_xfeat
+
+
+def load_calibration_images(xfeat, image_dir, num_images, max_dimension):
+    paths = sorted(p for ext in ('*.png', '*.jpg', '*.jpeg') for p in glob.glob(os.path.join(image_dir, ext)))
+    if len(paths) == 0:
+        raise RuntimeError(f"No calibration images found in {image_dir}")
+
+    images = []
+    for path in tqdm.tqdm(paths[:num_images], desc = "Loading calibration images"):
+        image = cv2.imread(path)
+        if image is None:
+            continue
+
+        # Same downscaling as MatchingService.extract_features
+        h, w = image.shape[:2]
+        if max(h, w) > max_dimension:
+            resize_factor = max_dimension / max(h, w)
+            image = cv2.resize(image, None, fx=resize_factor, fy=resize_factor)
+
+        x, _, _ = xfeat.preprocess_tensor(image)
+        images.append(x.cpu())
+
+    return images
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Calibrate and export an INT8 XFeat model")
+    parser.add_argument('--images', type=str, required=True,
+                        help="Folder of calibration images (png/jpg)")
+    parser.add_argument('--num-images', type=int, default=200,
+                        help="Maximum number of calibration images (default: 200)")
+    parser.add_argument('--max-dimension', type=int, default=600,
+                        help="Resize images so their longest side is at most this many pixels (default: 600)")
+    parser.add_argument('--backend', type=str, choices=['x86', 'fbgemm', 'qnnpack'], default='x86',
+                        help="Quantized engine to target (default: x86)")
+    parser.add_argument('--output', type=str,
+                        default=os.path.abspath(os.path.dirname(__file__)) + '/../../weights/xfeat-int8.pt',
+                        help="Where to save the INT8 state dict")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+
+    args = parse_args()
+
+    xfeat = XFeat()
+    images = load_calibration_images(xfeat, args.images, args.num_images, args.max_dimension)
+
+    print(f"Calibrating on {len(images)} images..")
+    quantized = quantize_xfeat(xfeat.net, images, backend = args.backend)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok = True)
+    torch.save(quantized.state_dict(), args.output)
+    print('saved int8 weights to: ' + args.output)
@@ -0,0 +1,110 @@
+"""
+	Export XFeatModel to ONNX & TorchScript and load the exported graphs as drop-in backbones for XFeat.
+	Only the backbone & heads are exported, NMS / top-k / interpolation stay in modules.xfeat.
+
+	Usage:
+		python3 -m modules.export --onnx weights/xfeat.onnx --torchscript weights/xfeat.ts
+"""
+
+import argparse, os
+import numpy as np
+import torch
+
+from modules.model import XFeatModel
+
+WEIGHTS_DIR = os.path.abspath(os.path.dirname(__file__)) + '/../weights'
+
+OUTPUT_NAMES = ['feats', 'keypoints', 'heatmap']
+
+
+def example_input(height = 480, width = 640):
+	""" Grayscale image tensor with H & W multiples of 32, as produced by XFeat.preprocess_tensor """
+	return torch.rand(1, 1, height, width)
+
+@torch.no_grad()
+def export_onnx(net, path, opset = 17):
+	"""
+		Export XFeatModel to ONNX with dynamic batch, height & width.
+		H & W must be multiples of 32 at inference, like every input that goes through XFeat.preprocess_tensor.
+	"""
+	net = net.cpu().eval()
+	dynamic_axes = {'image': {0: 'batch', 2: 'height', 3: 'width'}}
+	for name in OUTPUT_NAMES:
+		dynamic_axes[name] = {0: 'batch', 2: 'height_8', 3: 'width_8'}
+
+	torch.onnx.export(net, (example_input(),), path,
+					  input_names = ['image'],
+					  output_names = OUTPUT_NAMES,
+					  dynamic_axes = dynamic_axes,
+					  opset_version = opset)
+
+@torch.no_grad()
+def export_torchscript(net, path):
+	""" Trace XFeatModel to TorchScript. Feature map sizes are traced from the input shape, so any H & W multiple of 32 works. """
+	net = net.cpu().eval()
+	traced = torch.jit.trace(net, example_input())
+	traced.save(path)
+
+def load_torchscript(path, device = 'cpu'):
+	print('loading TorchScript backbone from: ' + path)
+	module = torch.jit.load(path, map_location=device).eval()
+	return torch.jit.optimize_for_inference(torch.jit.freeze(module))
+
+def import_onnxruntime():
+	""" onnxruntime is not a project dependency, only the onnx backend needs it """
+	try:
+		import onnxruntime
+	except ImportError:
+		raise RuntimeError('XFEAT_BACKEND=onnx relies on onnxruntime, which is not installed. '
+						   'Install with: pip install onnxruntime, or use XFEAT_BACKEND=torch') from None
+	return onnxruntime
+
+class OnnxRuntimeBackbone:
+	"""
+		Runs an exported XFeatModel with ONNX Runtime on CPU.
+		Called like XFeatModel: takes a (B, C, H, W) tensor and returns (feats, keypoints, heatmap) tensors.
+	"""
+
+	def __init__(self, path, num_threads = None):
+		ort = import_onnxruntime()
+
+		print('loading ONNX backbone from: ' + path)
+		options = ort.SessionOptions()
+		options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+		if num_threads is not None:
+			options.intra_op_num_threads = num_threads
+
+		self.session = ort.InferenceSession(path, sess_options=options, providers=['CPUExecutionProvider'])
+
+	def __call__(self, x):
+		x = np.ascontiguousarray(x.detach().cpu().numpy(), dtype=np.float32)
+		outputs = self.session.run(OUTPUT_NAMES, {'image': x})
+		return tuple(torch.from_numpy(output) for output in outputs)
+
+def parse_args():
+	parser = argparse.ArgumentParser(description="Export XFeatModel to ONNX and / or TorchScript")
+	parser.add_argument('--weights', type=str, default=WEIGHTS_DIR + '/xfeat.pt',
+						help="fp32 XFeat weights to export")
+	parser.add_argument('--onnx', type=str, default=WEIGHTS_DIR + '/xfeat.onnx',
+						help="Output ONNX file, empty to skip")
+	parser.add_argument('--torchscript', type=str, default=WEIGHTS_DIR + '/xfeat.ts',
+						help="Output TorchScript file, empty to skip")
+	parser.add_argument('--opset', type=int, default=17,
+						help="ONNX opset version (default: 17)")
+	return parser.parse_args()
+
+
+if __name__ == '__main__':
+
+	args = parse_args()
+
+	net = XFeatModel().eval()
+	net.load_state_dict(torch.load(args.weights, map_location='cpu'))
+
+	if args.onnx:
+		export_onnx(net, args.onnx, opset = args.opset)
+		print('saved ONNX model to: ' + args.onnx)
+
+	if args.torchscript:
+		export_torchscript(net, args.torchscript)
+		print('saved TorchScript model to: ' + args.torchscript)
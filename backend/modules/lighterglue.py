@@ -1,5 +1,5 @@
 
-from kornia.feature.lightglue import LightGlue
+from kornia.feature.lightglue import LightGlue, normalize_keypoints, filter_matches, sigmoid_log_double_softmax
 from torch import nn
 import torch
 import os
@@ -26,14 +26,16 @@ class LighterGlue(nn.Module):
     "weights": None,
     }
 
-    def __init__(self, weights = os.path.abspath(os.path.dirname(__file__)) + '/../weights/xfeat-lighterglue.pt'):
+    def __init__(self, weights = os.path.abspath(os.path.dirname(__file__)) + '/../weights/xfeat-lighterglue.pt', allow_download = True):
         super().__init__()
         LightGlue.default_conf = self.default_conf_xfeat
         self.net = LightGlue(None)
         self.dev = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 
-        if os.path.exists(weights):
+        if weights is not None and os.path.exists(weights):
             state_dict = torch.load(weights, map_location=self.dev)
+        elif not allow_download:
+            raise RuntimeError(f'LighterGlue weights {weights} not found')
         else:
             state_dict = torch.hub.load_state_dict_from_url("https://github.com/verlab/accelerated_features/raw/main/weights/xfeat-lighterglue.pt")
 
@@ -55,3 +57,64 @@ class LighterGlue(nn.Module):
                                'image1': {'keypoints': data['keypoints1'], 'descriptors': data['descriptors1'], 'image_size': data['image_size1']}  
                            } )
         return result
+
+    @torch.inference_mode()
+    def forward_batch(self, data, min_conf = 0.1):
+        """
+            Match a batch of padded image pairs. Padded keypoints are excluded from attention
+            and from the assignment with the validity masks 'mask0' [B x M] and 'mask1' [B x N].
+            Point pruning and early stopping are not applied in this path.
+            return:
+                matches: List[[Si x 2]] indices of the matching keypoints for each pair
+                scores: List[[Si]] matching scores
+        """
+        net = self.net
+        mask0 = data['mask0'][..., None]
+        mask1 = data['mask1'][..., None]
+        # Attention runs on [B x heads x N x D], its masks need the head dimension or
+        # [B x N x M] masks broadcast against the batch into [B x B x N x M]
+        attention_mask0 = data['mask0'][:, None, :, None]
+        attention_mask1 = data['mask1'][:, None, :, None]
+
+        kpts0 = normalize_keypoints(data['keypoints0'], data['image_size0']).clone()
+        kpts1 = normalize_keypoints(data['keypoints1'], data['image_size1']).clone()
+
+        desc0 = net.input_proj(data['descriptors0'].contiguous())
+        desc1 = net.input_proj(data['descriptors1'].contiguous())
+
+        encoding0 = net.posenc(kpts0)
+        encoding1 = net.posenc(kpts1)
+
+        for i in range(net.conf.n_layers):
+            desc0, desc1 = net.transformers[i](desc0, desc1, encoding0, encoding1,
+                                                 mask0 = attention_mask0, mask1 = attention_mask1)
+            # Fully masked padding rows can come out as NaN, keep them at zero
+            desc0 = desc0.masked_fill(~mask0, 0.)
+            desc1 = desc1.masked_fill(~mask1, 0.)
+
+        # Same as MatchAssignment.forward, with padded pairs removed before the double softmax
+        assignment = net.log_assignment[net.conf.n_layers - 1]
+        mdesc0, mdesc1 = assignment.final_proj(desc0), assignment.final_proj(desc1)
+        d = mdesc0.shape[-1]
+        mdesc0, mdesc1 = mdesc0 / d**.25, mdesc1 / d**.25
+        sim = torch.einsum("bmd,bnd->bmn", mdesc0, mdesc1)
+
+        invalid = ~(mask0 & mask1.transpose(-1, -2))
+        sim = sim.masked_fill(invalid, -1e4)
+
+        scores = sigmoid_log_double_softmax(sim, assignment.matchability(desc0), assignment.matchability(desc1))
+        scores[:, :-1, :-1] = scores[:, :-1, :-1].masked_fill(invalid, float('-inf'))
+        scores[:, :-1, -1] = scores[:, :-1, -1].masked_fill(~mask0[..., 0], float('-inf'))
+        scores[:, -1, :-1] = scores[:, -1, :-1].masked_fill(~mask1[..., 0], float('-inf'))
+
+        m0, _, mscores0, _ = filter_matches(scores, min_conf)
+
+        matches, mscores = [], []
+        for b in range(len(m0)):
+            valid = m0[b] > -1
+            m_indices_0 = torch.where(valid)[0]
+            m_indices_1 = m0[b][valid]
+            matches.append(torch.stack([m_indices_0, m_indices_1], -1))
+            mscores.append(mscores0[b][valid])
+
+        return {'matches': matches, 'scores': mscores}
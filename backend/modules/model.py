@@ -4,11 +4,37 @@
 """
 
 
+import copy
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 import time
 
+@torch.no_grad()
+def fold_batchnorm(layer, bn):
+	"""
+		Fold an eval-mode BatchNorm into the preceding Conv2d / Linear.
+		BN(Wx + b) = (W * s) x + (b - mean) * s + beta, with s = gamma / sqrt(var + eps)
+	"""
+	scale = torch.rsqrt(bn.running_var + bn.eps)
+	shift = -bn.running_mean * scale
+	if bn.affine:
+		scale = scale * bn.weight
+		shift = shift * bn.weight + bn.bias
+
+	bias = layer.bias if layer.bias is not None else torch.zeros_like(bn.running_mean)
+
+	if isinstance(layer, nn.Conv2d):
+		fused = nn.Conv2d(layer.in_channels, layer.out_channels, layer.kernel_size, stride=layer.stride,
+						  padding=layer.padding, dilation=layer.dilation, groups=layer.groups, bias=True)
+		fused.weight.copy_(layer.weight * scale.view(-1, 1, 1, 1))
+	else:
+		fused = nn.Linear(layer.in_features, layer.out_features, bias=True)
+		fused.weight.copy_(layer.weight * scale.view(-1, 1))
+
+	fused.bias.copy_(bias * scale + shift)
+	return fused.to(layer.weight.device)
+
 class BasicLayer(nn.Module):
 	"""
 	  Basic Convolutional Layer: Conv2d -> BatchNorm -> ReLU
@@ -110,14 +136,47 @@ class XFeatModel(nn.Module):
 											nn.Linear(512, 64),
 										)
 
+	@torch.no_grad()
+	def fuse_for_inference(self, check_input = None, atol = 1e-3):
+		"""
+			Returns an inference-only copy of the model with every BatchNorm folded into the preceding conv / linear layer.
+			input:
+				check_input -> torch.Tensor(B, C, H, W): if given, both models are run on it and a RuntimeError is raised
+							   if the outputs differ by more than atol
+		"""
+		fused = copy.deepcopy(self).eval()
+
+		for module in list(fused.modules()):
+			if not isinstance(module, nn.Sequential):
+				continue
+			for i in range(len(module) - 1):
+				if isinstance(module[i], (nn.Conv2d, nn.Linear)) and isinstance(module[i+1], (nn.BatchNorm2d, nn.BatchNorm1d)):
+					module[i] = fold_batchnorm(module[i], module[i+1])
+					module[i+1] = nn.Identity()
+
+		if check_input is not None:
+			was_training = self.training
+			self.eval()
+			for name, reference, output in zip(['feats', 'keypoints', 'heatmap'], self(check_input), fused(check_input)):
+				error = (reference - output).abs().max().item()
+				if error > atol:
+					raise RuntimeError(f'BatchNorm folding changed {name} by {error:.2e} (atol {atol:.0e})')
+
+			#Fine matcher on the same random range as the descriptors it refines
+			mlp_input = torch.randn(16, 128, device=check_input.device)
+			error = (self.fine_matcher(mlp_input) - fused.fine_matcher(mlp_input)).abs().max().item()
+			if error > atol:
+				raise RuntimeError(f'BatchNorm folding changed fine_matcher by {error:.2e} (atol {atol:.0e})')
+			self.train(was_training)
+
+		return fused
+
 	def _unfold2d(self, x, ws = 2):
 		"""
-			Unfolds tensor in 2D with desired ws (window size) and concat the channels
+			Unfolds tensor in 2D with desired ws (window size) and concat the channels.
+			Same channel order as unfold + permute, but exports to ONNX with dynamic H & W.
 		"""
-		B, C, H, W = x.shape
-		x = x.unfold(2,  ws , ws).unfold(3, ws,ws)                             \
-			.reshape(B, C, H//ws, W//ws, ws**2)
-		return x.permute(0, 1, 4, 2, 3).reshape(B, -1, H//ws, W//ws)
+		return F.pixel_unshuffle(x, ws)
 
 
 	def forward(self, x):
@@ -135,6 +194,12 @@ class XFeatModel(nn.Module):
 			x = x.mean(dim=1, keepdim = True)
 			x = self.norm(x)
 
+		return self.forward_normalized(x)
+
+	def forward_normalized(self, x):
+		"""
+			Backbone & heads on an already normalized grayscale image, the part of forward() that is INT8 quantized.
+		"""
 		#main backbone
 		x1 = self.block1(x)
 		x2 = self.block2(x1 + self.skip1(x))
@@ -0,0 +1,92 @@
+"""
+	Static post-training INT8 quantization of the XFeat backbone & heads for CPU inference.
+	Uses PyTorch FX graph mode: Conv-BN-ReLU layers are fused, activations are calibrated on sample images
+	and the convolutions run as int8 kernels. Input normalization stays in fp32, outside the traced graph,
+	so the graph starts with a single quantize of the normalized image.
+"""
+
+import copy
+
+import torch
+import torch.nn as nn
+from torch.ao.quantization import get_default_qconfig_mapping
+from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+
+class _NormalizedXFeat(nn.Module):
+	""" Traced part of XFeatModel: forward() after the input normalization """
+	def __init__(self, net):
+		super().__init__()
+		self.net = net
+
+	def forward(self, x):
+		return self.net.forward_normalized(x)
+
+class QuantizedXFeatModel(nn.Module):
+	"""
+		Called like XFeatModel: fp32 grayscale conversion & InstanceNorm, then the int8 graph.
+	"""
+	def __init__(self, norm, graph):
+		super().__init__()
+		self.norm = norm
+		self.graph = graph
+
+	def forward(self, x):
+		x = x.mean(dim=1, keepdim = True)
+		x = self.norm(x)
+		return self.graph(x)
+
+def get_qconfig_mapping(backend = 'x86'):
+	torch.backends.quantized.engine = backend
+	return get_default_qconfig_mapping(backend)
+
+def prepare_xfeat_int8(net, example_input, backend = 'x86'):
+	"""
+		Insert observers into the traced backbone & heads of a copy of an fp32 XFeatModel.
+		input:
+			net -> XFeatModel: fp32 model with loaded weights
+			example_input -> torch.Tensor(1, 1, H, W): normalized grayscale image
+	"""
+	net = copy.deepcopy(net).cpu().eval()
+	return prepare_fx(_NormalizedXFeat(net), get_qconfig_mapping(backend), example_inputs=(example_input,))
+
+def normalize_input(net, x):
+	""" The fp32 part of XFeatModel.forward(), the input of the traced graph """
+	return net.norm(x.cpu().mean(dim=1, keepdim = True))
+
+@torch.no_grad()
+def quantize_xfeat(net, calibration_images, backend = 'x86'):
+	"""
+		Calibrate activation ranges on sample images and convert XFeatModel to int8.
+		input:
+			net -> XFeatModel: fp32 model with loaded weights
+			calibration_images -> List[torch.Tensor(1, C, H, W)]: preprocessed images, H & W multiples of 32
+		return:
+			QuantizedXFeatModel: quantized model with the same inputs & outputs as XFeatModel
+	"""
+	net = net.cpu().eval()
+	prepared = prepare_xfeat_int8(net, normalize_input(net, calibration_images[0]), backend)
+	for x in calibration_images:
+		prepared(normalize_input(net, x))
+
+	return QuantizedXFeatModel(copy.deepcopy(net.norm), convert_fx(prepared)).eval()
+
+@torch.no_grad()
+def load_quantized_xfeat(net, weights, backend = 'x86'):
+	"""
+		Rebuild the quantized graph of an XFeatModel and load int8 weights saved by quantize_xfeat.
+		The saved state dict carries the calibrated scales & zero points.
+	"""
+	net = net.cpu().eval()
+	example_input = normalize_input(net, torch.rand(1, 1, 64, 64))
+	prepared = prepare_xfeat_int8(net, example_input, backend)
+	#Observers need one pass to produce valid quantization params before convert, they are overwritten below
+	prepared(example_input)
+	quantized = QuantizedXFeatModel(copy.deepcopy(net.norm), convert_fx(prepared))
+
+	if isinstance(weights, str):
+		print('loading int8 weights from: ' + weights)
+		weights = torch.load(weights, map_location='cpu')
+
+	quantized.load_state_dict(weights)
+	return quantized.eval()
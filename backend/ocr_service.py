@@ -0,0 +1,428 @@
+import asyncio
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+
+from metrics import metrics
+
+def image_digest(image: np.ndarray):
+    """
+    SHA-256 of the decoded pixels and their shape. Only identical images share a digest; a
+    perceptual hash would also match screens that differ in a few characters of text.
+
+    Returns:
+        str: 64 hex digits.
+    """
+    digest = hashlib.sha256(f"{image.shape}|{image.dtype}|".encode())
+    digest.update(np.ascontiguousarray(image).data)
+    return digest.hexdigest()
+
+def perceptual_hash(image: np.ndarray):
+    """
+    64-bit difference hash of the grayscale image. Only finds near-duplicate candidates, screens
+    that differ in a few characters share it too, see verify_near_duplicate.
+
+    Returns:
+        int: Hash bits.
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int(np.packbits(bits).view('>u8')[0])
+
+def hash_distance(hash0, hash1):
+    return bin(hash0 ^ hash1).count('1')
+
+def verify_near_duplicate(image, reference, homography, max_dimension=1280, tile=32, max_outliers=2):
+    """
+    Check that image shows the same content as reference, given a rough homography from
+    reference to image, e.g. from XFeat matching. The homography is refined to subpixel accuracy
+    with ECC, then the warped reference has to reproduce image up to a gain and offset: in every
+    tile, at most max_outliers pixels may differ by more than the reference does within half a
+    pixel, so a changed character is found but resampling and compression noise are not.
+
+    Args:
+        image (np.ndarray): New capture.
+        reference (np.ndarray): Image the cached read results belong to.
+        homography (np.ndarray): 3x3 reference to image homography.
+        max_dimension (int): Working resolution of the check.
+        tile (int): Tile size in working resolution pixels.
+        max_outliers (int): Differing pixels allowed per tile.
+
+    Returns:
+        np.ndarray: Refined homography from reference to image, or None if they differ.
+    """
+    image_scale = min(1.0, max_dimension / max(image.shape[:2]))
+    reference_scale = min(1.0, max_dimension / max(reference.shape[:2]))
+    gray = _working_gray(image, image_scale)
+    reference_gray = _working_gray(reference, reference_scale)
+    height, width = gray.shape
+
+    # Homography between the working resolution images
+    to_image = np.diag([image_scale, image_scale, 1.0])
+    from_reference = np.diag([1.0 / reference_scale, 1.0 / reference_scale, 1.0])
+    warp = to_image @ np.asarray(homography, dtype=np.float64) @ from_reference
+
+    # ECC aligns the reference to the image, its warp maps image to reference coordinates
+    try:
+        inverse = np.linalg.inv(warp)
+        criteria = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 50, 1e-4)
+        _, inverse = cv2.findTransformECC(gray, reference_gray, (inverse / inverse[2, 2]).astype(np.float32),
+                                          cv2.MOTION_HOMOGRAPHY, criteria, None, 5)
+        warp = np.linalg.inv(inverse.astype(np.float64))
+    except (cv2.error, np.linalg.LinAlgError) as error:
+        print(f"Near-duplicate alignment failed: {error}")
+        return None
+
+    # Both images have to show the same area, text outside the other image would be missed or misplaced
+    covered = cv2.warpPerspective(np.ones(reference_gray.shape, np.uint8), warp, (width, height), flags=cv2.INTER_NEAREST)
+    covering = cv2.warpPerspective(np.ones(gray.shape, np.uint8), np.linalg.inv(warp), reference_gray.shape[::-1],
+                                   flags=cv2.INTER_NEAREST)
+    if covered.mean() < 0.9 or covering.mean() < 0.9:
+        return None
+
+    # The warped reference and versions of it shifted by half a pixel, the alignment tolerance
+    warped = np.stack([
+        cv2.warpPerspective(reference_gray, np.array([[1, 0, dx], [0, 1, dy], [0, 0, 1]]) @ warp, (width, height),
+                            flags=cv2.INTER_LINEAR)
+        for dx, dy in ((0, 0), (0.5, 0), (-0.5, 0), (0, 0.5), (0, -0.5))
+    ])
+    # Away from the border, which is only partly covered
+    valid = cv2.erode(covered, np.ones((5, 5), np.uint8)) > 0
+
+    # Exposure differs between captures
+    gain, offset = np.polyfit(warped[0][valid], gray[valid], 1)
+    warped = gain * warped + offset
+
+    residual = np.maximum(gray - warped.max(axis=0), warped.min(axis=0) - gray)
+    outliers = ((residual > 60) & valid).astype(np.float32)
+    rows, columns = height // tile, width // tile
+    outliers_per_tile = outliers[:rows * tile, :columns * tile].reshape(rows, tile, columns, tile).sum(axis=(1, 3))
+    if outliers_per_tile.max(initial=0) > max_outliers:
+        return None
+
+    return np.linalg.inv(to_image) @ warp @ np.linalg.inv(from_reference)
+
+def _working_gray(image, scale):
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    if scale < 1.0:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return gray.astype(np.float32)
+
+def warp_read_results(read_results, homography, width, height):
+    """
+    Read result dicts of a reference image, with the bounding boxes of lines and words mapped
+    through homography into an image of width x height.
+    """
+    homography = np.asarray(homography, dtype=np.float64)
+
+    def warp_box(box):
+        points = np.asarray(box, dtype=np.float64).reshape(-1, 1, 2)
+        return cv2.perspectiveTransform(points, homography).flatten().tolist()
+
+    warped_results = json.loads(json.dumps(read_results))
+    for read_result in warped_results:
+        read_result['width'] = width
+        read_result['height'] = height
+        for line in read_result.get('lines', []):
+            line['bounding_box'] = warp_box(line['bounding_box'])
+            for word in line.get('words', []):
+                word['bounding_box'] = warp_box(word['bounding_box'])
+    return warped_results
+
+def to_read_results(read_results):
+    """
+    Convert plain read result dicts to the attribute objects the rest of the backend reads,
+    e.g. read_result.lines[0].bounding_box.
+    """
+    return json.loads(json.dumps(read_results), object_hook=lambda d: SimpleNamespace(**d))
+
+
+class AzureReadOcrProvider:
+    """
+    Azure Computer Vision Read API.
+    """
+
+    name = 'azure'
+
+    def __init__(self, computer_vision_client, poll_interval=1.0):
+        self.computer_vision_client = computer_vision_client
+        self.poll_interval = poll_interval
+
+    async def read(self, image_bytes):
+        """
+        Returns:
+            list: Read result dicts, one per page, each with 'width', 'height' and 'lines'.
+        """
+        # The SDK client is blocking, its requests run on a thread and the polling waits on the event loop
+        result = await asyncio.to_thread(
+            self.computer_vision_client.read_in_stream, io.BytesIO(image_bytes), language='en', raw=True
+        )
+        operation_id = result.headers["Operation-Location"].split("/")[-1]
+
+        while True:
+            read_result = await asyncio.to_thread(self.computer_vision_client.get_read_result, operation_id)
+            if read_result.status not in ['notStarted', 'running']:
+                break
+            await asyncio.sleep(self.poll_interval)
+
+        if read_result.status != 'succeeded':
+            raise RuntimeError(f"Azure Read failed with status {read_result.status}")
+
+        return [page.as_dict() for page in read_result.analyze_result.read_results]
+
+
+class LocalOcrProvider:
+    """
+    Offline stand-in for the Read API: returns the read results recorded in a JSON file in the
+    Read API response format, e.g. test_data_video.json, for every image.
+    """
+
+    name = 'local'
+
+    def __init__(self, data_path, delay_ms=0):
+        """
+        Args:
+            data_path (str): Recorded Read API response.
+            delay_ms (float): Simulated OCR latency.
+        """
+        with open(data_path, 'r') as file:
+            self.read_results = json.load(file)['readResults']
+        self.delay_ms = delay_ms
+
+    async def read(self, image_bytes):
+        if self.delay_ms > 0:
+            await asyncio.sleep(self.delay_ms / 1000)
+        return self.read_results
+
+
+class _CachedRead:
+    __slots__ = ('read_results', 'image_hash', 'image_bytes')
+
+    def __init__(self, read_results, image_hash=None, image_bytes=None):
+        self.read_results = read_results
+        # Perceptual hash and encoded image, only for near-duplicate lookups, not kept on disk
+        self.image_hash = image_hash
+        self.image_bytes = image_bytes
+
+class OcrService:
+    """
+    Runs OCR on source images through a provider and caches the results by digest of the
+    decoded image, in memory with LRU eviction and optionally on disk. Cache entries and
+    running provider calls are kept per session by default, so one session's results are
+    never served to another; with shared, sessions and, through the disk cache, worker
+    processes reuse each other's results for identical images.
+
+    With align, a new capture of a screen read before, e.g. taken again from a slightly different
+    position, reuses the memory cached text too: entries whose perceptual hash is close are
+    aligned to the capture and only reused if the aligned pixels match, see verify_near_duplicate.
+    """
+
+    # Perceptual hash bits a near-duplicate candidate may differ in, and candidates checked per image
+    NEAR_DUPLICATE_BITS = 12
+    NEAR_DUPLICATE_CANDIDATES = 2
+
+    def __init__(self, provider, cache_size=64, cache_dir=None, shared=False, align=None):
+        """
+        Args:
+            provider: Object with a name and an async read(image_bytes) returning read result dicts.
+            cache_size (int): Results kept in memory over all sessions, 0 disables the memory cache.
+            cache_dir (str): Directory for cached results as JSON files, None disables the disk cache.
+                             Entries on disk are not tied to a session, so it requires shared.
+            shared (bool): Share cache entries and running provider calls between sessions.
+            align: Function (reference_image, image) returning a rough 3x3 homography from the
+                   reference to the image, or None if they don't match; None disables near-duplicates.
+        """
+        if cache_dir and not shared:
+            raise ValueError("The OCR disk cache is shared by all sessions, it requires OCR_CACHE_SCOPE=shared")
+
+        self.provider = provider
+        self.cache_size = cache_size
+        self.cache_dir = cache_dir
+        self.shared = shared
+        self.align = align
+
+        self.lock = threading.Lock()
+        # (scope, image digest) -> _CachedRead, scope is the session id or None when shared
+        self.cache = OrderedDict()
+
+        # Running provider calls by (scope, image digest), so concurrent captures of one image share a call
+        self.in_flight = {}
+
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    @classmethod
+    def from_env(cls, computer_vision_client, align=None):
+        provider_name = os.getenv('OCR_PROVIDER', 'local')
+        if provider_name == 'azure':
+            provider = AzureReadOcrProvider(computer_vision_client)
+        elif provider_name == 'local':
+            data_path = os.getenv('OCR_LOCAL_DATA', os.path.join(os.path.dirname(__file__), 'test_data_video.json'))
+            provider = LocalOcrProvider(data_path, float(os.getenv('OCR_LOCAL_DELAY_MS', '0')))
+        else:
+            raise ValueError(f"Unknown OCR provider '{provider_name}', expected 'azure' or 'local'")
+
+        scope = os.getenv('OCR_CACHE_SCOPE', 'session')
+        if scope not in ('session', 'shared'):
+            raise ValueError(f"Unknown OCR cache scope '{scope}', expected 'session' or 'shared'")
+
+        return cls(
+            provider,
+            cache_size=int(os.getenv('OCR_CACHE_SIZE', '64')),
+            cache_dir=os.getenv('OCR_CACHE_DIR') or None,
+            shared=scope == 'shared',
+            align=align if os.getenv('OCR_NEAR_DUPLICATES', '1') == '1' else None
+        )
+
+    async def recognize(self, image: np.ndarray, image_bytes, session_id=None):
+        """
+        OCR a source image, from the cache if the same image, or with align a verified
+        near-duplicate of it, was read before.
+        Runs on the event loop, the provider call and the near-duplicate check do not block it.
+
+        Args:
+            image (np.ndarray): Decoded image, used for the cache key.
+            image_bytes (bytes): Encoded image sent to the provider, kept for near-duplicate checks.
+            session_id (str): Session the image belongs to, the cache scope unless shared.
+
+        Returns:
+            list: Read results, or None if OCR failed.
+        """
+        metrics.increment('ocr_requests')
+        # Hashing a full resolution image takes a few milliseconds, off the event loop
+        digest, image_hash = await asyncio.to_thread(lambda: (image_digest(image), perceptual_hash(image)))
+        key = (None if self.shared else session_id, digest)
+
+        read_results = self.__get_cached(key)
+        if read_results is not None:
+            metrics.increment('ocr_cache_hits')
+            print(f"OCR cache hit for image {key[1][:16]}")
+            return to_read_results(read_results)
+
+        if key in self.in_flight:
+            print(f"Waiting for running OCR of image {key[1][:16]}")
+            read_results = await asyncio.shield(self.in_flight[key])
+            return to_read_results(read_results) if read_results is not None else None
+
+        if self.align is not None:
+            read_results = await self.__read_near_duplicate(key, image, image_bytes, image_hash)
+            if read_results is not None:
+                metrics.increment('ocr_near_duplicate_hits')
+                return to_read_results(read_results)
+
+        # A task of its own, so cancelling one waiting caller does not cancel the call for the others
+        task = asyncio.create_task(self.__read(key, image_bytes, image_hash))
+        self.in_flight[key] = task
+        task.add_done_callback(lambda _: self.in_flight.pop(key, None))
+
+        read_results = await asyncio.shield(task)
+        return to_read_results(read_results) if read_results is not None else None
+
+    async def __read_near_duplicate(self, key, image, image_bytes, image_hash):
+        """
+        Read results of a cached near-duplicate of image in the same scope, mapped into image,
+        or None if no candidate passes verify_near_duplicate.
+        """
+        with self.lock:
+            candidates = [
+                cached for (scope, _), cached in self.cache.items()
+                if scope == key[0] and cached.image_hash is not None
+                and hash_distance(cached.image_hash, image_hash) <= self.NEAR_DUPLICATE_BITS
+            ]
+        candidates.sort(key=lambda cached: hash_distance(cached.image_hash, image_hash))
+
+        for cached in candidates[:self.NEAR_DUPLICATE_CANDIDATES]:
+            start_time = time.perf_counter()
+            homography = await asyncio.to_thread(self.__verify_near_duplicate, image, cached.image_bytes)
+            print(f"OCR near-duplicate check took {time.perf_counter() - start_time:.2f} seconds")
+            if homography is None:
+                continue
+
+            height, width = image.shape[:2]
+            read_results = warp_read_results(cached.read_results, homography, width, height)
+            print(f"OCR near-duplicate hit for image {key[1][:16]}")
+            self.__put_cached(key, read_results, image_hash, image_bytes)
+            return read_results
+
+        return None
+
+    def __verify_near_duplicate(self, image, reference_bytes):
+        reference = cv2.imdecode(np.frombuffer(reference_bytes, np.uint8), cv2.IMREAD_COLOR)
+        if reference is None:
+            return None
+
+        homography = self.align(reference, image)
+        if homography is None:
+            return None
+
+        return verify_near_duplicate(image, reference, homography)
+
+    async def __read(self, key, image_bytes, image_hash):
+        try:
+            start_time = time.perf_counter()
+            read_results = await self.provider.read(image_bytes)
+            print(f"OCR with {self.provider.name} provider took {time.perf_counter() - start_time:.2f} seconds")
+        except Exception as error:
+            print(f"Error analyzing image: {error}")
+            return None
+
+        self.__put_cached(key, read_results, image_hash, image_bytes)
+        return read_results
+
+    def __get_cached(self, key):
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key].read_results
+
+        path = self.__cache_path(key)
+        if path is None or not os.path.exists(path):
+            return None
+
+        try:
+            with open(path, 'r') as file:
+                read_results = json.load(file)
+        except (OSError, ValueError) as error:
+            print(f"Ignoring unreadable OCR cache file {path}: {error}")
+            return None
+
+        self.__remember(key, _CachedRead(read_results))
+        return read_results
+
+    def __put_cached(self, key, read_results, image_hash, image_bytes):
+        self.__remember(key, _CachedRead(read_results, image_hash, image_bytes))
+
+        path = self.__cache_path(key)
+        if path is None:
+            return
+
+        # Write next to the target and rename, so workers never read a partial file
+        with tempfile.NamedTemporaryFile('w', dir=self.cache_dir, suffix='.tmp', delete=False) as temp_file:
+            json.dump(read_results, temp_file)
+        os.replace(temp_file.name, path)
+
+    def __remember(self, key, cached):
+        if self.cache_size <= 0:
+            return
+
+        with self.lock:
+            self.cache[key] = cached
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def __cache_path(self, key):
+        if not self.cache_dir:
+            return None
+        # Results of different providers are kept apart
+        return os.path.join(self.cache_dir, f"{self.provider.name}-{key[1]}.json")
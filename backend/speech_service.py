@@ -13,6 +13,8 @@ from typing import TYPE_CHECKING
 
 from fastapi import WebSocket
 
+from metrics import metrics
+
 if TYPE_CHECKING:
     from vision_instance import VisionInstance
 
@@ -201,6 +203,7 @@ class ContinuousSpeechService:
 
                         if usage: 
                             self.tokenUsageCount += usage.get('total_tokens', 0)
+                            metrics.increment('speech_tokens', usage.get('total_tokens', 0))
                             print(f"Debug: Total tokens used: {self.tokenUsageCount}")
 
                         function_calls = event.get('response', {}).get('output', [])
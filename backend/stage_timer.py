@@ -0,0 +1,69 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+class StageTimer:
+    """
+    Collects the duration of each stage of a single step, in milliseconds.
+    """
+
+    def __init__(self):
+        self.timings = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - start) * 1000.0)
+
+    def add(self, name, duration_ms):
+        # A stage can run more than once per step, e.g. encoding both debug images
+        self.timings[name] = self.timings.get(name, 0.0) + duration_ms
+
+class LatencyHistogram:
+    """
+    Rolling window of per-stage step timings with percentile summaries.
+    Steps record from worker threads and the event loop, so access is locked.
+    """
+
+    def __init__(self, window=500):
+        self.window = window
+        self.samples = {}
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def record(self, timings):
+        with self.lock:
+            for stage, duration_ms in timings.items():
+                if stage not in self.samples:
+                    self.samples[stage] = deque(maxlen=self.window)
+                    self.counts[stage] = 0
+                self.samples[stage].append(duration_ms)
+                self.counts[stage] += 1
+
+    def summary(self, percentiles=(50, 90, 99)):
+        """
+        Returns:
+            dict: For each stage, the total sample count and the requested percentiles (ms)
+                  over the rolling window, e.g. {'lighterglue': {'count': 10, 'p50': 12.3, ...}}
+        """
+        with self.lock:
+            snapshot = {stage: (np.array(samples), self.counts[stage]) for stage, samples in self.samples.items()}
+
+        result = {}
+        for stage, (samples, count) in snapshot.items():
+            values = np.percentile(samples, percentiles)
+            stage_summary = {'count': count}
+            for percentile, value in zip(percentiles, values):
+                stage_summary[f'p{percentile}'] = round(float(value), 3)
+            result[stage] = stage_summary
+
+        return result
+
+# Timings of every session's steps in this process
+process_latency = LatencyHistogram(window=5000)
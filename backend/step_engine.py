@@ -0,0 +1,56 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+
+class StepEngine:
+    """
+    Runs the CPU-bound part of each step (decode, hand detection, matching, drawing, encode)
+    on a worker pool so the asyncio event loop only handles WebSocket and speech I/O.
+
+    Threads are used rather than processes: the per-session state and the shared models
+    live in this process, and OpenCV, MediaPipe and PyTorch release the GIL in their
+    native code, so the work still spreads across cores.
+    """
+
+    def __init__(self, max_workers=None):
+        if max_workers is None:
+            max_workers = int(os.getenv('STEP_WORKERS', os.cpu_count() or 1))
+
+        self.max_workers = max(1, max_workers)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='step-worker')
+
+        # Only touched from the event loop thread
+        self.pending_jobs = 0
+
+        # Split the cores between the workers instead of letting every concurrent
+        # forward pass spawn an intra-op thread per core
+        torch_threads = os.getenv('STEP_TORCH_THREADS')
+        if torch_threads is None:
+            torch_threads = max(1, (os.cpu_count() or 1) // self.max_workers)
+        torch.set_num_threads(int(torch_threads))
+
+        print(f"Step engine started with {self.max_workers} workers, {torch.get_num_threads()} torch threads each")
+
+    @property
+    def queue_depth(self):
+        """
+        Number of submitted jobs that are waiting for a free worker.
+        """
+        return max(0, self.pending_jobs - self.max_workers)
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Run fn(*args, **kwargs) on the worker pool and await its result.
+        """
+        loop = asyncio.get_running_loop()
+        self.pending_jobs += 1
+        try:
+            return await loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+        finally:
+            self.pending_jobs -= 1
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
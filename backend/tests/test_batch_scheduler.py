@@ -0,0 +1,146 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from batch_scheduler import XFeatBatchScheduler
+
+
+class FakeXFeat:
+    """
+    Stands in for XFeat.detectAndCompute: returns each image's first pixel value as its output
+    and records the batch sizes it was called with.
+    """
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def detectAndCompute(self, x, top_k=None):
+        if isinstance(x, np.ndarray):
+            x = torch.from_numpy(x).permute(2, 0, 1)[None]
+        with self.lock:
+            self.calls.append(len(x))
+        time.sleep(self.delay)
+        return [{'value': int(image[0, 0, 0]), 'top_k': top_k} for image in x]
+
+
+def image(value, shape=(64, 64, 3)):
+    return np.full(shape, value, dtype=np.uint8)
+
+
+def run_concurrently(scheduler, requests):
+    results = [None] * len(requests)
+
+    def call(index, request):
+        results[index] = scheduler.detect_and_compute(*request)
+
+    threads = [threading.Thread(target=call, args=(index, request)) for index, request in enumerate(requests)]
+    for thread in threads:
+        thread.start()
+        # Keep the arrival order deterministic
+        time.sleep(0.01)
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_lone_caller_runs_at_once():
+    xfeat = FakeXFeat()
+    scheduler = XFeatBatchScheduler(xfeat, max_concurrent=1)
+
+    start = time.perf_counter()
+    assert scheduler.detect_and_compute(image(7), 128) == {'value': 7, 'top_k': 128}
+    assert time.perf_counter() - start < 0.05
+    assert xfeat.calls == [1]
+
+
+def test_queued_callers_are_batched_by_shape_and_top_k():
+    xfeat = FakeXFeat(delay=0.2)
+    scheduler = XFeatBatchScheduler(xfeat, max_concurrent=1)
+
+    requests = [
+        (image(1), 128),                    # runs alone, the others queue behind it
+        (image(2), 128),
+        (image(3, (32, 64, 3)), 128),
+        (image(4), 128),
+        (image(5), 256),
+    ]
+    results = run_concurrently(scheduler, requests)
+
+    assert [result['value'] for result in results] == [1, 2, 3, 4, 5]
+    assert [result['top_k'] for result in results] == [128, 128, 128, 128, 256]
+    # 2 and 4 share a shape and top_k, 3 and 5 differ in one of them
+    assert sorted(xfeat.calls) == [1, 1, 1, 2]
+    assert scheduler.images_processed == 5
+
+
+def test_max_batch_size():
+    xfeat = FakeXFeat(delay=0.2)
+    scheduler = XFeatBatchScheduler(xfeat, max_batch_size=2, max_concurrent=1)
+
+    results = run_concurrently(scheduler, [(image(value), 128) for value in range(5)])
+
+    assert [result['value'] for result in results] == list(range(5))
+    assert xfeat.calls == [1, 2, 2]
+
+
+def test_callers_run_side_by_side_below_max_concurrent():
+    xfeat = FakeXFeat(delay=0.2)
+    scheduler = XFeatBatchScheduler(xfeat, max_concurrent=3)
+
+    start = time.perf_counter()
+    run_concurrently(scheduler, [(image(value), 128) for value in range(3)])
+
+    assert xfeat.calls == [1, 1, 1]
+    assert time.perf_counter() - start < 0.4
+
+
+def test_errors_reach_every_caller_of_the_batch():
+    class FailingXFeat(FakeXFeat):
+        def detectAndCompute(self, x, top_k=None):
+            time.sleep(0.1)
+            raise RuntimeError('extraction failed')
+
+    scheduler = XFeatBatchScheduler(FailingXFeat(), max_concurrent=1)
+    errors = []
+
+    def call():
+        try:
+            scheduler.detect_and_compute(image(1), 128)
+        except RuntimeError as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(errors) == 3
+    assert scheduler.running == 0 and scheduler.pending == []
+
+
+def test_caller_batched_by_another_waits_while_a_slot_frees():
+    class SlowXFeat(FakeXFeat):
+        # Delay per image value: 1 is fast, 2 is slow, the batch of 3 & 4 outlasts 2
+        delays = {1: 0.05, 2: 0.3, 3: 0.6}
+
+        def detectAndCompute(self, x, top_k=None):
+            outputs = super().detectAndCompute(x, top_k)
+            time.sleep(self.delays[outputs[0]['value']])
+            return outputs
+
+    xfeat = SlowXFeat()
+    scheduler = XFeatBatchScheduler(xfeat, max_concurrent=2)
+
+    # 3 takes 4 into its batch once 1 finishes, then 2 finishes while that batch still runs
+    results = run_concurrently(scheduler, [(image(value), 128) for value in range(1, 5)])
+
+    assert [result['value'] for result in results] == [1, 2, 3, 4]
+    assert xfeat.calls == [1, 1, 2]
+    assert scheduler.running == 0 and scheduler.pending == []
@@ -0,0 +1,46 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from modules.export import OnnxRuntimeBackbone, export_onnx, export_torchscript, load_torchscript
+from modules.model import XFeatModel
+
+# Sizes other than the 480x640 example input the graphs are exported with
+SIZES = [(480, 640), (256, 352), (640, 480)]
+
+
+@pytest.fixture(scope='module')
+def net():
+    torch.manual_seed(0)
+    return XFeatModel().eval()
+
+
+def assert_close_to(net, backbone):
+    generator = torch.Generator().manual_seed(1)
+    for height, width in SIZES:
+        x = torch.rand(1, 1, height, width, generator=generator)
+        with torch.no_grad():
+            reference = net(x)
+            outputs = backbone(x)
+
+        for name, expected, output in zip(['feats', 'keypoints', 'heatmap'], reference, outputs):
+            assert output.shape == expected.shape, (name, height, width)
+            torch.testing.assert_close(output, expected, atol=1e-4, rtol=1e-4)
+
+
+def test_onnx_export_runs_at_any_resolution(net, tmp_path):
+    pytest.importorskip('onnx')
+    pytest.importorskip('onnxruntime')
+    path = str(tmp_path / 'xfeat.onnx')
+
+    export_onnx(net, path)
+
+    assert_close_to(net, OnnxRuntimeBackbone(path))
+
+
+def test_torchscript_export_runs_at_any_resolution(net, tmp_path):
+    path = str(tmp_path / 'xfeat.ts')
+
+    export_torchscript(net, path)
+
+    assert_close_to(net, load_torchscript(path))
@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+import frame_protocol
+
+
+def test_frame_round_trip():
+    frame = frame_protocol.encode_frame(frame_protocol.MESSAGE_TYPE_STEP, 7, b'jpeg')
+
+    assert frame_protocol.decode_frame(frame) == (frame_protocol.MESSAGE_TYPE_STEP, 7, b'jpeg')
+
+
+def test_sequence_number_wraps():
+    frame = frame_protocol.encode_frame(frame_protocol.MESSAGE_TYPE_STEP, frame_protocol.MAX_SEQUENCE + 2, b'x')
+
+    assert frame_protocol.decode_frame(frame)[1] == 1
+
+
+def test_truncated_frame_is_rejected():
+    frame = frame_protocol.encode_frame(frame_protocol.MESSAGE_TYPE_STEP, 1, b'jpeg')
+
+    with pytest.raises(ValueError):
+        frame_protocol.decode_frame(frame[:frame_protocol.HEADER.size - 1])
+
+    with pytest.raises(ValueError):
+        frame_protocol.decode_frame(frame[:-1])
+
+
+def test_decode_client_step():
+    frame = frame_protocol.encode_frame(frame_protocol.MESSAGE_TYPE_STEP, 3, b'jpeg')
+
+    assert frame_protocol.decode_client_message(frame) == {
+        "type": "step",
+        "seq": 3,
+        "image_bytes": b'jpeg',
+        "binary": True
+    }
+
+
+def test_decode_client_rejects_empty_step_and_unknown_types():
+    with pytest.raises(ValueError):
+        frame_protocol.decode_client_message(frame_protocol.encode_frame(frame_protocol.MESSAGE_TYPE_STEP, 1, b''))
+
+    with pytest.raises(ValueError):
+        frame_protocol.decode_client_message(frame_protocol.encode_frame(0x7F, 1, b'data'))
+
+
+def test_step_response_parts():
+    data = {"text_under_finger": None, "render_mode": "full"}
+    frame = frame_protocol.encode_step_response(9, data, b'input', b'')
+
+    message_type, seq, payload = frame_protocol.decode_frame(frame)
+    assert (message_type, seq) == (frame_protocol.MESSAGE_TYPE_STEP_RESPONSE, 9)
+
+    parts = []
+    offset = 0
+    while offset < len(payload):
+        (length,) = frame_protocol.PART_LENGTH.unpack_from(payload, offset)
+        offset += frame_protocol.PART_LENGTH.size
+        parts.append(payload[offset:offset + length])
+        offset += length
+
+    assert json.loads(parts[0]) == data
+    assert parts[1:] == [b'input', b'']
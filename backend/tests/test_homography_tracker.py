@@ -0,0 +1,77 @@
+import cv2
+import numpy as np
+
+from homography_tracker import HomographyTracker
+
+# Source -> keyframe homography of the synthetic scene
+SOURCE_TO_INPUT = np.array([[0.9, 0.05, 20.0], [-0.03, 0.95, 15.0], [0.0, 0.0, 1.0]])
+
+
+def textured_frame(seed, size=(480, 640)):
+    rng = np.random.default_rng(seed)
+    noise = rng.integers(0, 256, (size[0] // 8, size[1] // 8), dtype=np.uint8)
+    return cv2.GaussianBlur(cv2.resize(noise, (size[1], size[0]), interpolation=cv2.INTER_CUBIC), (5, 5), 0)
+
+
+def shifted(frame, dx, dy):
+    return cv2.warpAffine(frame, np.float32([[1, 0, dx], [0, 1, dy]]), (frame.shape[1], frame.shape[0]), borderMode=cv2.BORDER_REFLECT)
+
+
+def keyframe_points(frame, count=300):
+    input_points = cv2.goodFeaturesToTrack(frame, count, 0.01, 8, blockSize=7).reshape(-1, 2)
+    source_points = cv2.perspectiveTransform(input_points.reshape(-1, 1, 2).astype(np.float64), np.linalg.inv(SOURCE_TO_INPUT))
+    return source_points.reshape(-1, 2).astype(np.float32), input_points.astype(np.float32)
+
+
+def test_tracks_a_small_camera_motion():
+    frame = textured_frame(0)
+    source_points, input_points = keyframe_points(frame)
+
+    tracker = HomographyTracker()
+    tracker.set_keyframe(frame, source_points, input_points)
+    result = tracker.track(shifted(frame, 3, 2))
+
+    assert result is not None
+    homography, confidence = result
+    expected = np.array([[1, 0, 3], [0, 1, 2], [0, 0, 1]]) @ SOURCE_TO_INPUT
+    corners = np.float64([[[0, 0]], [[600, 0]], [[600, 400]], [[0, 400]]])
+    error = np.linalg.norm(cv2.perspectiveTransform(corners, homography) - cv2.perspectiveTransform(corners, expected), axis=-1)
+    assert error.max() < 1.0
+    assert confidence > 0.9
+
+
+def test_drifted_correspondences_trigger_a_rematch():
+    frame = textured_frame(1)
+    source_points, input_points = keyframe_points(frame)
+
+    # Correspondences that no single homography explains, yet enough of them within the
+    # RANSAC threshold for an inlier count check to pass
+    rng = np.random.default_rng(1)
+    drifted = input_points + rng.normal(0, 3, input_points.shape).astype(np.float32)
+
+    tracker = HomographyTracker()
+    tracker.set_keyframe(frame, source_points, drifted)
+
+    assert tracker.track(shifted(frame, 3, 2)) is None
+
+
+def test_scene_change_triggers_a_rematch():
+    frame = textured_frame(2)
+    source_points, input_points = keyframe_points(frame)
+
+    tracker = HomographyTracker()
+    tracker.set_keyframe(frame, source_points, input_points)
+
+    assert tracker.track(textured_frame(3)) is None
+
+
+def test_rematch_after_frame_budget():
+    frame = textured_frame(4)
+    source_points, input_points = keyframe_points(frame)
+
+    tracker = HomographyTracker(max_frames_between_matches=2)
+    tracker.set_keyframe(frame, source_points, input_points)
+
+    assert tracker.track(frame) is not None
+    assert tracker.track(frame) is not None
+    assert tracker.track(frame) is None
@@ -0,0 +1,89 @@
+from latency_budget import LatencyBudgetController
+
+
+def run(controller, step_ms, inlier_ratio=0.8, steps=1):
+    for _ in range(steps):
+        controller.update(step_ms, inlier_ratio)
+    return controller.settings
+
+
+def test_starts_at_full_quality():
+    assert LatencyBudgetController().settings == {'max_dimension': 600, 'top_k': 2048}
+
+
+def test_over_budget_lowers_top_k_before_resolution():
+    controller = LatencyBudgetController(target_ms=80, smoothing=1.0, cooldown_steps=1)
+
+    top_ks = [run(controller, 200)['top_k'] for _ in range(5)]
+    assert top_ks == [1536, 1152, 864, 648, 512]
+    assert controller.dimension == 600
+
+    assert run(controller, 200) == {'max_dimension': 536, 'top_k': 512}
+    assert run(controller, 200, steps=10) == {'max_dimension': 320, 'top_k': 512}
+
+
+def test_headroom_restores_resolution_before_top_k():
+    controller = LatencyBudgetController(target_ms=80, smoothing=1.0, cooldown_steps=1)
+    run(controller, 200, steps=20)
+
+    run(controller, 10, steps=5)
+    assert controller.settings == {'max_dimension': 600, 'top_k': 512}
+
+    assert run(controller, 10, steps=10) == {'max_dimension': 600, 'top_k': 2048}
+
+
+def test_within_budget_keeps_settings():
+    controller = LatencyBudgetController(target_ms=80, smoothing=1.0, cooldown_steps=1)
+    run(controller, 200, steps=3)
+    settings = controller.settings
+
+    # Under the target, but without the headroom needed to raise quality again
+    assert run(controller, 75, steps=10) == settings
+
+
+def test_weak_matches_restore_quality_with_less_headroom():
+    controller = LatencyBudgetController(target_ms=80, headroom=0.2, smoothing=1.0, cooldown_steps=1)
+    run(controller, 200, steps=3)
+    top_k = controller.top_k
+
+    # 70 ms leaves less than the 20% headroom, but more than half of it
+    assert run(controller, 70, inlier_ratio=0.8)['top_k'] == top_k
+    assert run(controller, 70, inlier_ratio=0.1)['top_k'] > top_k
+
+
+def test_cooldown_between_changes():
+    controller = LatencyBudgetController(target_ms=80, smoothing=1.0, cooldown_steps=5)
+
+    assert run(controller, 200, steps=4)['top_k'] == 2048
+    assert run(controller, 200)['top_k'] == 1536
+    assert run(controller, 200, steps=4)['top_k'] == 1536
+    assert run(controller, 200)['top_k'] == 1152
+
+
+def test_moving_average_smooths_single_spikes():
+    controller = LatencyBudgetController(target_ms=80, smoothing=0.3, cooldown_steps=1)
+    run(controller, 70, steps=10)
+
+    assert run(controller, 90)['top_k'] == 2048
+
+
+def test_reset_returns_to_full_quality():
+    controller = LatencyBudgetController(target_ms=80, smoothing=1.0, cooldown_steps=1)
+    run(controller, 200, steps=20)
+
+    controller.reset()
+
+    assert controller.settings == {'max_dimension': 600, 'top_k': 2048}
+    assert controller.latency_ms is None and controller.inlier_ratio is None
+
+
+def test_dimensions_are_every_controller_step():
+    controller = LatencyBudgetController(target_ms=80, smoothing=1.0, cooldown_steps=1)
+    run(controller, 200, steps=5)
+
+    visited = [controller.dimension]
+    for _ in range(10):
+        visited.append(run(controller, 200)['max_dimension'])
+
+    assert controller.dimensions == [600, 536, 472, 408, 344, 320]
+    assert sorted(set(visited), reverse=True) == controller.dimensions
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+torch = pytest.importorskip('torch')
+pytest.importorskip('kornia')
+
+from kornia.feature.lightglue import LightGlue
+
+from modules.lighterglue import LighterGlue
+from modules.xfeat import XFeat
+
+
+@pytest.fixture(scope='module')
+def xfeat(tmp_path_factory):
+    # Randomly initialised weights, the batched and per-pair paths only have to agree, so
+    # the tests match at min_conf=0 where every mutual nearest neighbour counts
+    torch.manual_seed(0)
+    LightGlue.default_conf = LighterGlue.default_conf_xfeat
+    weights = tmp_path_factory.mktemp('weights') / 'xfeat-lighterglue.pt'
+    torch.save(LightGlue(None).state_dict(), weights)
+
+    xfeat = XFeat(weights=None)
+    xfeat.lighterglue = LighterGlue(str(weights), allow_download=False)
+    # The batched path never prunes points, compare it with pruning off
+    xfeat.lighterglue.net.conf.width_confidence = -1
+    return xfeat
+
+
+def features(generator, count, image_size):
+    keypoints = torch.rand(count, 2, generator=generator) * torch.tensor(image_size, dtype=torch.float32)
+    descriptors = torch.nn.functional.normalize(torch.randn(count, 64, generator=generator), dim=-1)
+    return {'keypoints': keypoints, 'descriptors': descriptors, 'image_size': image_size}
+
+
+def pair(generator, count0, count1, image_size):
+    # The second image shares a shifted, noisy subset of the first one's features
+    d0 = features(generator, count0, image_size)
+    d1 = features(generator, count1, image_size)
+    shared = min(count0, count1) // 2
+    d1['keypoints'][:shared] = (d0['keypoints'][:shared] + 4.0).clamp(max=min(image_size) - 1)
+    d1['descriptors'][:shared] = torch.nn.functional.normalize(
+        d0['descriptors'][:shared] + 0.1 * torch.randn(shared, 64, generator=generator), dim=-1)
+    return d0, d1
+
+
+def test_batch_matches_per_pair_matching(xfeat):
+    generator = torch.Generator().manual_seed(1)
+    pairs = [
+        pair(generator, 300, 250, (640, 480)),
+        pair(generator, 180, 320, (480, 640)),
+        pair(generator, 90, 60, (600, 450)),
+    ]
+
+    batched = xfeat.match_lighterglue_batch([d0 for d0, _ in pairs], [d1 for _, d1 in pairs], min_conf=0.0)
+
+    assert len(batched) == len(pairs)
+    for (d0, d1), (mkpts_0, mkpts_1, idxs) in zip(pairs, batched):
+        expected_0, expected_1, expected_idxs = xfeat.match_lighterglue(d0, d1, min_conf=0.0)
+
+        assert len(expected_idxs) > 0
+        np.testing.assert_array_equal(idxs, expected_idxs)
+        np.testing.assert_allclose(mkpts_0, expected_0)
+        np.testing.assert_allclose(mkpts_1, expected_1)
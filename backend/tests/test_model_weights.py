@@ -0,0 +1,152 @@
+import hashlib
+import os
+
+import pytest
+
+import model_weights
+
+REVISION = 'a' * 40
+
+
+@pytest.fixture
+def upstream(tmp_path, monkeypatch):
+    # A local stand-in for the upstream repository at REVISION, served through file:// URLs
+    source_dir = tmp_path / 'upstream' / REVISION
+    source_dir.mkdir(parents=True)
+    for name in model_weights.DOWNLOADS:
+        (source_dir / name).write_bytes(name.encode() * 100)
+    monkeypatch.setattr(model_weights, 'DOWNLOAD_URL', (tmp_path / 'upstream').as_uri() + '/{revision}/{name}')
+    return source_dir
+
+
+@pytest.fixture
+def weights_dir(tmp_path):
+    weights_dir = tmp_path / 'weights'
+    weights_dir.mkdir()
+    return str(weights_dir)
+
+
+def digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def pin(weights_dir, upstream, revision=REVISION, **overrides):
+    manifest = {name: digest((upstream / name).read_bytes()) for name in model_weights.DOWNLOADS}
+    manifest.update(overrides)
+    model_weights.write_manifest(manifest, revision, weights_dir)
+
+
+def test_fetch_downloads_and_verifies_pinned_files(upstream, weights_dir):
+    pin(weights_dir, upstream)
+
+    model_weights.fetch_weights(weights_dir)
+
+    paths = model_weights.verify_weights(model_weights.DOWNLOADS, weights_dir)
+    assert sorted(paths) == sorted(model_weights.DOWNLOADS)
+    assert sorted(os.listdir(weights_dir)) == sorted(model_weights.DOWNLOADS + [model_weights.MANIFEST_NAME])
+
+
+def test_fetch_fails_without_pinned_checksums(upstream, weights_dir):
+    with pytest.raises(RuntimeError, match='not pinned'):
+        model_weights.fetch_weights(weights_dir)
+
+    assert os.listdir(weights_dir) == []
+
+
+def test_fetch_fails_without_revision(upstream, weights_dir):
+    pin(weights_dir, upstream, revision=None)
+
+    with pytest.raises(RuntimeError, match='revision missing'):
+        model_weights.fetch_weights(weights_dir)
+
+
+def test_fetch_rejects_branch_revision(upstream, weights_dir):
+    pin(weights_dir, upstream, revision='main')
+
+    with pytest.raises(ValueError, match='commit id'):
+        model_weights.fetch_weights(weights_dir)
+
+
+def test_fetch_discards_mismatching_download(upstream, weights_dir):
+    pin(weights_dir, upstream, **{'xfeat.pt': digest(b'other')})
+
+    with pytest.raises(RuntimeError, match='Checksum mismatch'):
+        model_weights.fetch_weights(weights_dir)
+
+    assert 'xfeat.pt' not in os.listdir(weights_dir)
+    assert not any(name.endswith('.tmp') for name in os.listdir(weights_dir))
+
+
+def test_verify_rejects_modified_file(upstream, weights_dir):
+    pin(weights_dir, upstream)
+    model_weights.fetch_weights(weights_dir)
+
+    with open(os.path.join(weights_dir, 'xfeat.pt'), 'ab') as file:
+        file.write(b'tampered')
+
+    with pytest.raises(RuntimeError, match='Checksum mismatch'):
+        model_weights.verify_weights(['xfeat.pt'], weights_dir)
+
+
+def test_pin_records_revision_and_checksums(upstream, weights_dir):
+    model_weights.pin_weights(REVISION, weights_dir)
+
+    assert model_weights.read_revision(weights_dir) == REVISION
+    assert model_weights.read_manifest(weights_dir) == \
+        {name: digest((upstream / name).read_bytes()) for name in model_weights.DOWNLOADS}
+
+
+def test_update_manifest_records_only_local_files(upstream, weights_dir):
+    pin(weights_dir, upstream)
+    model_weights.fetch_weights(weights_dir)
+    with open(os.path.join(weights_dir, 'xfeat.pt'), 'ab') as file:
+        file.write(b'tampered')
+    with open(os.path.join(weights_dir, 'xfeat.onnx'), 'wb') as file:
+        file.write(b'onnx')
+
+    model_weights.record_local_weights(weights_dir)
+
+    manifest = model_weights.read_manifest(weights_dir)
+    assert manifest['xfeat.onnx'] == digest(b'onnx')
+    assert manifest['xfeat.pt'] == digest((upstream / 'xfeat.pt').read_bytes())
+    assert model_weights.read_revision(weights_dir) == REVISION
+
+
+def test_is_pinned(upstream, weights_dir):
+    assert not model_weights.is_pinned(weights_dir)
+
+    pin(weights_dir, upstream, revision=None)
+    assert not model_weights.is_pinned(weights_dir)
+
+    pin(weights_dir, upstream)
+    assert model_weights.is_pinned(weights_dir)
+
+
+def test_service_loads_upstream_weights_until_pinned(weights_dir, monkeypatch):
+    torch = pytest.importorskip('torch')
+    pytest.importorskip('kornia')
+    from kornia.feature.lightglue import LightGlue
+
+    import matching_service
+    from modules.lighterglue import LighterGlue
+    from modules.model import XFeatModel
+
+    LightGlue.default_conf = LighterGlue.default_conf_xfeat
+    upstream_weights = {
+        model_weights.UPSTREAM_URL.format(name='xfeat.pt'): XFeatModel().state_dict(),
+        model_weights.UPSTREAM_URL.format(name='xfeat-lighterglue.pt'): LightGlue(None).state_dict(),
+    }
+    requested = []
+
+    def load_state_dict_from_url(url, **kwargs):
+        requested.append(url)
+        return upstream_weights[url]
+
+    monkeypatch.setattr(torch.hub, 'load_state_dict_from_url', load_state_dict_from_url)
+    monkeypatch.setattr(matching_service, 'is_pinned', lambda: model_weights.is_pinned(weights_dir))
+    monkeypatch.setattr(matching_service, 'verify_weights', lambda names: model_weights.verify_weights(names, weights_dir))
+
+    xfeat = matching_service.MatchingService.load_models()
+
+    assert sorted(requested) == sorted(upstream_weights)
+    assert xfeat.lighterglue is not None
@@ -0,0 +1,261 @@
+import asyncio
+
+import cv2
+import numpy as np
+import pytest
+
+from ocr_service import OcrService, image_digest
+
+
+class FakeProvider:
+    """
+    Returns one line with the image bytes as text, and counts the calls.
+    """
+
+    name = 'fake'
+
+    def __init__(self, delay=0.0, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+
+    async def read(self, image_bytes):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError('provider down')
+        return [{'width': 100, 'height': 100, 'lines': [{'bounding_box': [0] * 8, 'text': image_bytes.decode()}]}]
+
+
+class ScreenProvider(FakeProvider):
+    """
+    Reads one line per call, at the amount line of screen(), with the call number as text.
+    """
+
+    async def read(self, image_bytes):
+        self.calls += 1
+        box = [40, 185, 240, 185, 240, 205, 40, 205]
+        return [{'width': 640, 'height': 480, 'lines': [{'bounding_box': box, 'text': f'call {self.calls}'}]}]
+
+
+def screen(text):
+    image = np.full((480, 640, 3), 240, dtype=np.uint8)
+    cv2.putText(image, 'Invoice #4711', (40, 80), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (20, 20, 20), 2)
+    cv2.putText(image, text, (40, 200), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (20, 20, 20), 1)
+    return image
+
+
+def recapture(image):
+    """
+    The screen taken again: slightly rotated, scaled and shifted, darker, noisy and JPEG compressed.
+
+    Returns:
+        tuple: (encoded capture, decoded capture, homography from image to the capture)
+    """
+    height, width = image.shape[:2]
+    affine = cv2.getRotationMatrix2D((width / 2, height / 2), 1.5, 1.03)
+    affine[:, 2] += (6, -4)
+    homography = np.vstack([affine, [0, 0, 1]])
+
+    capture = cv2.warpPerspective(image, homography, (width, height), borderMode=cv2.BORDER_REPLICATE)
+    noise = np.random.default_rng(0).normal(0, 3, capture.shape)
+    capture = np.clip(0.9 * capture + 8 + noise, 0, 255).astype(np.uint8)
+    _, encoded = cv2.imencode('.jpg', capture, [cv2.IMWRITE_JPEG_QUALITY, 80])
+    return encoded.tobytes(), cv2.imdecode(encoded, cv2.IMREAD_COLOR), homography
+
+
+def rough_alignment(homography):
+    """
+    Stands in for the XFeat match: returns homography off by a couple of pixels.
+    """
+    def align(reference, image):
+        return np.array([[1, 0, 1.5], [0, 1, -1], [0, 0, 1]]) @ homography
+    return align
+
+
+def text(read_results):
+    return read_results[0].lines[0].text
+
+
+def test_repeated_image_is_read_once():
+    provider = FakeProvider()
+    service = OcrService(provider)
+
+    async def run():
+        first = await service.recognize(screen('Amount due: $12.50'), b'first', session_id='a')
+        second = await service.recognize(screen('Amount due: $12.50'), b'second', session_id='a')
+        return first, second
+
+    first, second = asyncio.run(run())
+
+    assert provider.calls == 1
+    assert text(first) == text(second) == 'first'
+
+
+def test_similar_screens_are_not_confused():
+    # The first two collided in the 64-bit difference hash the cache was keyed by before
+    provider = FakeProvider()
+    service = OcrService(provider)
+
+    async def run():
+        return [await service.recognize(screen(amount), amount.encode(), session_id='a')
+                for amount in ('Amount due: $12.50', 'Amount due: $98.75', 'Amount due: $12.59')]
+
+    results = asyncio.run(run())
+
+    assert provider.calls == 3
+    assert [text(result) for result in results] == ['Amount due: $12.50', 'Amount due: $98.75', 'Amount due: $12.59']
+
+
+def test_recompressed_image_is_a_different_image():
+    image = screen('Amount due: $12.50')
+    _, encoded = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+
+    assert image_digest(image) == image_digest(image.copy())
+    assert image_digest(image) != image_digest(cv2.imdecode(encoded, cv2.IMREAD_COLOR))
+    assert image_digest(image) != image_digest(image[:, :, 0])
+
+
+def test_cache_is_per_session_by_default():
+    provider = FakeProvider()
+    service = OcrService(provider)
+    image = screen('Amount due: $12.50')
+
+    async def run():
+        await service.recognize(image, b'a', session_id='a')
+        await service.recognize(image, b'b', session_id='b')
+        return await service.recognize(image, b'a again', session_id='a')
+
+    result = asyncio.run(run())
+
+    assert provider.calls == 2
+    assert text(result) == 'a'
+
+
+def test_shared_cache_is_used_across_sessions():
+    provider = FakeProvider()
+    service = OcrService(provider, shared=True)
+    image = screen('Amount due: $12.50')
+
+    async def run():
+        await service.recognize(image, b'a', session_id='a')
+        return await service.recognize(image, b'b', session_id='b')
+
+    result = asyncio.run(run())
+
+    assert provider.calls == 1
+    assert text(result) == 'a'
+
+
+def test_concurrent_requests_share_a_provider_call():
+    provider = FakeProvider(delay=0.05)
+    service = OcrService(provider)
+    image = screen('Amount due: $12.50')
+
+    async def run():
+        return await asyncio.gather(*[service.recognize(image, b'image', session_id='a') for _ in range(3)])
+
+    results = asyncio.run(run())
+
+    assert provider.calls == 1
+    assert [text(result) for result in results] == ['image'] * 3
+
+
+def test_failed_read_is_not_cached():
+    provider = FakeProvider(fail=True)
+    service = OcrService(provider)
+    image = screen('Amount due: $12.50')
+
+    async def run():
+        return [await service.recognize(image, b'image', session_id='a') for _ in range(2)]
+
+    assert asyncio.run(run()) == [None, None]
+    assert provider.calls == 2
+
+
+def test_lru_eviction():
+    provider = FakeProvider()
+    service = OcrService(provider, cache_size=2)
+    images = [screen(f'Amount due: ${amount}') for amount in ('1', '2', '3')]
+
+    async def run():
+        for index, image in enumerate(images):
+            await service.recognize(image, str(index).encode(), session_id='a')
+        await service.recognize(images[0], b'0', session_id='a')
+
+    asyncio.run(run())
+
+    assert provider.calls == 4
+
+
+def test_disk_cache_is_shared_between_services(tmp_path):
+    image = screen('Amount due: $12.50')
+
+    first_provider = FakeProvider()
+    asyncio.run(OcrService(first_provider, cache_dir=str(tmp_path), shared=True).recognize(image, b'image'))
+
+    second_provider = FakeProvider()
+    result = asyncio.run(OcrService(second_provider, cache_dir=str(tmp_path), shared=True).recognize(image, b'other'))
+
+    assert (first_provider.calls, second_provider.calls) == (1, 0)
+    assert text(result) == 'image'
+
+
+def test_disk_cache_requires_shared_scope(tmp_path):
+    with pytest.raises(ValueError):
+        OcrService(FakeProvider(), cache_dir=str(tmp_path))
+
+
+def test_recaptured_screen_reuses_verified_text():
+    image = screen('Amount due: $12.50')
+    _, encoded = cv2.imencode('.png', image)
+    capture_bytes, capture, homography = recapture(image)
+    provider = ScreenProvider()
+    service = OcrService(provider, align=rough_alignment(homography))
+
+    async def run():
+        await service.recognize(image, encoded.tobytes(), session_id='a')
+        return await service.recognize(capture, capture_bytes, session_id='a')
+
+    result = asyncio.run(run())
+
+    assert provider.calls == 1
+    assert text(result) == 'call 1'
+    # The line box follows the text into the capture
+    box = np.array([40, 185, 240, 185, 240, 205, 40, 205], dtype=np.float64).reshape(-1, 1, 2)
+    expected = cv2.perspectiveTransform(box, homography).flatten()
+    np.testing.assert_allclose(result[0].lines[0].bounding_box, expected, atol=1.0)
+
+
+@pytest.mark.parametrize('changed', ['Amount due: $12.58', 'Amount due: $12.50.'])
+def test_recaptured_screen_with_other_text_is_read_again(changed):
+    image = screen('Amount due: $12.50')
+    _, encoded = cv2.imencode('.png', image)
+    capture_bytes, capture, homography = recapture(screen(changed))
+    provider = ScreenProvider()
+    service = OcrService(provider, align=rough_alignment(homography))
+
+    async def run():
+        await service.recognize(image, encoded.tobytes(), session_id='a')
+        return await service.recognize(capture, capture_bytes, session_id='a')
+
+    result = asyncio.run(run())
+
+    assert provider.calls == 2
+    assert text(result) == 'call 2'
+
+
+def test_near_duplicates_are_per_session():
+    image = screen('Amount due: $12.50')
+    _, encoded = cv2.imencode('.png', image)
+    capture_bytes, capture, homography = recapture(image)
+    provider = ScreenProvider()
+    service = OcrService(provider, align=rough_alignment(homography))
+
+    async def run():
+        await service.recognize(image, encoded.tobytes(), session_id='a')
+        return await service.recognize(capture, capture_bytes, session_id='b')
+
+    asyncio.run(run())
+
+    assert provider.calls == 2
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+torch = pytest.importorskip('torch')
+pytest.importorskip('tqdm')
+
+from modules.model import XFeatModel
+from modules.quantization import load_quantized_xfeat, quantize_xfeat
+from modules.xfeat import XFeat
+
+
+@pytest.fixture(scope='module')
+def net():
+    torch.manual_seed(0)
+    return XFeatModel().eval()
+
+
+@pytest.fixture(scope='module')
+def quantized(net):
+    generator = torch.Generator().manual_seed(1)
+    return quantize_xfeat(net, [torch.rand(1, 1, 480, 640, generator=generator) for _ in range(2)])
+
+
+def test_quantized_model_runs_close_to_fp32(net, quantized):
+    # Another size than the calibration images, RGB like XFeat.preprocess_tensor output
+    x = torch.rand(1, 3, 448, 608, generator=torch.Generator().manual_seed(2))
+
+    with torch.no_grad():
+        reference = net(x)
+        outputs = quantized(x)
+
+    for name, expected, output in zip(['feats', 'keypoints', 'heatmap'], reference, outputs):
+        assert output.shape == expected.shape, name
+        assert output.dtype == torch.float32, name
+        # On average within a few percent of the output range of the fp32 model
+        assert (output - expected).abs().mean() <= 0.03 * expected.abs().max(), name
+
+
+def test_saved_int8_weights_load_into_the_same_model(net, quantized):
+    x = torch.rand(1, 1, 256, 320, generator=torch.Generator().manual_seed(3))
+    loaded = load_quantized_xfeat(net, quantized.state_dict())
+
+    with torch.no_grad():
+        for expected, output in zip(quantized(x), loaded(x)):
+            assert torch.equal(expected, output)
+
+
+def test_quantized_xfeat_extracts_features(net, quantized):
+    xfeat = XFeat(weights=net.state_dict(), quantized=True, quantized_weights=quantized.state_dict())
+    image = np.random.default_rng(0).integers(0, 256, (450, 600, 3), dtype=np.uint8)
+
+    output = xfeat.detectAndCompute(image, top_k=512)[0]
+
+    assert output['keypoints'].shape[-1] == 2
+    assert output['descriptors'].shape == (len(output['keypoints']), 64)
@@ -0,0 +1,68 @@
+import json
+import os
+
+import cv2
+import numpy as np
+
+from ocr_service import to_read_results
+from text_index import TextLineIndex
+
+TEST_DATA = os.path.join(os.path.dirname(__file__), '..', 'test_data_video.json')
+
+
+def read_results(*lines, width=1000, height=1000):
+    return to_read_results([{'width': width, 'height': height, 'lines': [
+        {'bounding_box': bounding_box, 'text': f'line {index}'} for index, bounding_box in enumerate(lines)
+    ]}])
+
+
+def brute_force_query(index, x, y):
+    # The lookup before the index: the first line in reading order whose polygon contains the point
+    for line_index, polygon in enumerate(index.polygons):
+        if cv2.pointPolygonTest(polygon.reshape(-1, 1, 2), (float(x), float(y)), False) >= 0:
+            return line_index
+    return None
+
+
+def test_query_matches_brute_force_on_recorded_ocr():
+    with open(TEST_DATA, 'r') as file:
+        text_info = to_read_results(json.load(file)['readResults'])
+    index = TextLineIndex(text_info, 600, 1060, cell_size=32)
+
+    points = np.random.default_rng(0).uniform((0, 0), (600, 1060), size=(5000, 2))
+    # Include every polygon corner, edges count as inside
+    points = np.concatenate([points, index.polygons.reshape(-1, 2)])
+
+    for x, y in points:
+        assert index.query(x, y) == brute_force_query(index, x, y)
+
+
+def test_lines_are_scaled_to_the_source_image():
+    index = TextLineIndex(read_results([100, 100, 300, 100, 300, 200, 100, 200]), 500, 250)
+
+    assert index.polygons.tolist() == [[[50, 25], [150, 25], [150, 50], [50, 50]]]
+    assert index.query(100, 40) == 0
+    assert index.query(200, 80) is None
+
+
+def test_line_spanning_cells_is_found_in_each():
+    index = TextLineIndex(read_results([10, 10, 990, 10, 990, 30, 10, 30]), 1000, 1000, cell_size=64)
+
+    assert all(index.query(x, 20) == 0 for x in range(10, 991, 50))
+
+
+def test_overlapping_lines_return_the_first_in_reading_order():
+    index = TextLineIndex(read_results(
+        [0, 0, 200, 0, 200, 100, 0, 100],
+        [100, 50, 300, 50, 300, 150, 100, 150],
+    ), 1000, 1000)
+
+    assert index.query(150, 75) == 0
+    assert index.query(250, 125) == 1
+
+
+def test_empty_text_info():
+    index = TextLineIndex(read_results(), 600, 400)
+
+    assert len(index) == 0
+    assert index.query(10, 10) is None
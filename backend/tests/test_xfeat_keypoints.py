@@ -0,0 +1,50 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+pytest.importorskip('tqdm')
+
+import torch.nn.functional as F
+
+from modules.xfeat import XFeat
+
+
+@pytest.fixture(scope='module')
+def xfeat():
+    return XFeat(weights=None)
+
+
+@pytest.fixture(scope='module')
+def heatmap(xfeat):
+    generator = torch.Generator().manual_seed(0)
+    logits = torch.randn(2, 65, 14, 18, generator=generator) * 3.0
+    return xfeat.get_kpts_heatmap(logits)
+
+
+def test_nms_mask_matches_max_pool(xfeat, heatmap):
+    local_max = F.max_pool2d(heatmap, kernel_size=5, stride=1, padding=2)
+    expected = (heatmap == local_max) & (heatmap > 0.05)
+
+    assert expected.any()
+    assert torch.equal(xfeat.nms_mask(heatmap, threshold=0.05), expected)
+
+
+def test_select_keypoints_scores_every_nms_maximum(xfeat, heatmap):
+    generator = torch.Generator().manual_seed(1)
+    reliability = torch.rand(2, 1, 14, 18, generator=generator)
+    B, _, H, W = heatmap.shape
+
+    # Reference: score every pixel, reject everything but the local maxima
+    grid = xfeat.create_xy(H, W, heatmap.device).float()[None].expand(B, -1, -1)
+    expected = (xfeat._nearest(heatmap, grid, H, W) * xfeat._bilinear(reliability, grid, H, W)).squeeze(-1)
+    expected[~xfeat.nms_mask(heatmap).view(B, -1)] = -1
+    expected[:, 0] = -1
+
+    mkpts, scores = xfeat.select_keypoints(heatmap, reliability, top_k=64)
+
+    for b in range(B):
+        valid = scores[b] > 0
+        flat = (mkpts[b][valid, 1] * W + mkpts[b][valid, 0]).long()
+        torch.testing.assert_close(scores[b][valid], expected[b][flat])
+        # The best 64 maxima, or all of them if there are fewer
+        assert int(valid.sum()) == min(64, int((expected[b] > 0).sum()))
+        assert scores[b][valid].min() >= expected[b].topk(int(valid.sum())).values.min()
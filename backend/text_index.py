@@ -0,0 +1,93 @@
+import numpy as np
+
+class TextLineIndex:
+    """
+    Spatial index over the OCR lines of a source image.
+
+    The line bounding boxes are scaled to the source image once and bucketed into a uniform
+    grid, so a hover lookup only runs a vectorised point-in-polygon test on the few lines
+    whose bounding box covers the finger's grid cell.
+    """
+
+    def __init__(self, text_info, source_width, source_height, cell_size=64):
+        """
+        Args:
+            text_info (list): OCR read results, each with 'width', 'height' and 'lines'.
+            source_width (int): Width of the source image the lines are looked up in.
+            source_height (int): Height of the source image.
+            cell_size (int): Grid cell size in source image pixels.
+        """
+        self.cell_size = cell_size
+
+        # Lines are numbered across all read results, in reading order
+        self.lines = [line for read_result in text_info for line in read_result.lines]
+
+        if not self.lines:
+            self.polygons = np.zeros((0, 4, 2), dtype=np.int32)
+            self.grid = {}
+            return
+
+        # All lines are normalised by the first result's size, as the OCR coordinates are
+        original_width = text_info[0].width
+        original_height = text_info[0].height
+
+        bboxes = np.array([line.bounding_box for line in self.lines], dtype=np.float32).reshape(-1, 4, 2)
+        normalised = (bboxes / np.array([original_width, original_height], dtype=np.float32)).astype(np.float32)
+
+        # (N, 4, 2) integer polygons in source image coordinates
+        self.polygons = (normalised * np.array([source_width, source_height])).astype(np.int32)
+
+        # Bucket each line into every cell its bounding box touches
+        grid = {}
+        cell_min = np.floor(self.polygons.min(axis=1) / cell_size).astype(np.int64)
+        cell_max = np.floor(self.polygons.max(axis=1) / cell_size).astype(np.int64)
+        for index in range(len(self.lines)):
+            for cell_x in range(cell_min[index, 0], cell_max[index, 0] + 1):
+                for cell_y in range(cell_min[index, 1], cell_max[index, 1] + 1):
+                    grid.setdefault((cell_x, cell_y), []).append(index)
+
+        self.grid = {cell: np.array(indices, dtype=np.int64) for cell, indices in grid.items()}
+
+    def __len__(self):
+        return len(self.lines)
+
+    def query(self, x, y):
+        """
+        Find the first line (in reading order) whose polygon contains the point.
+
+        Returns:
+            int: Index of the line, or None if no line contains the point.
+        """
+        candidates = self.grid.get((int(np.floor(x / self.cell_size)), int(np.floor(y / self.cell_size))))
+        if candidates is None:
+            return None
+
+        inside = self.__points_in_polygons(x, y, self.polygons[candidates])
+        hits = candidates[inside]
+
+        if len(hits) == 0:
+            return None
+
+        return int(hits.min())
+
+    def __points_in_polygons(self, x, y, polygons):
+        """
+        Vectorised even-odd test of one point against K polygons, edges count as inside.
+        """
+        polygons = polygons.astype(np.float64)
+        ax, ay = polygons[..., 0], polygons[..., 1]
+        bx, by = np.roll(ax, -1, axis=1), np.roll(ay, -1, axis=1)
+
+        # Point on an edge
+        cross = (bx - ax) * (y - ay) - (by - ay) * (x - ax)
+        on_edge = (np.abs(cross) < 1e-9) & \
+            (np.minimum(ax, bx) <= x) & (x <= np.maximum(ax, bx)) & \
+            (np.minimum(ay, by) <= y) & (y <= np.maximum(ay, by))
+
+        # Ray casting towards +x
+        straddles = (ay > y) != (by > y)
+        dy = np.where(by == ay, 1.0, by - ay)
+        x_intersect = ax + (y - ay) * (bx - ax) / dy
+        crossings = straddles & (x < x_intersect)
+
+        return on_edge.any(axis=1) | (crossings.sum(axis=1) % 2 == 1)
@@ -1,14 +1,9 @@
 import cv2
 import numpy as np
-import json
 import os
 
 import mediapipe as mp
 
-from azure.cognitiveservices.vision.computervision import ComputerVisionClient
-
-from types import SimpleNamespace
-
 from openai import AzureOpenAI
 
 import base64
@@ -18,12 +13,42 @@ from speech_service import ContinuousSpeechService
 
 from matching_service import MatchingService
 
+from ocr_service import OcrService
+
+from step_engine import StepEngine
+
+from homography_tracker import HomographyTracker
+
+from hand_tracker import HandTracker
+
+from text_index import TextLineIndex
+
+from stage_timer import StageTimer, LatencyHistogram, process_latency
+
+from latency_budget import LatencyBudgetController
+
+import frame_protocol
+
 from fastapi import WebSocket
 
 import asyncio
+import time
+import traceback
 
 HAND_CONNECTIONS = mp.solutions.hands.HAND_CONNECTIONS
 
+# Render modes for step responses: headless skips the debug drawing and image echo
+RENDER_MODE_HEADLESS = "headless"
+RENDER_MODE_FULL = "full"
+RENDER_MODE_DEBUG = "debug"
+RENDER_MODES = (RENDER_MODE_HEADLESS, RENDER_MODE_FULL, RENDER_MODE_DEBUG)
+
+# OCR state of the source image, reported as text_status in step responses
+TEXT_STATUS_NONE = "none"
+TEXT_STATUS_PENDING = "pending"
+TEXT_STATUS_READY = "ready"
+TEXT_STATUS_FAILED = "failed"
+
 # Function to encode a local image into data URL 
 def local_image_to_data_url(image_path):
     # Guess the MIME type of the image based on the file extension
@@ -59,27 +84,37 @@ class VisionInstance:
 
     def __init__(
         self, 
-        hands_detector, 
-        computer_vision_client: ComputerVisionClient, 
+        hand_tracker: HandTracker, 
+        ocr_service: OcrService,
         llm_client: AzureOpenAI, 
         matching_service: MatchingService,
         session_id: str,
-        websocket: WebSocket 
+        websocket: WebSocket,
+        step_engine: StepEngine
     ):
         self.source_image = None
         self.input_image = None
 
+        # XFeat features of the source image, extracted once per source image
+        self.source_features = None
+
         self.input_debug_image = None
         self.source_debug_image = None
 
         self.text_info = None
+        # OCR line polygons scaled to the source image, rebuilt with text_info
+        self.text_index = None
+        # OCR of the current source image, runs in the background while tracking already starts
+        self.text_status = TEXT_STATUS_NONE
+        self.ocr_task: asyncio.Task = None
 
         self.llm_client = llm_client
         self.deployment_name = os.getenv('AZURE_LLM_DEPLOYMENT')
 
-        self.hands_detector = hands_detector
+        # Per-session landmarker, only used by this session's step
+        self.hand_tracker = hand_tracker
 
-        self.computer_vision_client = computer_vision_client
+        self.ocr_service = ocr_service
 
         self.speech_service = ContinuousSpeechService(websocket, session_id, self)
 
@@ -87,13 +122,18 @@ class VisionInstance:
 
         self.matching_service = matching_service
 
-        self.session_id = session_id
+        self.step_engine = step_engine
 
-        data_path = os.path.join(os.path.dirname(__file__), 'test_data_video.json')
-        with open(data_path, 'r') as file:
-            self.test_data = json.load(file, object_hook=lambda d: SimpleNamespace(**d))
+        self.session_id = session_id
 
         self.step_task: asyncio.Task = None
+        # Held by a step while it computes and by set_source_image while it swaps the source state
+        self.source_lock = asyncio.Lock()
+
+        # One-slot mailbox for the newest frame that arrived while a step was running
+        self.pending_step_input = None
+        self.superseded_frames = 0
+        self.superseded_frames_total = 0
         
         # Homography stabilization
         self.homography_buffer = []
@@ -102,49 +142,183 @@ class VisionInstance:
         self.min_match_confidence = 0.15  # Minimum inlier ratio (25% of matches must be inliers)
         self.smoothing_factor = 0.2  # Higher = more smoothing
 
-        self.tracked_element_index = None
+        # Optical-flow tracking between full XFeat + LighterGlue keyframe matches
+        self.tracking_mode = os.getenv('HOMOGRAPHY_TRACKING', '1') == '1'
+        self.homography_tracker = HomographyTracker()
+
+        # Crop the input frame to where the source was last seen before matching
+        self.roi_mode = os.getenv('MATCHING_ROI', '1') == '1'
+        # Last stable source-to-input homography that came from a confident match or track, None falls back to the full frame
+        self.roi_homography = None
 
-    async def set_source_image(self, source_image: np.ndarray, image_path):
         self.tracked_element_index = None
 
-        self.source_image = source_image
-        self.source_debug_image = source_image.copy()
+        self.render_mode = RENDER_MODE_FULL
 
+        # Per-stage step latency of this session, optionally echoed in step responses
+        self.latency = LatencyHistogram()
+        self.include_timings = False
+
+        # Adapts the matching resolution and keypoint count to a step latency target, 0 disables
+        latency_target_ms = float(os.getenv('STEP_LATENCY_TARGET_MS', '80'))
+        self.latency_budget = LatencyBudgetController(target_ms=latency_target_ms) if latency_target_ms > 0 else None
+        # Inlier ratio of this step's full match, None when optical flow tracking was used
+        self.last_match_confidence = None
+
+    def set_render_mode(self, render_mode):
+        """
+        Sets how step responses are rendered for this session.
+
+        Args:
+            render_mode (str): 'headless' returns only fingertip, text and tracking data,
+                               'full' or 'debug' also returns the two debug images.
+        """
+        if render_mode not in RENDER_MODES:
+            raise ValueError(f"Unknown render mode '{render_mode}', expected one of {', '.join(RENDER_MODES)}")
+
+        self.render_mode = render_mode
+        print(f"Render mode for session {self.session_id}: {render_mode}")
+
+    async def set_source_image(self, source_image: np.ndarray, image_bytes: bytes):
         # Print source image information
         height, width = source_image.shape[:2]
         channels = source_image.shape[2] if len(source_image.shape) > 2 else 1
         dtype = source_image.dtype
         print(f"Source image set - Resolution: {width}x{height}, Channels: {channels}, Data type: {dtype}, Size: {source_image.nbytes} bytes")
 
-        self.text_info = self.__get_text_info(image_path)
-        
-        # Reset homography stabilization for new source image
-        self.homography_buffer = []
-        self.stable_homography = None
+        # OCR runs in the background, overlapping the feature extraction and the first steps
+        if self.ocr_task is not None:
+            self.ocr_task.cancel()
+        source_image_announced = asyncio.Event()
+        self.ocr_task = asyncio.create_task(self.__run_ocr(source_image, image_bytes, source_image_announced))
+
+        # Extract before touching the session state, steps keep matching the old source meanwhile
+        source_features = await self.step_engine.run(self.matching_service.extract_features, source_image)
+        if source_features is not None:
+            print(f"Cached {source_features['keypoints'].shape[0]} source keypoints (resize factor {source_features['resize_factor']:.3f})")
+
+        # Swap in everything that depends on the source image at once, never while a step computes with it
+        async with self.source_lock:
+            self.tracked_element_index = None
+
+            self.source_image = source_image
+            self.source_debug_image = source_image.copy()
+            self.source_features = source_features
+
+            # The previous source image's text no longer applies, steps report it as pending until OCR finishes
+            self.text_info = None
+            self.text_index = None
+            self.text_status = TEXT_STATUS_PENDING
+
+            # Reset homography stabilization for new source image
+            self.homography_buffer = []
+            self.stable_homography = None
+            self.homography_tracker.reset()
+            self.roi_homography = None
+
+            # A new source image usually means a new screen, the hand is searched for in the full frame again
+            self.hand_tracker.reset()
+
+            # Latency and inlier averages were measured against the old source image
+            if self.latency_budget is not None:
+                self.latency_budget.reset()
 
         await self.websocket.send_json({
             "type": "source_image_set",
             "data": True
         })
+        source_image_announced.set()
 
     async def step(self, input_data):
-        source_image = input_data.get("image", None)
-        if not source_image:
-            raise ValueError("Source image is required")
-        
-        # Decode base64 image
-        source_image_bytes = base64.b64decode(source_image)
+        submitted = time.perf_counter()
+
+        # All CPU-bound work runs on the step engine, only the send happens on the event loop
+        async with self.source_lock:
+            return_data, input_image_encoded, source_image_encoded, timer = await self.step_engine.run(self.__compute_step, input_data, submitted)
+
+        # Frames replaced in the mailbox since the last response
+        return_data["superseded_frames"] = self.superseded_frames
+        return_data["superseded_frames_total"] = self.superseded_frames_total
+        self.superseded_frames = 0
+
+        if input_data.get("include_timings", self.include_timings):
+            return_data["timings"] = {
+                "stages": {stage: round(duration_ms, 3) for stage, duration_ms in timer.timings.items()},
+                "session": self.latency.summary(),
+                "process": process_latency.summary()
+            }
+            if self.latency_budget is not None:
+                return_data["timings"]["matching"] = self.latency_budget.settings
+
+        if input_data.get("binary", False):
+            # Reply in the same binary mode with the raw JPEG bytes
+            with timer.stage('send'):
+                await self.websocket.send_bytes(frame_protocol.encode_step_response(
+                    input_data.get("seq", 0),
+                    return_data,
+                    input_image_encoded,
+                    source_image_encoded
+                ))
+        else:
+            # Send base64-encoded strings in JSON mode, headless steps have no images
+            if input_image_encoded and source_image_encoded:
+                with timer.stage('encode'):
+                    return_data["input_image"] = base64.b64encode(input_image_encoded).decode('utf-8')
+                    return_data["source_image"] = base64.b64encode(source_image_encoded).decode('utf-8')
+
+            with timer.stage('send'):
+                await self.websocket.send_json({
+                    "type": "step_response",
+                    "data": return_data
+                })
+
+        timer.add('total', (time.perf_counter() - submitted) * 1000.0)
+        self.latency.record(timer.timings)
+        process_latency.record(timer.timings)
+
+        # Only full matches are steered, optical flow steps do not depend on the settings
+        if self.latency_budget is not None and self.last_match_confidence is not None:
+            self.latency_budget.update(timer.timings['total'], self.last_match_confidence)
+
+    def __compute_step(self, input_data, submitted):
+        """
+        Decode the frame, find the fingertip on the source image and render the debug images.
+        Runs on a step engine worker thread.
+        Returns (return_data, input_image_jpeg_bytes, source_image_jpeg_bytes, timer), the image
+        bytes are empty in headless mode.
+        """
+        timer = StageTimer()
+        timer.add('executor_wait', (time.perf_counter() - submitted) * 1000.0)
+
+        render_mode = input_data.get("render_mode", self.render_mode)
+        if render_mode not in RENDER_MODES:
+            raise ValueError(f"Unknown render mode '{render_mode}', expected one of {', '.join(RENDER_MODES)}")
+        headless = render_mode == RENDER_MODE_HEADLESS
+
+        # Binary frames already carry the raw image bytes, JSON messages carry base64
+        source_image_bytes = input_data.get("image_bytes", None)
+        if source_image_bytes is None:
+            source_image = input_data.get("image", None)
+            if not source_image:
+                raise ValueError("Source image is required")
+            
+            # Decode base64 image
+            with timer.stage('base64_decode'):
+                source_image_bytes = base64.b64decode(source_image)
 
-        input_image_orig = cv2.imdecode(np.frombuffer(source_image_bytes, np.uint8), cv2.IMREAD_COLOR)
-        input_image = cv2.cvtColor(input_image_orig, cv2.COLOR_BGR2RGB)
+        with timer.stage('jpeg_decode'):
+            input_image_orig = cv2.imdecode(np.frombuffer(source_image_bytes, np.uint8), cv2.IMREAD_COLOR)
+            input_image = cv2.cvtColor(input_image_orig, cv2.COLOR_BGR2RGB)
 
         self.input_image = input_image
-        self.input_debug_image = input_image.copy()
-        self.source_debug_image = self.source_image.copy()
+        if not headless:
+            self.input_debug_image = input_image.copy()
+            self.source_debug_image = self.source_image.copy()
 
-        hands_info = self.__detect_hands(self.input_image)
+        with timer.stage('hand_detection'):
+            hands_info = self.__detect_hands(self.input_image)
 
-        homography = self.__get_homography(self.input_image, self.source_image)
+        homography = self.__get_homography(self.input_image, self.source_image, timer)
 
         input_finger_tip_location, source_finger_tip_location = self.__get_finger_tip_location(hands_info, homography, self.input_image)
         
@@ -153,42 +327,48 @@ class VisionInstance:
         distance_to_tracked_element = None
         if source_finger_tip_location:
             self.latest_source_finger_position = source_finger_tip_location
-            text_under_finger = self.get_text_under_finger(source_finger_tip_location)
+            with timer.stage('text_lookup'):
+                text_under_finger = self.get_text_under_finger(source_finger_tip_location)
             if text_under_finger:
                 print(f"Text under finger: {text_under_finger['text']}")
             
             if self.tracked_element_index is not None:
-                distance_to_tracked_element = self.get_distance_to_tracked_element(source_finger_tip_location)
+                with timer.stage('text_lookup'):
+                    distance_to_tracked_element = self.get_distance_to_tracked_element(source_finger_tip_location)
                 if distance_to_tracked_element is not None:
                     print(f"Finger at ({distance_to_tracked_element['finger_x']:.2f}, {distance_to_tracked_element['finger_y']:.2f}), target at ({distance_to_tracked_element['target_x']:.2f}, {distance_to_tracked_element['target_y']:.2f})")
 
-        self.__draw_debug_info(self.input_debug_image, self.source_debug_image, homography, hands_info, input_finger_tip_location, source_finger_tip_location, text_under_finger)
-
-        # Convert np.ndarray to base64-encoded strings
-        _, input_image_encoded = cv2.imencode('.jpg', self.input_debug_image)
-        _, source_image_encoded = cv2.imencode('.jpg', self.source_debug_image)
-
-        input_image_base64 = base64.b64encode(input_image_encoded).decode('utf-8')
-        source_image_base64 = base64.b64encode(source_image_encoded).decode('utf-8')
-
         return_data = {
-            "input_image": input_image_base64,
-            "source_image": source_image_base64,
+            "text_status": self.text_status,
             "text_under_finger": text_under_finger,
             "distance_to_tracked_element": distance_to_tracked_element,
-            "tracked_element_index": self.tracked_element_index
+            "tracked_element_index": self.tracked_element_index,
+            "render_mode": render_mode
         }
 
-        await self.websocket.send_json({
-            "type": "step_response",
-            "data": return_data
-        })
+        if headless:
+            # Production clients only need where the finger is, skip the warp, drawing and encodes
+            return_data["input_finger_tip_location"] = self.__location_to_json(input_finger_tip_location)
+            return_data["source_finger_tip_location"] = self.__location_to_json(source_finger_tip_location)
+            return return_data, b'', b'', timer
 
-    def __detect_hands(self, input_image):
+        with timer.stage('debug_draw'):
+            self.__draw_debug_info(self.input_debug_image, self.source_debug_image, homography, hands_info, input_finger_tip_location, source_finger_tip_location, text_under_finger)
 
-        image = mp.Image.image = mp.Image(image_format=mp.ImageFormat.SRGB, data=input_image)
+        with timer.stage('encode'):
+            _, input_image_encoded = cv2.imencode('.jpg', self.input_debug_image)
+            _, source_image_encoded = cv2.imencode('.jpg', self.source_debug_image)
 
-        return self.hands_detector.detect(image)
+        return return_data, input_image_encoded.tobytes(), source_image_encoded.tobytes(), timer
+
+    def __location_to_json(self, location):
+        if location is None:
+            return None
+
+        return {'x': float(location['x']), 'y': float(location['y'])}
+
+    def __detect_hands(self, input_image):
+        return self.hand_tracker.detect(input_image)
     
     def __get_finger_tip_location(self, hands_info, homography, input_image):
         if hands_info.hand_landmarks:
@@ -266,7 +446,7 @@ class VisionInstance:
                         5, (255, 0, 0, 255), -1)
                 
     def __draw_text_data(self, input_debug_image, source_debug_image, image_text_data, homography, text_under_finger):
-        if not image_text_data:
+        if not image_text_data or self.text_index is None:
             return None
 
         # Get current image dimensions
@@ -284,16 +464,9 @@ class VisionInstance:
                     for line in read_result.lines:
                             # Extract bounding box points
                             bbox = line.bounding_box
-                            # Convert bounding box format from [x1,y1,x2,y2,x3,y3,x4,y4] to points
-                            original_points = np.array([
-                                [bbox[0] / original_width, bbox[1] / original_height],
-                                [bbox[2] / original_width, bbox[3] / original_height],
-                                [bbox[4] / original_width, bbox[5] / original_height],
-                                [bbox[6] / original_width, bbox[7] / original_height]
-                            ], dtype=np.float32)
-
-                            # Scale points to source image dimensions
-                            points = (original_points * np.array([source_width, source_height])).astype(np.int32).reshape(-1, 1, 2)
+
+                            # Points already scaled to source image dimensions
+                            points = self.text_index.polygons[current_index].reshape(-1, 1, 2)
                             
                             # Choose color and thickness based on whether this is the tracked element
                             if self.tracked_element_index is not None and current_index == self.tracked_element_index:
@@ -360,22 +533,50 @@ class VisionInstance:
 
         return input_debug_image, source_debug_image
     
-    def __get_homography(self, input_image, source_image):
+    def __get_homography(self, input_image, source_image, timer):
+        self.last_match_confidence = None
+
+        if self.tracking_mode:
+            input_gray = cv2.cvtColor(input_image, cv2.COLOR_RGB2GRAY)
+
+            # Follow the last keyframe with optical flow while it is still reliable
+            with timer.stage('optical_flow'):
+                tracked = self.homography_tracker.track(input_gray)
+            if tracked is not None:
+                raw_homography, confidence = tracked
+                with timer.stage('stabilisation'):
+                    homography = self.__stabilize_homography(raw_homography, confidence)
+                self.roi_homography = homography
+                return homography
+
         # Get the raw homography and its confidence
-        raw_homography, confidence = self.__get_homography_xfeat(input_image, source_image)
+        raw_homography, confidence, inliers = self.__get_homography_xfeat(input_image, source_image, timer)
+        self.last_match_confidence = confidence
+
+        if self.tracking_mode:
+            if raw_homography is not None and inliers is not None and confidence >= self.min_match_confidence:
+                self.homography_tracker.set_keyframe(input_gray, *inliers)
+            else:
+                self.homography_tracker.reset()
         
         # Apply temporal stabilization
-        return self.__stabilize_homography(raw_homography, confidence)
+        with timer.stage('stabilisation'):
+            homography = self.__stabilize_homography(raw_homography, confidence)
+
+        # A weak match means the screen may have moved out of the last region, search the full frame next time
+        self.roi_homography = homography if raw_homography is not None and confidence >= self.min_match_confidence else None
+        return homography
 
-    def __get_homography_xfeat(self, input_image, source_image):
+    def __get_homography_xfeat(self, input_image, source_image, timer):
         """
         Get homography with confidence metric from XFeat matching.
-        Returns (homography_matrix, confidence_score)
+        Returns (homography_matrix, confidence_score, inliers)
         """
         # Use the matching service's new method that returns both homography and inlier ratio
-        homography, confidence = self.matching_service.get_homography_xfeat(input_image, source_image)
-        
-        return homography, confidence
+        settings = self.latency_budget.settings if self.latency_budget is not None else {}
+        roi_homography = self.roi_homography if self.roi_mode else None
+        return self.matching_service.get_homography_xfeat(input_image, source_image, self.source_features, timer,
+                                                          roi_homography=roi_homography, **settings)
     
     def __stabilize_homography(self, new_homography, confidence):
         """
@@ -436,29 +637,38 @@ class VisionInstance:
         
         return smoothed
     
-    def __get_text_info(self, input_image_path):
-        # try: 
-        #     with open(input_image_path, 'rb') as image_stream:
-        #         result = self.computer_vision_client.read_in_stream(image_stream, language='en', raw=True)
-                
-        #         operation_location = result.headers["Operation-Location"]
-        #         operation_id = operation_location.split("/")[-1]
+    async def __run_ocr(self, source_image, image_bytes, source_image_announced):
+        """
+        Background OCR of a new source image, sends text_info_ready once the text lookups work,
+        never before source_image_set. Cancelled when another source image is set before it finishes.
+        """
+        try:
+            text_info = await self.ocr_service.recognize(source_image, image_bytes, session_id=self.session_id)
 
-        
-        #     while True:
-        #         read_result = self.computer_vision_client.get_read_result(operation_id)
-                
-        #         if read_result.status not in ['notStarted', 'running']:
-        #             break
-        #         time.sleep(1)
-        
-        #     return read_result.analyze_result.read_results
-        # except Exception as error:
-        #     print(f"Error analyzing image: {error}")
-        #     return None
+            height, width = source_image.shape[:2]
+            text_index = await self.step_engine.run(TextLineIndex, text_info, width, height) if text_info else None
+        except Exception as error:
+            print(f"Error running OCR for session {self.session_id}: {error}")
+            print(f"Traceback:\n{traceback.format_exc()}")
+            text_info = None
+            text_index = None
+
+        await source_image_announced.wait()
+
+        # Index first, step threads check text_info before using text_index
+        self.text_index = text_index
+        self.text_info = text_info
+        self.text_status = TEXT_STATUS_READY if text_info is not None else TEXT_STATUS_FAILED
+        self.ocr_task = None
+
+        await self.websocket.send_json({
+            "type": "text_info_ready",
+            "data": {
+                "status": self.text_status,
+                "line_count": len(text_index) if text_index is not None else 0
+            }
+        })
 
-        return self.test_data.readResults
-        
     def get_text_under_finger(self, finger_position=None):
         """
         Identifies which text element the finger is hovering over.
@@ -480,44 +690,23 @@ class VisionInstance:
         if not finger_position:
             return None
             
+        if self.text_index is None:
+            return None
+
         x, y = finger_position['x'], finger_position['y']
         
-        # Get image dimensions
-        if len(self.text_info) > 0:
-            original_width = self.text_info[0].width
-            original_height = self.text_info[0].height
-            
-            # Current image dimensions
-            source_height, source_width = self.source_image.shape[:2]
-            
-            # Check each text element to see if finger is inside its bounding box
-            for read_result in self.text_info:
-                for line in read_result.lines:
-                    # Extract bounding box points
-                    bbox = line.bounding_box
-                    
-                    # Convert bounding box format from [x1,y1,x2,y2,x3,y3,x4,y4] to points
-                    original_points = np.array([
-                        [bbox[0] / original_width, bbox[1] / original_height],
-                        [bbox[2] / original_width, bbox[3] / original_height],
-                        [bbox[4] / original_width, bbox[5] / original_height],
-                        [bbox[6] / original_width, bbox[7] / original_height]
-                    ], dtype=np.float32)
-                    
-                    # Scale points to current image dimensions
-                    points = (original_points * np.array([source_width, source_height])).astype(np.int32)
-                    
-                    # Check if point is inside polygon
-                    if cv2.pointPolygonTest(points, (x, y), False) >= 0:
-                        # Point is inside the polygon
-                        return {
-                            'text': line.text,
-                            'confidence': getattr(line, 'confidence', 0.0),
-                            'boundingBox': points.tolist()
-                        }
-        
-        # No text found under finger
-        return None
+        # Only the lines whose grid cell contains the finger are tested
+        line_index = self.text_index.query(x, y)
+        if line_index is None:
+            # No text found under finger
+            return None
+
+        line = self.text_index.lines[line_index]
+        return {
+            'text': line.text,
+            'confidence': getattr(line, 'confidence', 0.0),
+            'boundingBox': self.text_index.polygons[line_index].tolist()
+        }
 
     def get_distance_to_tracked_element(self, finger_position):
         """
@@ -532,30 +721,13 @@ class VisionInstance:
         if not self.text_info or not finger_position or self.tracked_element_index is None or len(self.text_info) == 0:
             return None
             
+        if self.text_index is None or self.tracked_element_index >= len(self.text_index):
+            return None
+
         finger_x, finger_y = finger_position['x'], finger_position['y']
         
-        # Get image dimensions
-        original_width = self.text_info[0].width
-        original_height = self.text_info[0].height
-        
-        # Current image dimensions
-        source_height, source_width = self.source_image.shape[:2]
-        
-        # Find the tracked element by index
-        line = self.text_info[0].lines[self.tracked_element_index]
-        # This is our tracked element
-        bbox = line.bounding_box
-        
-        # Convert bounding box format from [x1,y1,x2,y2,x3,y3,x4,y4] to points
-        original_points = np.array([
-            [bbox[0] / original_width, bbox[1] / original_height],
-            [bbox[2] / original_width, bbox[3] / original_height],
-            [bbox[4] / original_width, bbox[5] / original_height],
-            [bbox[6] / original_width, bbox[7] / original_height]
-        ], dtype=np.float32)
-        
-        # Scale points to current image dimensions
-        points = (original_points * np.array([source_width, source_height])).astype(np.int32)
+        # Scaled polygon of the tracked element
+        points = self.text_index.polygons[self.tracked_element_index]
         
         # Calculate the center of the tracked element
         target_x = np.mean(points[:, 0])
@@ -640,6 +812,8 @@ class VisionInstance:
         return_object = {
             'description': ai_description,
             'text_elements': text_elements,
+            # 'pending' while OCR is still running, text_elements is empty until text_info_ready
+            'text_status': self.text_status,
         }
 
         self.speech_service.finalize_explain_touch_screen_function_call(return_object)
@@ -685,10 +859,20 @@ class VisionInstance:
             'max_y': max_y
         }
         
-    async def start_session(self):
+    async def start_session(self, render_mode=None, include_timings=None):
         """
         Starts the speech recognition service.
+
+        Args:
+            render_mode (str): Optional render mode for step responses, see set_render_mode.
+            include_timings (bool): Optionally add per-stage latency to every step response.
         """
+        if render_mode is not None:
+            self.set_render_mode(render_mode)
+
+        if include_timings is not None:
+            self.include_timings = bool(include_timings)
+
         self.speech_service = ContinuousSpeechService(self.websocket, self.session_id, self)
         return await self.speech_service.start_session()
 
@@ -698,6 +882,19 @@ class VisionInstance:
         """
         return await self.speech_service.stop_session()
 
+    async def close(self):
+        """
+        Releases the per-session hand tracker once any running step has finished.
+        """
+        if self.ocr_task is not None:
+            self.ocr_task.cancel()
+
+        self.pending_step_input = None
+        if self.step_task is not None:
+            await asyncio.wait([self.step_task])
+
+        self.hand_tracker.close()
+
     async def process_audio_chunk(self, audio_chunk):
         """
         Processes an audio chunk for speech recognition.
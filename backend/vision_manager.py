@@ -10,21 +10,35 @@ import numpy as np
 
 import base64
 
-from mediapipe.tasks import python
-from mediapipe.tasks.python import vision
-
 from vision_instance import VisionInstance
 
 from openai import AzureOpenAI
 
 from matching_service import MatchingService
 
+from ocr_service import OcrService
+
+from step_engine import StepEngine
+
+from hand_tracker import HandTracker
+
+from metrics import metrics
+
 from typing import Dict
 
 import time
+import traceback
+
+# MediaPipe hand landmarker model, relative to the backend directory
+HAND_MODEL_PATH = 'hand_landmarker.task'
 
 class VisionManager:
-    def __init__(self):
+    def __init__(self, xfeat=None, hand_model_buffer=None):
+        """
+        Args:
+            xfeat (XFeat): Matcher models loaded by a pre-fork parent process, loaded here if not given.
+            hand_model_buffer (bytes): Hand landmarker model contents, read from hand_model_path if not given.
+        """
         self.azure_vision_key = os.getenv('AZURE_VISION_KEY')
         self.azure_vision_endpoint = os.getenv('AZURE_VISION_ENDPOINT')
         self.azure_llm_key = os.getenv('AZURE_LLM_KEY')
@@ -43,15 +57,25 @@ class VisionManager:
             base_url=self.azure_llm_endpoint,
         )
         
-        self.matching_service = MatchingService()
+        self.matching_service = MatchingService(xfeat)
+
+        # Shared by all sessions, so a screen read once is not sent to OCR again;
+        # new captures of it are recognised by aligning them with the matcher
+        self.ocr_service = OcrService.from_env(self.computer_vision_client, align=self.matching_service.align)
 
-        base_options = python.BaseOptions(model_asset_path='hand_landmarker.task')
-        options = vision.HandLandmarkerOptions(base_options=base_options,
-                                               min_hand_detection_confidence=0.01,
-                                                  min_hand_presence_confidence=0.01,
-                                                  running_mode=vision.RunningMode.IMAGE,
-                                            num_hands=1)
-        self.hands_detector = vision.HandLandmarker.create_from_options(options)
+        # Before the app accepts connections, so the first session's frames run at full speed
+        self.matching_service.warmup()
+
+        # Each session gets its own hand tracker, created in add_connection from the model read once here
+        self.hand_model_path = HAND_MODEL_PATH
+        if hand_model_buffer is None:
+            with open(self.hand_model_path, 'rb') as file:
+                hand_model_buffer = file.read()
+        self.hand_model_buffer = hand_model_buffer
+        self.hand_roi_tracking = os.getenv('HAND_TRACKING_ROI', '0') == '1'
+
+        # Worker pool for the CPU-bound part of each step
+        self.step_engine = StepEngine()
 
         self.visionInstanceList: Dict[str, VisionInstance] = {}
 
@@ -76,40 +100,53 @@ class VisionManager:
 
         # source is in bytes format convert to cv2 image
         source_image = cv2.imdecode(np.frombuffer(source, np.uint8), cv2.IMREAD_COLOR)
+        if source_image is None:
+            raise ValueError("Source image could not be decoded")
 
-        # Save source image to /tmp directory
-        filepath = f"/tmp/source_image_{session_id}.jpg"
-        if not os.path.exists('/tmp'):
-            os.makedirs('/tmp')
-        cv2.imwrite(filepath, source_image)
-        
-        # TODO add code to fix handling the image
-
-        # Set the source image in the VisionInstance with the file path
-        return await self.visionInstanceList[session_id].set_source_image(source_image, filepath)
+        # OCR gets the uploaded bytes as they are, no re-encode or temporary file
+        return await self.visionInstanceList[session_id].set_source_image(source_image, source)
 
     
     async def step(self, session_id, input_data):
         if session_id not in self.visionInstanceList:
             raise ValueError(f"Session {session_id} not found")
+
+        vision_instance = self.visionInstanceList[session_id]
         
-        if self.visionInstanceList[session_id].step_task is not None:
+        if vision_instance.step_task is not None:
+            # Latest frame wins: keep only the newest frame until the running step finishes
+            if vision_instance.pending_step_input is not None:
+                vision_instance.superseded_frames += 1
+                vision_instance.superseded_frames_total += 1
+                metrics.increment('steps_dropped')
+            vision_instance.pending_step_input = input_data
             return
         
-        async def run_step_task():
+        async def run_step_task(step_input):
             try:
-                start_time = time.time()
-                await self.visionInstanceList[session_id].step(input_data)
-                end_time = time.time()
-                execution_time = end_time - start_time
-                print(f"Step execution time for session {session_id}: {execution_time:.4f} seconds")
-            except Exception as e:
-                raise e
+                while step_input is not None:
+                    try:
+                        start_time = time.time()
+                        await vision_instance.step(step_input)
+                        metrics.increment('steps_processed')
+                        end_time = time.time()
+                        execution_time = end_time - start_time
+                        print(f"Step execution time for session {session_id}: {execution_time:.4f} seconds")
+                    except Exception as e:
+                        print(f"Error in step for session {session_id}: {e}")
+                        print(f"Traceback:\n{traceback.format_exc()}")
+
+                    # Process the newest frame that arrived meanwhile, if any
+                    step_input = vision_instance.pending_step_input
+                    vision_instance.pending_step_input = None
             finally: 
-                self.visionInstanceList[session_id].step_task = None
+                vision_instance.step_task = None
+
+        task = asyncio.create_task(run_step_task(input_data))
+        vision_instance.step_task = task
 
-        task = asyncio.create_task(run_step_task())
-        self.visionInstanceList[session_id].step_task = task
+    def shutdown(self):
+        self.step_engine.shutdown()
 
     async def get_screen_info(self, session_id):
         if session_id not in self.visionInstanceList:
@@ -123,12 +160,13 @@ class VisionManager:
         
         # Create a new VisionInstance for the session
         self.visionInstanceList[session_id] = VisionInstance(
-            self.hands_detector,
-            self.computer_vision_client,
+            HandTracker(model_asset_buffer=self.hand_model_buffer, roi_tracking=self.hand_roi_tracking),
+            self.ocr_service,
             self.llm_client,
             self.matching_service,
             session_id,
-            websocket
+            websocket,
+            self.step_engine
         )
         
         return True
@@ -139,15 +177,16 @@ class VisionManager:
         
         # Clean up the VisionInstance
         await self.visionInstanceList[session_id].stop_session()
+        await self.visionInstanceList[session_id].close()
         del self.visionInstanceList[session_id]
         
         return True
     
-    async def start_session(self, session_id):
+    async def start_session(self, session_id, render_mode=None, include_timings=None):
         if session_id not in self.visionInstanceList:
             raise ValueError(f"Session {session_id} not found")
             
-        return await self.visionInstanceList[session_id].start_session()
+        return await self.visionInstanceList[session_id].start_session(render_mode, include_timings)
     
     async def stop_session(self, session_id):
         if session_id not in self.visionInstanceList:
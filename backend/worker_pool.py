@@ -0,0 +1,506 @@
+import asyncio
+import gc
+import json
+import multiprocessing
+import os
+import shutil
+import signal
+import struct
+import tempfile
+import time
+import traceback
+
+import torch
+from dotenv import load_dotenv
+
+from message_handler import parse_websocket_message, handle_websocket_message
+
+from metrics import collect_load
+
+from matching_service import MatchingService
+
+from vision_manager import VisionManager, HAND_MODEL_PATH
+
+# Multi-process mode: the front process accepts /ws connections and relays each session's
+# messages to the vision worker it is pinned to, over a unix socket per worker.
+#
+# Every IPC message starts with a fixed header:
+#   kind (uint8) | session id (36 bytes, ASCII UUID, zero-padded when unused) | payload length (uint32)
+# followed by the payload.
+IPC_HEADER = struct.Struct('!B36sI')
+
+IPC_HELLO = 0x01          # worker -> front, JSON {"index", "pid"} once the models are loaded
+IPC_HEALTH = 0x02         # worker -> front, JSON load report, see metrics.collect_load
+IPC_OPEN = 0x03           # front -> worker, a session was pinned to the worker
+IPC_CLOSE = 0x04          # front -> worker, the session's client disconnected
+IPC_CLIENT_TEXT = 0x05    # front -> worker, UTF-8 text message from the client
+IPC_CLIENT_BYTES = 0x06   # front -> worker, binary message from the client
+IPC_SEND_TEXT = 0x07      # worker -> front, UTF-8 text message for the client
+IPC_SEND_BYTES = 0x08     # worker -> front, binary message for the client
+
+
+def write_ipc(writer, kind, session_id, payload=b''):
+    """
+    Queue one IPC message on a stream writer. The header and payload go out in one write,
+    so messages from concurrent coroutines never interleave.
+    """
+    writer.write(IPC_HEADER.pack(kind, (session_id or '').encode('ascii'), len(payload)) + payload)
+
+
+async def read_ipc(reader):
+    """
+    Read one IPC message as (kind, session_id, payload).
+    Raises asyncio.IncompleteReadError when the other side has closed the connection.
+    """
+    header = await reader.readexactly(IPC_HEADER.size)
+    kind, session_id, payload_length = IPC_HEADER.unpack(header)
+    payload = await reader.readexactly(payload_length)
+
+    return kind, session_id.rstrip(b'\0').decode('ascii'), payload
+
+
+class RelayWebSocket:
+    """
+    Stands in for a session's client WebSocket inside a worker process.
+    Sends are relayed to the front process, which forwards them to the client.
+    """
+
+    def __init__(self, session_id, writer):
+        self.session_id = session_id
+        self.writer = writer
+
+    async def send_json(self, data, mode="text"):
+        # Serialise like Starlette does for the client
+        text = json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+        if mode == "binary":
+            await self.send_bytes(text.encode('utf-8'))
+        else:
+            await self.send_text(text)
+
+    async def send_text(self, data):
+        write_ipc(self.writer, IPC_SEND_TEXT, self.session_id, data.encode('utf-8'))
+        await self.writer.drain()
+
+    async def send_bytes(self, data):
+        write_ipc(self.writer, IPC_SEND_BYTES, self.session_id, bytes(data))
+        await self.writer.drain()
+
+
+class VisionWorker:
+    """
+    A worker process: owns a VisionManager (matching service, hand trackers, step engine)
+    for the sessions the front process pins to it.
+    """
+
+    def __init__(self, index, socket_path, models=None, health_interval=1.0):
+        self.index = index
+        self.socket_path = socket_path
+        # Models inherited from a pre-fork parent, see preload_models
+        self.models = models or {}
+        self.health_interval = health_interval
+
+        self.vision_manager = None
+        self.writer = None
+
+        # Per-session inbox, so a slow handler only delays its own session's messages
+        self.session_queues = {}
+        self.session_tasks = {}
+
+    async def run(self, vision_manager=None):
+        # Load the models before announcing the worker, so it only gets sessions once ready
+        if vision_manager is None:
+            vision_manager = VisionManager(**self.models)
+        self.vision_manager = vision_manager
+
+        reader, self.writer = await asyncio.open_unix_connection(self.socket_path)
+        write_ipc(self.writer, IPC_HELLO, None, json.dumps({"index": self.index, "pid": os.getpid()}).encode('utf-8'))
+        await self.writer.drain()
+        print(f"Vision worker {self.index} ready (pid {os.getpid()})")
+
+        health_task = asyncio.create_task(self.__report_health())
+        try:
+            while True:
+                try:
+                    kind, session_id, payload = await read_ipc(reader)
+                except asyncio.IncompleteReadError:
+                    print(f"Vision worker {self.index}: front process closed the connection")
+                    break
+
+                if kind == IPC_OPEN:
+                    self.__open_session(session_id)
+                elif kind in (IPC_CLIENT_TEXT, IPC_CLIENT_BYTES, IPC_CLOSE):
+                    queue = self.session_queues.get(session_id)
+                    if queue is None:
+                        print(f"Vision worker {self.index}: message for unknown session {session_id}")
+                        continue
+                    queue.put_nowait(None if kind == IPC_CLOSE else (kind, payload))
+                else:
+                    print(f"Vision worker {self.index}: unknown IPC message kind {kind}")
+        finally:
+            health_task.cancel()
+            for queue in self.session_queues.values():
+                queue.put_nowait(None)
+            if self.session_tasks:
+                await asyncio.wait(list(self.session_tasks.values()))
+            self.vision_manager.shutdown()
+
+    def __open_session(self, session_id):
+        websocket = RelayWebSocket(session_id, self.writer)
+        self.vision_manager.add_connection(session_id, websocket)
+
+        self.session_queues[session_id] = asyncio.Queue()
+        self.session_tasks[session_id] = asyncio.create_task(self.__run_session(session_id, websocket))
+
+    async def __run_session(self, session_id, websocket):
+        queue = self.session_queues[session_id]
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+
+                kind, payload = item
+                try:
+                    if kind == IPC_CLIENT_BYTES:
+                        data = parse_websocket_message(data=payload)
+                    else:
+                        data = parse_websocket_message(text=payload.decode('utf-8'))
+
+                    await handle_websocket_message(self.vision_manager, session_id, data, websocket)
+                except Exception as e:
+                    print(f"Error handling WebSocket message for {session_id}: {e}")
+                    await websocket.send_json({
+                        "type": "error",
+                        "message": str(e)
+                    })
+        except Exception as e:
+            print(f'Session error for {session_id}: {e}')
+            print(f'Traceback:\n{traceback.format_exc()}')
+        finally:
+            del self.session_queues[session_id]
+            del self.session_tasks[session_id]
+            await self.vision_manager.remove_connection(session_id)
+
+    async def __report_health(self):
+        while True:
+            load = collect_load(self.vision_manager)
+            load["pid"] = os.getpid()
+            write_ipc(self.writer, IPC_HEALTH, None, json.dumps(load).encode('utf-8'))
+            await self.writer.drain()
+            await asyncio.sleep(self.health_interval)
+
+
+def preload_models(share_memory=False):
+    """
+    Load the models once in the front process before forking the workers, which then share
+    the weight pages copy-on-write instead of each loading their own copy.
+
+    Args:
+        share_memory (bool): Also move the torch weights into shared memory, so they stay
+                             shared even where a worker writes to a page holding them.
+    """
+    # Keep torch in the parent single-threaded, thread pools do not survive a fork
+    torch.set_num_threads(1)
+
+    xfeat = MatchingService.load_models()
+    if share_memory:
+        xfeat.share_memory()
+
+    with open(HAND_MODEL_PATH, 'rb') as file:
+        hand_model_buffer = file.read()
+
+    # Exclude everything loaded so far from garbage collection, so collections in the workers
+    # do not write to the pages of these long-lived objects and un-share them
+    gc.collect()
+    gc.freeze()
+
+    return {"xfeat": xfeat, "hand_model_buffer": hand_model_buffer}
+
+def worker_main(index, socket_path, num_workers, models=None):
+    """
+    Entry point of a worker process, spawned fresh or forked from a front process that
+    preloaded the models.
+    """
+    if models is not None:
+        # Forked children inherit the server's signal handlers, the front process
+        # shuts the workers down by closing their connections instead
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    load_dotenv()
+
+    # Split the cores between the worker processes unless configured explicitly
+    cpu_count = os.cpu_count() or 1
+    step_workers = int(os.environ.setdefault('STEP_WORKERS', str(max(1, cpu_count // num_workers))))
+    os.environ.setdefault('STEP_TORCH_THREADS', str(max(1, cpu_count // (num_workers * step_workers))))
+
+    asyncio.run(VisionWorker(index, socket_path, models).run())
+
+
+class WorkerHandle:
+    """
+    Front process view of one worker process.
+    """
+
+    def __init__(self, index, process):
+        self.index = index
+        self.process = process
+        self.writer = None
+        self.sessions = set()
+        self.load = {}
+        self.last_health = None
+        self.started = time.monotonic()
+
+    @property
+    def ready(self):
+        return self.writer is not None
+
+    def healthy(self, health_timeout):
+        return self.ready and self.last_health is not None and time.monotonic() - self.last_health < health_timeout
+
+
+class WorkerPool:
+    """
+    Runs the vision work of all sessions in N worker processes.
+
+    Each session is pinned to one worker for its lifetime (session-affine routing): its
+    VisionInstance, hand tracker and tracking state live there. New sessions go to the
+    healthy worker with the fewest sessions. Workers that die are restarted, and the
+    sessions pinned to them are closed so their clients reconnect.
+
+    With prefork, the models are loaded once in this process and every worker, including
+    restarted ones, is forked with them; otherwise each spawned worker loads its own.
+    """
+
+    def __init__(self, num_workers, prefork=False, share_memory=False, health_interval=1.0, health_timeout=5.0, restart_delay=1.0):
+        self.num_workers = max(1, num_workers)
+        self.prefork = prefork
+        self.share_memory = share_memory
+        self.models = None
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.restart_delay = restart_delay
+
+        self.socket_dir = None
+        self.socket_path = None
+        self.server = None
+        self.monitor_task = None
+
+        self.workers = []
+
+        # Session id -> worker handle / outbound queue to the client / sender task
+        self.session_workers = {}
+        self.session_outboxes = {}
+        self.session_senders = {}
+
+        self.worker_restarts = 0
+        self.context = multiprocessing.get_context('fork' if prefork else 'spawn')
+
+    async def start(self):
+        self.socket_dir = tempfile.mkdtemp(prefix='watvision-')
+        self.socket_path = os.path.join(self.socket_dir, 'workers.sock')
+        self.server = await asyncio.start_unix_server(self.__handle_worker_connection, path=self.socket_path)
+
+        if self.prefork:
+            start_time = time.monotonic()
+            self.models = preload_models(self.share_memory)
+            print(f"Preloaded models for forked workers in {time.monotonic() - start_time:.2f} seconds")
+
+        self.workers = [self.__spawn(index) for index in range(self.num_workers)]
+        self.monitor_task = asyncio.create_task(self.__monitor())
+
+        print(f"Worker pool started with {self.num_workers} vision workers")
+
+    async def wait_until_ready(self, timeout=None):
+        """
+        Wait until every worker has loaded its models and connected.
+        """
+        start_time = time.monotonic()
+        while not all(worker.ready for worker in self.workers):
+            if timeout is not None and time.monotonic() - start_time > timeout:
+                raise RuntimeError(f"Vision workers not ready after {timeout} seconds")
+            await asyncio.sleep(0.1)
+
+    def __spawn(self, index):
+        process = self.context.Process(
+            target=worker_main,
+            args=(index, self.socket_path, self.num_workers, self.models),
+            name=f'vision-worker-{index}'
+        )
+        process.start()
+        return WorkerHandle(index, process)
+
+    async def __handle_worker_connection(self, reader, writer):
+        try:
+            kind, _, payload = await read_ipc(reader)
+        except asyncio.IncompleteReadError:
+            writer.close()
+            return
+
+        if kind != IPC_HELLO:
+            print("Worker connection did not start with a hello message, closing it")
+            writer.close()
+            return
+
+        hello = json.loads(payload)
+        worker = self.workers[hello["index"]]
+        worker.writer = writer
+        worker.last_health = time.monotonic()
+        print(f"Vision worker {worker.index} connected (pid {hello['pid']}) after {time.monotonic() - worker.started:.1f} seconds")
+
+        try:
+            while True:
+                kind, session_id, payload = await read_ipc(reader)
+
+                if kind == IPC_HEALTH:
+                    worker.load = json.loads(payload)
+                    worker.last_health = time.monotonic()
+                elif kind in (IPC_SEND_TEXT, IPC_SEND_BYTES):
+                    outbox = self.session_outboxes.get(session_id)
+                    if outbox is not None:
+                        outbox.put_nowait((kind, payload))
+                else:
+                    print(f"Unknown IPC message kind {kind} from vision worker {worker.index}")
+        except (asyncio.IncompleteReadError, ConnectionError):
+            print(f"Vision worker {worker.index} disconnected")
+        finally:
+            worker.writer = None
+            writer.close()
+            self.__drop_worker_sessions(worker)
+
+    def __drop_worker_sessions(self, worker):
+        # The sessions' state died with the worker, close them so the clients reconnect
+        for session_id in list(worker.sessions):
+            outbox = self.session_outboxes.get(session_id)
+            if outbox is not None:
+                outbox.put_nowait(None)
+        worker.sessions.clear()
+
+    async def __monitor(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+
+            for index, worker in enumerate(self.workers):
+                if worker.process.is_alive():
+                    if worker.ready and not worker.healthy(self.health_timeout):
+                        print(f"Vision worker {index} missed its health reports, not routing new sessions to it")
+                    continue
+
+                print(f"Vision worker {index} exited with code {worker.process.exitcode}, restarting")
+                if worker.writer is not None:
+                    worker.writer.close()
+                    worker.writer = None
+                self.__drop_worker_sessions(worker)
+
+                await asyncio.sleep(self.restart_delay)
+                self.workers[index] = self.__spawn(index)
+                self.worker_restarts += 1
+
+    def __pick_worker(self):
+        candidates = [worker for worker in self.workers if worker.healthy(self.health_timeout)]
+        if not candidates:
+            raise RuntimeError("No vision worker available")
+
+        return min(candidates, key=lambda worker: (len(worker.sessions), worker.load.get("queue_depth", 0)))
+
+    async def open_session(self, session_id, websocket):
+        """
+        Pin a new session to a worker and start relaying the worker's messages to the client.
+        """
+        worker = self.__pick_worker()
+        worker.sessions.add(session_id)
+        self.session_workers[session_id] = worker
+
+        outbox = asyncio.Queue()
+        self.session_outboxes[session_id] = outbox
+        self.session_senders[session_id] = asyncio.create_task(self.__send_to_client(session_id, websocket, outbox))
+
+        write_ipc(worker.writer, IPC_OPEN, session_id)
+        await worker.writer.drain()
+        print(f"Session {session_id} pinned to vision worker {worker.index}")
+
+    async def relay(self, session_id, message):
+        """
+        Forward a client message (an ASGI websocket.receive message) to the session's worker.
+        """
+        worker = self.session_workers.get(session_id)
+        if worker is None or session_id not in worker.sessions or worker.writer is None:
+            raise RuntimeError(f"Session {session_id} has no vision worker")
+
+        if message.get("bytes") is not None:
+            write_ipc(worker.writer, IPC_CLIENT_BYTES, session_id, message["bytes"])
+        else:
+            write_ipc(worker.writer, IPC_CLIENT_TEXT, session_id, message["text"].encode('utf-8'))
+        await worker.writer.drain()
+
+    async def close_session(self, session_id):
+        worker = self.session_workers.pop(session_id, None)
+        if worker is not None and session_id in worker.sessions:
+            worker.sessions.discard(session_id)
+            if worker.writer is not None:
+                write_ipc(worker.writer, IPC_CLOSE, session_id)
+                await worker.writer.drain()
+
+        outbox = self.session_outboxes.pop(session_id, None)
+        sender = self.session_senders.pop(session_id, None)
+        if outbox is not None:
+            outbox.put_nowait(None)
+        if sender is not None and sender is not asyncio.current_task():
+            await asyncio.wait([sender])
+
+    async def __send_to_client(self, session_id, websocket, outbox):
+        # One sender per session, so a slow client never holds up the other sessions' relays
+        try:
+            while True:
+                item = await outbox.get()
+                if item is None:
+                    break
+
+                kind, payload = item
+                if kind == IPC_SEND_BYTES:
+                    await websocket.send_bytes(payload)
+                else:
+                    await websocket.send_text(payload.decode('utf-8'))
+        except Exception as e:
+            print(f"Error relaying to session {session_id}: {e}")
+
+        if session_id in self.session_workers:
+            # The worker went away while the client is still connected
+            try:
+                await websocket.close(code=1011)
+            except Exception:
+                pass
+
+    def status(self):
+        """
+        Returns:
+            list: Per worker index, pid, health, pinned session count and last load report.
+        """
+        return [{
+            "index": worker.index,
+            "pid": worker.process.pid,
+            "alive": worker.process.is_alive(),
+            "healthy": worker.healthy(self.health_timeout),
+            "sessions": len(worker.sessions),
+            "load": worker.load
+        } for worker in self.workers]
+
+    async def shutdown(self):
+        if self.monitor_task is not None:
+            self.monitor_task.cancel()
+
+        # Closing the connections makes the workers shut down their vision managers and exit
+        for worker in self.workers:
+            if worker.writer is not None:
+                worker.writer.close()
+
+        if self.server is not None:
+            self.server.close()
+
+        for worker in self.workers:
+            await asyncio.to_thread(worker.process.join, 10)
+            if worker.process.is_alive():
+                worker.process.terminate()
+
+        if self.socket_dir is not None:
+            shutil.rmtree(self.socket_dir, ignore_errors=True)
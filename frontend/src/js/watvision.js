@@ -1,10 +1,17 @@
 import axios from "axios";
 import SpeechStreamingClient from "./speechStreaming";
 
+// Binary WebSocket frame protocol (see backend/frame_protocol.py)
+const BINARY_HEADER_SIZE = 9;
+const STEP_MESSAGE_TYPE = 0x01;
+const STEP_RESPONSE_MESSAGE_TYPE = 0x02;
+
 class WatVision {
 
     constructor(inputImageElement, debugInputImageElement, debugReferenceImageElement) {
         this.sourceImageCaptured = false;
+        // OCR of the source image finishes after source_image_set, see text_info_ready
+        this.sourceTextReady = false;
         this.lastReadText = null;
         this.speechClient = new SpeechStreamingClient(this);
         this.audioTranscriptText = ""; // Initialize audio transcript text
@@ -21,6 +28,14 @@ class WatVision {
 
         this.waitingForStepReply = false;
 
+        // Send step frames as binary WebSocket frames instead of base64 JSON
+        this.useBinaryFrames = true;
+        this.stepSequence = 0;
+        this.debugImageUrls = { input: null, source: null };
+
+        // 'full' echoes the debug images on every step, 'headless' only returns finger and text data
+        this.renderMode = 'full';
+
         // Screen info properties
         this.last_received_screen_description = null;
         this.last_received_text_elements = null;
@@ -31,15 +46,18 @@ class WatVision {
 
         const base64Image = await this.blobToBase64(imgBlob);
 
+        this.sourceImageCaptured = false;
+        this.sourceTextReady = false;
+
         this.sendWebSocketMessage('set_source_image', {
             image: base64Image,
             session_id: this.getSessionId()
         });
 
-        // Wait until 'this.sourceImageCaptured' is set to true
+        // Tracking can start on source_image_set, the screen info needs the OCR text
         return new Promise((resolve) => {
             const checkSourceImageCaptured = () => {
-                if (this.sourceImageCaptured) {
+                if (this.sourceImageCaptured && this.sourceTextReady) {
                     this.sendWebSocketMessage('send_screen_info', {
                         session_id: this.getSessionId()
                     });
@@ -63,6 +81,13 @@ class WatVision {
 
             let imgBlob = await this.getImageBlob(this.inputImageElement);
 
+            if (this.useBinaryFrames) {
+                const imageBytes = new Uint8Array(await imgBlob.arrayBuffer());
+                this.stepSequence = (this.stepSequence + 1) >>> 0;
+                this.sendBinaryFrame(STEP_MESSAGE_TYPE, this.stepSequence, imageBytes);
+                return true;
+            }
+
             const base64Image = await this.blobToBase64(imgBlob);
 
             this.sendWebSocketMessage('step', {
@@ -87,8 +112,13 @@ class WatVision {
         let textUnderFinger = data.data.text_under_finger;
         let distanceToTrackedElement = data.data.distance_to_tracked_element;
 
-        this.debugInputImageElement.src = `data:image/png;base64,${inputImageData}`;
-        this.debugReferenceImageElement.src = `data:image/png;base64,${sourceImageData}`;
+        if (data.binaryImages) {
+            this.setDebugImageFromBytes('input', this.debugInputImageElement, data.binaryImages.input);
+            this.setDebugImageFromBytes('source', this.debugReferenceImageElement, data.binaryImages.source);
+        } else if (inputImageData && sourceImageData) {
+            this.debugInputImageElement.src = `data:image/png;base64,${inputImageData}`;
+            this.debugReferenceImageElement.src = `data:image/png;base64,${sourceImageData}`;
+        }
 
         // Play proximity chirp if we have distance data and are tracking an element
         if (!textUnderFinger && distanceToTrackedElement !== undefined && this.trackedElementIndex !== null) {
@@ -105,6 +135,54 @@ class WatVision {
         }
     }
 
+    setDebugImageFromBytes(key, imageElement, imageBytes) {
+        if (!imageBytes || imageBytes.length === 0) {
+            return;
+        }
+
+        if (this.debugImageUrls[key]) {
+            URL.revokeObjectURL(this.debugImageUrls[key]);
+        }
+
+        this.debugImageUrls[key] = URL.createObjectURL(new Blob([imageBytes], { type: 'image/jpeg' }));
+        imageElement.src = this.debugImageUrls[key];
+    }
+
+    // Parse a binary frame: type (uint8), sequence (uint32), payload length (uint32), payload
+    handleBinaryMessage(buffer) {
+        const view = new DataView(buffer);
+        const messageType = view.getUint8(0);
+        const sequence = view.getUint32(1);
+        const payloadLength = view.getUint32(5);
+
+        if (buffer.byteLength !== BINARY_HEADER_SIZE + payloadLength) {
+            console.error('Binary frame length mismatch');
+            return;
+        }
+
+        if (messageType !== STEP_RESPONSE_MESSAGE_TYPE) {
+            console.log('Unhandled binary message type:', messageType);
+            return;
+        }
+
+        // Step response payload: length-prefixed JSON data, input image and source image
+        const parts = [];
+        let offset = BINARY_HEADER_SIZE;
+        while (offset < buffer.byteLength) {
+            const partLength = view.getUint32(offset);
+            offset += 4;
+            parts.push(new Uint8Array(buffer, offset, partLength));
+            offset += partLength;
+        }
+
+        this.handleStepResponse({
+            type: 'step_response',
+            seq: sequence,
+            data: JSON.parse(new TextDecoder().decode(parts[0])),
+            binaryImages: { input: parts[1], source: parts[2] }
+        });
+    }
+
     handleScreenInfoResponse(data) {
         console.log("Handling screen info response:", data);
         
@@ -180,6 +258,7 @@ class WatVision {
     reset() {
         this.sessionId = null;
         this.sourceImageCaptured = false;
+        this.sourceTextReady = false;
         this.audioTranscriptText = "";
         this.lastReadText = null;
         this.waitingForStepReply = false;
@@ -199,12 +278,18 @@ class WatVision {
         const wsUrl = this.getWebSocketUrl();
         console.log("Connecting to WatVision WebSocket server at:", wsUrl);
         this.socket = new WebSocket(wsUrl);
+        this.socket.binaryType = 'arraybuffer';
 
         this.socket.onopen = () => {
             console.log("Connected to WatVision WebSocket server");
         }
 
         this.socket.onmessage = (event) => {
+            if (event.data instanceof ArrayBuffer) {
+                this.handleBinaryMessage(event.data);
+                return;
+            }
+
             const data = JSON.parse(event.data);
             this.handleWebSocketMessage(data);
         };
@@ -275,6 +360,12 @@ class WatVision {
                 this.sourceImageCaptured = true;
                 this.onDisplayedValueUpdates?.(this);
                 break;
+
+            case 'text_info_ready':
+                console.log(`Source image text ${data.data.status}, ${data.data.line_count} lines`);
+                this.sourceTextReady = true;
+                this.onDisplayedValueUpdates?.(this);
+                break;
             
             case 'request_capture_source_image':
                 this.captureSourceImage();
@@ -310,7 +401,9 @@ class WatVision {
 
     async startSession() {
         // Start recognition session
-        this.sendWebSocketMessage('start_session');
+        this.sendWebSocketMessage('start_session', {
+            render_mode: this.renderMode
+        });
     }
 
     async stopSession() {
@@ -387,6 +480,21 @@ class WatVision {
         }
     }
 
+    // Send a binary frame: type (uint8), sequence (uint32), payload length (uint32), payload
+    sendBinaryFrame(messageType, sequence, payload) {
+        if (this.socket && this.socket.readyState === WebSocket.OPEN) {
+            const frame = new Uint8Array(BINARY_HEADER_SIZE + payload.length);
+            const view = new DataView(frame.buffer);
+            view.setUint8(0, messageType);
+            view.setUint32(1, sequence);
+            view.setUint32(5, payload.length);
+            frame.set(payload, BINARY_HEADER_SIZE);
+            this.socket.send(frame);
+        } else {
+            console.error('WebSocket not connected');
+        }
+    }
+
     getWebSocketUrl() {
         const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
         const host = process.env.NODE_ENV === 'development' ? window.location.hostname : (process.env.REACT_APP_WEBSOCKET_HOST || "notset");